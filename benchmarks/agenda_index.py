@@ -0,0 +1,80 @@
+"""Micro-benchmark: agenda range queries with AgendaIndex vs. list scans.
+
+Compares the list comprehension + sort the agenda views used to run with
+binary-search lookups on the sorted per-user index.
+
+Run from the repository root:
+    python benchmarks/agenda_index.py [events]
+"""
+import datetime
+import os
+import random
+import sys
+import timeit
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.agenda_index import AgendaIndex
+from utils.records import Event
+
+OWNER = 1
+
+def make_events(n, users=3, days=730):
+    rnd = random.Random(42)
+    base = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days // 2)
+    return [Event(
+        str(uuid.UUID(int=rnd.getrandbits(128))),
+        rnd.randint(1, users),
+        base + timedelta(minutes=rnd.randrange(days * 24 * 60)),
+        f"event {i}",
+    ) for i in range(n)]
+
+def scan(events, start, end):
+    matches = [e for e in events if e.user_id == OWNER and start <= e.datetime_evento < end]
+    matches.sort(key=lambda x: x.datetime_evento)
+    return matches
+
+def scan_all(events):
+    matches = [e for e in events if e.user_id == OWNER]
+    matches.sort(key=lambda x: x.datetime_evento)
+    return matches
+
+def best_ms(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1000
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    events = make_events(n)
+    build_ms = best_ms(lambda: AgendaIndex(events), 1)
+    index = AgendaIndex(events)
+
+    today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    month_start = today.replace(day=1)
+    ranges = {
+        'today': (today, today + timedelta(days=1)),
+        'week': (today, today + timedelta(days=7)),
+        'month': (month_start, (month_start + timedelta(days=32)).replace(day=1)),
+    }
+
+    print(f"{n} events, index build {build_ms:.1f} ms")
+    print(f"{'query':<8}{'rows':>8}{'scan ms':>12}{'index ms':>12}{'speedup':>10}")
+    for name, (start, end) in ranges.items():
+        assert sorted(e.id for e in scan(events, start, end)) == sorted(e.id for e in index.between(OWNER, start, end))
+        rows = len(index.between(OWNER, start, end))
+        scan_ms = best_ms(lambda: scan(events, start, end), 5)
+        index_ms = best_ms(lambda: index.between(OWNER, start, end), 1000)
+        print(f"{name:<8}{rows:>8}{scan_ms:>12.3f}{index_ms:>12.4f}{scan_ms / index_ms:>9.0f}x")
+    scan_ms = best_ms(lambda: scan_all(events), 5)
+    index_ms = best_ms(lambda: index.for_user(OWNER), 20)
+    print(f"{'all':<8}{len(index.for_user(OWNER)):>8}{scan_ms:>12.3f}{index_ms:>12.4f}{scan_ms / index_ms:>9.0f}x")
+
+    extra = make_events(1000, days=60)
+    for e in extra:
+        e.id = str(uuid.uuid4())
+    add_ms = best_ms(lambda: [index.add(e) for e in extra] and [index.remove(e.id) for e in extra], 1) / len(extra)
+    print(f"add + remove: {add_ms * 1000:.1f} us per event")
+
+if __name__ == "__main__":
+    main()
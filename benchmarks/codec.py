@@ -0,0 +1,90 @@
+"""Benchmark: agenda.json load/save throughput with utils.codec.
+
+Compares the previous loader/saver (json + fromisoformat on every event
+at load, a copy of every event at save) with the codec: orjson when it
+is installed, the stdlib fallback otherwise. The codec keeps timestamps
+as strings; "load + decode" parses all of them, as Event does lazily.
+
+Run from the repository root:
+    python benchmarks/codec.py [events ...]
+"""
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import codec
+
+def make_events(n):
+    base = datetime.datetime(2025, 1, 1)
+    return [{
+        'id': str(uuid.UUID(int=i)),
+        'user_id': 100000000000000000 + i % 3,
+        'datetime_evento': base + timedelta(minutes=7 * i),
+        'evento': f"event {i}",
+    } for i in range(n)]
+
+def old_save(path, events):
+    events_to_save = []
+    for event in events:
+        copy_event = event.copy()
+        copy_event['datetime_evento'] = copy_event['datetime_evento'].isoformat()
+        events_to_save.append(copy_event)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(events_to_save, f, indent=2, ensure_ascii=False)
+
+def old_load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        events = json.load(f)
+    for event in events:
+        event['datetime_evento'] = datetime.datetime.fromisoformat(event['datetime_evento'])
+    return events
+
+def decode(events):
+    for event in events:
+        if isinstance(event['datetime_evento'], str):
+            event['datetime_evento'] = datetime.datetime.fromisoformat(event['datetime_evento'])
+    return events
+
+def best_s(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    fast = codec.orjson
+    print(f"fast codec: {'orjson ' + fast.__version__ if fast else 'not installed'}")
+    print(f"{'events':>9}  {'step':<22}{'old':>10}{'stdlib':>10}{'orjson':>10}   (k events/s)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "agenda.json")
+        for n in sizes:
+            events = make_events(n)
+            repeat = 3 if n <= 100_000 else 1
+            rows = {'save': [], 'load (lazy)': [], 'load + decode': []}
+            rows['save'].append(best_s(lambda: old_save(path, events), repeat))
+            rows['load (lazy)'].append(best_s(lambda: old_load(path), repeat))
+            rows['load + decode'].append(rows['load (lazy)'][0])
+            for lib in (None, fast) if fast else (None,):
+                codec.orjson = lib
+                rows['save'].append(best_s(lambda: codec.write_file(path, events), repeat))
+                rows['load (lazy)'].append(best_s(lambda: codec.read_file(path), repeat))
+                rows['load + decode'].append(best_s(lambda: decode(codec.read_file(path)), repeat))
+            codec.orjson = fast
+            assert old_load(path) == decode(codec.read_file(path))
+            for step, times in rows.items():
+                rates = "".join(f"{n / t / 1000:>10.0f}" for t in times)
+                print(f"{n:>9}  {step:<22}{rates}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark: memory per record, plain dicts vs. Event/Todo slotted records.
+
+Builds the same events and tasks both ways and measures them with
+tracemalloc (strings and datetimes included, as they live in the cache).
+
+Run from the repository root:
+    python benchmarks/records.py [records]
+"""
+import datetime
+import gc
+import os
+import sys
+import tracemalloc
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.records import Event, Todo
+
+BASE = datetime.datetime(2025, 1, 1)
+
+def event_dicts(n):
+    return [{
+        'id': str(uuid.UUID(int=i)),
+        'user_id': 100000000000000000 + i % 3,
+        'datetime_evento': BASE + timedelta(minutes=7 * i),
+        'evento': f"event {i}",
+    } for i in range(n)]
+
+def event_records(n):
+    return [Event(
+        str(uuid.UUID(int=i)),
+        100000000000000000 + i % 3,
+        BASE + timedelta(minutes=7 * i),
+        f"event {i}",
+    ) for i in range(n)]
+
+def todo_dicts(n):
+    return [{
+        'id': str(uuid.UUID(int=i)),
+        'user_id': 100000000000000000 + i % 3,
+        'text': f"task number {i}",
+        'created': (BASE + timedelta(minutes=i)).isoformat(),
+        'done': i % 3 == 0,
+        'priority': 'high' if i % 5 == 0 else None,
+    } for i in range(n)]
+
+def todo_records(n):
+    return [Todo(
+        str(uuid.UUID(int=i)),
+        100000000000000000 + i % 3,
+        f"task number {i}",
+        (BASE + timedelta(minutes=i)).isoformat(),
+        i % 3 == 0,
+        priority='high' if i % 5 == 0 else None,
+    ) for i in range(n)]
+
+def measure(build, n):
+    gc.collect()
+    tracemalloc.start()
+    data = build(n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size / n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{n} records, bytes per record")
+    print(f"{'kind':<8}{'dict':>10}{'record':>10}{'saved':>9}")
+    for kind, as_dict, as_record in (('event', event_dicts, event_records), ('todo', todo_dicts, todo_records)):
+        before = measure(as_dict, n)
+        after = measure(as_record, n)
+        print(f"{kind:<8}{before:>10.0f}{after:>10.0f}{1 - after / before:>9.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Micro-benchmark: /search-todo with TodoSearchIndex vs. substring scans.
+
+Run from the repository root:
+    python benchmarks/todo_search.py [tasks]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.records import Todo
+from utils.todo_search import TodoSearchIndex
+
+OWNER = 1
+LIMIT = 25   # what /search-todo shows
+COMMON = ("buy call email fix review write plan book pay send clean update prepare check order "
+          "report invoice meeting dentist groceries car insurance taxes garden project budget slides").split()
+
+def make_items(n):
+    rnd = random.Random(7)
+    # A few very common words plus a long tail, like real task lists
+    rare = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(4, 9))) for _ in range(20_000)]
+    return [Todo(
+        id=f"{i:08x}-task",
+        user_id=OWNER,
+        created=f"2025-01-01T00:00:{i:08d}",
+        text=" ".join([rnd.choice(COMMON)] + rnd.sample(rare, rnd.randint(2, 6))) + f" #{i}",
+        done=rnd.random() < 0.3,
+        priority=rnd.choice(('low', 'normal', 'normal', 'high', 'urgent')),
+        tags=rnd.sample(('work', 'home', 'errand', 'money'), rnd.randint(0, 2)),
+    ) for i in range(n)]
+
+def best_ms(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1000
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    items = make_items(n)
+    index = TodoSearchIndex()
+    build_ms = best_ms(lambda: TodoSearchIndex().sync(items), 1)
+    index.sync(items)
+    print(f"{n} tasks, index build {build_ms:.0f} ms")
+    print(f"{'query':<32}{'hits':>8}{'scan ms':>10}{'index ms':>10}")
+    for query in ("invoice", "dentist car", "inv", "taxes tag:money", "prio:urgent tag:work", "meeting slides prio:high"):
+        hits = index.search(OWNER, query, LIMIT)[1]
+        scan_ms = best_ms(lambda: [i for i in items if i.user_id == OWNER and query.lower() in i.text.lower()], 3)
+        index_ms = best_ms(lambda: index.search(OWNER, query, LIMIT), 10)
+        print(f"{query:<32}{hits:>8}{scan_ms:>10.2f}{index_ms:>10.2f}")
+
+    changed = [i.copy() for i in items]
+    changed[n // 2].text = "renamed task"
+    del changed[-1]
+    sync_ms = best_ms(lambda: index.sync(changed) or index.sync(items), 1) / 2
+    print(f"full sync after one edit + one delete: {sync_ms:.1f} ms")
+    edit = {changed[n // 2].id: changed[n // 2], items[-1].id: None}
+    undo = {items[n // 2].id: items[n // 2], items[-1].id: items[-1]}
+    apply_ms = best_ms(lambda: index.apply(edit) or index.apply(undo), 10) / 2
+    print(f"apply one edit + one delete (what a save does): {apply_ms:.3f} ms")
+
+if __name__ == "__main__":
+    main()
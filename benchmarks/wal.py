@@ -0,0 +1,72 @@
+"""Benchmark: write latency of the JSON stores under each FSYNC_MODE.
+
+For every mode it times, per write:
+  journal   one edited task appended to todo.json.journal (TODO_JOURNAL=1)
+  snapshot  todo.json rewritten through a temp file and os.replace
+
+Run from the repository root, ideally with the data folder on the disk
+the bot will use (results on tmpfs say nothing about fsync):
+    python benchmarks/wal.py [tasks] [writes] [directory]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import config, codec, wal, schema
+from utils.journal import Journal
+from utils.records import Todo
+
+def make_items(n):
+    return [Todo(f"{i:08x}-task", 1, f"task number {i}", "2025-01-01T00:00:00") for i in range(n)]
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+def time_writes(write, count):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        write(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def run_journal(directory, items, count):
+    path = os.path.join(directory, "todo.json")
+    journal = Journal(path, lambda snapshot: wal.write_atomic(path, codec.dumps(schema.wrap([t.to_dict() for t in snapshot]))),
+                      Todo, max_bytes=1 << 40)
+    journal.save(items)
+    current = journal.load()
+
+    def write(i):
+        current[i % len(current)].text = f"edited {i}"
+        journal.save(current)
+
+    samples = time_writes(write, count)
+    journal.sync()
+    return samples
+
+def run_snapshot(directory, items, count):
+    path = os.path.join(directory, "todo.json")
+    return time_writes(lambda i: wal.write_atomic(path, codec.dumps(schema.wrap([t.to_dict() for t in items]))), count)
+
+def main():
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    base = sys.argv[3] if len(sys.argv) > 3 else config.DATA_DIR
+    items = make_items(tasks)
+    print(f"{tasks} tasks, {count} writes per case, in {base} (batch window {config.FSYNC_BATCH_MS} ms)")
+    print(f"{'mode':<9}{'write':<10}{'p50 ms':>9}{'p99 ms':>9}{'writes/s':>10}")
+    for mode in wal.FSYNC_MODES:
+        config.FSYNC_MODE = mode
+        for name, run in (('journal', run_journal), ('snapshot', run_snapshot)):
+            with tempfile.TemporaryDirectory(dir=base) as directory:
+                samples = run(directory, items, count)
+            rate = len(samples) / sum(samples)
+            print(f"{mode:<9}{name:<10}{percentile(samples, 0.5) * 1000:>9.3f}{percentile(samples, 0.99) * 1000:>9.3f}{rate:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import discord
 from discord.ext import commands
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.triggers.cron import CronTrigger
 import os
 import logging
-from utils import config
+from utils import config, async_storage, schema
+from utils.resolver import Resolver
+from utils.outbound import Outbox, URGENT
+from utils.jobstore import SQLiteJobStore
+from utils import jobs
 
 # Setup logging
 logger = logging.getLogger("discordbot")
@@ -20,10 +25,35 @@ intents.reactions = True
 
 class MyBot(commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents)
-        self.scheduler = AsyncIOScheduler()
+        # Rate limits longer than 30 s are raised instead of waited out, so
+        # that the outbound queue can retry them without blocking
+        super().__init__(command_prefix="!", intents=intents, max_ratelimit_timeout=30.0)
+        # One-off jobs (/remindme, Pomodoro, event reminders) are kept in
+        # JOBS_FILE and survive restarts. A job that should have run while
+        # the bot was offline runs once at startup (coalesce, no grace
+        # limit) unless it sets its own misfire_grace_time. The cron jobs
+        # are re-added at every start and live in memory.
+        self.jobstore = SQLiteJobStore(config.JOBS_FILE)
+        self.scheduler = AsyncIOScheduler(
+            jobstores={'default': self.jobstore, 'memory': MemoryJobStore()},
+            job_defaults={'coalesce': True, 'misfire_grace_time': None}
+        )
+        jobs.bind(self)
+        self.resolver = Resolver(self)
+        self.outbox = Outbox()
+        async_storage.alert = self.storage_alert
 
     async def setup_hook(self):
+        # Finish or roll back writes interrupted by a crash and upgrade old
+        # data files before anything reads the data
+        try:
+            await async_storage.recover()
+        except schema.SchemaError as e:
+            logger.error(f"Refusing to start: {e}")
+            raise
+        except Exception as e:
+            logger.exception(f"Error recovering data files: {e}")
+
         # Load extensions
         initial_extensions = [
             'cogs.agenda',
@@ -40,23 +70,26 @@ class MyBot(commands.Bot):
             except Exception as e:
                 logger.exception(f"Failed to load extension {ext}: {e}")
 
+        # Start scheduler (stored jobs wait for the bot to be ready)
+        self.scheduler.start()
+        logger.info('Scheduler activated.')
+
     async def on_ready(self):
         logger.info(f'Bot connected as {self.user}')
         
-        # Start scheduler
-        # We need to access the methods from the cogs.
-        # Since we can't easily pass instance methods to scheduler before cogs are loaded,
-        # we can retrieve the cog instance and add jobs here, or let cogs add their own jobs in cog_load/on_ready.
+        # Daily jobs
+        # We need to access the methods from the cogs, which cannot be
+        # stored, so they go to the in-memory job store (with fixed IDs, as
+        # on_ready runs again after a reconnect).
         # The Agenda cog adds its own startup tasks.
         # We need to add the daily reminder and cleanup tasks.
         
         agenda_cog = self.get_cog('Agenda')
         if agenda_cog:
-            self.scheduler.add_job(agenda_cog.daily_reminder, CronTrigger(hour=0, minute=0, second=1))
-            self.scheduler.add_job(agenda_cog.clean_old_events, CronTrigger(hour=2, minute=0))
-        
-        self.scheduler.start()
-        logger.info('Scheduler activated.')
+            self.scheduler.add_job(agenda_cog.daily_reminder, CronTrigger(hour=0, minute=0, second=1),
+                                   id='daily_reminder', jobstore='memory', replace_existing=True, misfire_grace_time=60)
+            self.scheduler.add_job(agenda_cog.clean_old_events, CronTrigger(hour=2, minute=0),
+                                   id='clean_old_events', jobstore='memory', replace_existing=True, misfire_grace_time=60)
 
         # Sync commands
         try:
@@ -81,6 +114,23 @@ class MyBot(commands.Bot):
         if admin_cog:
             await admin_cog.update_command_list()
 
+    async def storage_alert(self, message):
+        """DMs the owner about deferred saves that keep failing."""
+        user = await self.resolver.user(config.OWNER_ID)
+        # Queued, not awaited: the storage writer is waiting on this
+        self.outbox.send(user, URGENT, content=message)
+
+    async def close(self):
+        # Write any coalesced saves before the event loop goes away
+        try:
+            await async_storage.flush()
+        except async_storage.WriteError as e:
+            logger.error(f"Unsaved changes lost on shutdown: {e}")
+        await self.outbox.stop()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        await super().close()
+
     async def on_command_completion(self, ctx):
         if ctx.author.id == config.OWNER_ID:
             try:
@@ -3,7 +3,8 @@ from discord import app_commands
 from discord.ext import commands
 import datetime
 import logging
-from utils import storage, config, security
+from utils import storage, async_storage, config, security, outbound
+from utils.common import format_bytes
 
 logger = logging.getLogger("discordbot")
 
@@ -34,48 +35,55 @@ class Admin(commands.Cog):
             await interaction.followup.send(f"❌ Error syncing: {e}", ephemeral=True)
 
     @app_commands.command(name="backup", description="Create backup of todo or agenda file")
-    async def backup(self, interaction: discord.Interaction, target: str):
+    async def backup(self, interaction: discord.Interaction, target: str, user: discord.User = None):
         if not await security.ensure_owner(interaction): return
         if target not in ("todo", "agenda"):
             await interaction.response.send_message("Use `todo` or `agenda` as target.", ephemeral=True)
             return
         try:
             await interaction.response.defer(ephemeral=True)
-            file_path = config.TODO_FILE if target == 'todo' else config.AGENDA_FILE
-            bak = storage.create_backup_file(file_path)
+            file_path = await async_storage.data_file(target, (user or interaction.user).id)
+            bak = await async_storage.create_backup_file(file_path)
             await interaction.followup.send(f"✅ Backup created: `{storage.os.path.basename(bak)}`", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash backup: {e}")
             await interaction.followup.send("❌ Error creating backup.", ephemeral=True)
 
     @app_commands.command(name="list-backups", description="List available backups for todo or agenda")
-    async def list_backups(self, interaction: discord.Interaction, target: str):
+    async def list_backups(self, interaction: discord.Interaction, target: str, user: discord.User = None):
         if not await security.ensure_owner(interaction): return
         if target not in ("todo", "agenda"):
             await interaction.response.send_message("Use `todo` or `agenda` as target.", ephemeral=True)
             return
         try:
-            file_path = config.TODO_FILE if target == 'todo' else config.AGENDA_FILE
-            items = storage.list_backups(file_path)
+            file_path = await async_storage.data_file(target, (user or interaction.user).id)
+            items = await async_storage.list_backups(file_path, details=True, limit=15)
             if not items:
                 await interaction.response.send_message("No backups found.", ephemeral=True)
                 return
-            text = "\n".join(items[:50])
+            text = "\n".join(
+                f"`{b['name']}` {format_bytes(b['size'])} → {format_bytes(b['stored'])} "
+                f"({b['stored'] / b['size']:.0%}), +{format_bytes(b['added'])}" if b['size'] else f"`{b['name']}` (empty)"
+                for b in items
+            )
             await interaction.response.send_message(f"Available backups:\n{text}", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash list-backups: {e}")
             await interaction.response.send_message("❌ Error retrieving backup list.", ephemeral=True)
 
     @app_commands.command(name="restore-backup", description="Restore a backup (use exact filename) for todo or agenda")
-    async def restore_backup(self, interaction: discord.Interaction, target: str, backup_filename: str):
+    async def restore_backup(self, interaction: discord.Interaction, target: str, backup_filename: str, user: discord.User = None):
         if not await security.ensure_owner(interaction): return
         if target not in ("todo", "agenda"):
             await interaction.response.send_message("Use `todo` or `agenda` as target.", ephemeral=True)
             return
         try:
             await interaction.response.defer(ephemeral=True)
-            file_path = config.TODO_FILE if target == 'todo' else config.AGENDA_FILE
-            storage.restore_backup(file_path, backup_filename)
+            file_path = await async_storage.data_file(target, (user or interaction.user).id)
+            await async_storage.restore_backup(file_path, backup_filename)
+            agenda_cog = self.bot.get_cog('Agenda')
+            if target == 'agenda' and agenda_cog:
+                await agenda_cog.schedule_event_reminders((user or interaction.user).id)
             await interaction.followup.send(f"✅ Restored backup `{backup_filename}` for {target}.", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash restore-backup: {e}")
@@ -88,15 +96,11 @@ class Admin(commands.Cog):
             await interaction.response.send_message("Invalid target. Use: todo or agenda.", ephemeral=True)
             return
         try:
+            for file_path in await async_storage.data_files(target):
+                await async_storage.clear_data_file(file_path)
             if target == 'todo':
-                if storage.os.path.exists(config.TODO_FILE):
-                    storage.create_backup_file(config.TODO_FILE)
-                    storage.os.remove(config.TODO_FILE)
                 await interaction.response.send_message("✅ All To-Dos removed (backup created).", ephemeral=True)
             else:
-                if storage.os.path.exists(config.AGENDA_FILE):
-                    storage.create_backup_file(config.AGENDA_FILE)
-                    storage.os.remove(config.AGENDA_FILE)
                 await interaction.response.send_message("✅ All agenda events removed (backup created).", ephemeral=True)
                 # Update command list if needed
                 try:
@@ -112,19 +116,53 @@ class Admin(commands.Cog):
     async def stats(self, interaction: discord.Interaction):
         if not await security.ensure_owner(interaction): return
         try:
-            todos = storage.load_todo()
-            events = storage.load_events()
+            todos = await async_storage.load_todo()
             total = len(todos)
-            done = len([t for t in todos if t.get('done')])
+            done = len([t for t in todos if t.done])
             pending = total - done
-            upcoming_events = len([e for e in events if e['datetime_evento'] >= datetime.datetime.now()])
+            upcoming_events = await async_storage.count_events(datetime.datetime.now())
             
             embed = discord.Embed(title="📊 Bot Stats", color=discord.Color.blurple(), timestamp=datetime.datetime.now())
             embed.add_field(name="To-Do: total", value=str(total), inline=True)
             embed.add_field(name="To-Do: completed", value=str(done), inline=True)
             embed.add_field(name="To-Do: pending", value=str(pending), inline=True)
             embed.add_field(name="Upcoming events", value=str(upcoming_events), inline=True)
+            cache = storage.cache_stats()
+            embed.add_field(name="Storage cache", value=f"{cache['hits']} hits / {cache['misses']} misses", inline=True)
+            lookups = self.bot.resolver.stats()
+            embed.add_field(
+                name="User/channel lookups",
+                value=(f"{lookups['gateway_hits']} gateway / {lookups['cache_hits']} cached / {lookups['misses']} REST "
+                       f"({lookups['merged']} merged, {lookups['errors']} failed)\n"
+                       f"REST avg {lookups['fetch_avg_ms']:.0f} ms, max {lookups['fetch_max_ms']:.0f} ms"),
+                inline=False
+            )
+            outbox = self.bot.outbox.stats()
+            depth = outbox['depth']
+            embed.add_field(
+                name="Outbound queue",
+                value=(f"{depth['urgent']} urgent / {depth['normal']} normal / {depth['low']} low queued, "
+                       f"{outbox['sent']} sent ({outbox['retried']} retries)\n"
+                       f"Wait avg {outbox['wait_avg_ms']:.0f} ms, max {outbox['wait_max_ms']:.0f} ms\n"
+                       f"Dropped: {outbox['dropped_full']} queue full / {outbox['dropped_expired']} expired / "
+                       f"{outbox['dropped_failed']} failed"),
+                inline=False
+            )
+            agenda_cog = self.bot.get_cog('Agenda')
+            if agenda_cog:
+                dispatch = agenda_cog.dispatch_stats()
+                embed.add_field(
+                    name="Event reminders",
+                    value=(f"{dispatch['reminders']} in {dispatch['batches']} batches, "
+                           f"{dispatch['api_calls']} API calls ({dispatch['calls_per_batch']:.1f} per batch)"),
+                    inline=False
+                )
             await interaction.response.send_message(embed=embed, ephemeral=True)
+        except async_storage.WriteError:
+            failure = async_storage.write_failure()
+            await interaction.response.send_message(
+                f"⚠️ Saving {failure['kind']} has been failing since {failure['since'].strftime('%H:%M:%S')} "
+                f"({failure['attempts']} attempts); data commands are paused until it succeeds.", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash stats: {e}")
             await interaction.response.send_message("❌ Error calculating stats.", ephemeral=True)
@@ -148,7 +186,8 @@ class Admin(commands.Cog):
                 "`/tomorrow` - Show tomorrow's events\n"
                 "`/week` - Show next 7 days events\n"
                 "`/month` - Show current month events\n"
-                "`/all` - Show ALL agenda events"
+                "`/all` - Show ALL agenda events\n"
+                "`/history` - Show past events of a month (YYYY-MM)"
             ),
             inline=False
         )
@@ -222,7 +261,7 @@ class Admin(commands.Cog):
         try:
             if not config.COMMANDS_CHANNEL_ID:
                 return
-            channel = await self.bot.fetch_channel(config.COMMANDS_CHANNEL_ID)
+            channel = await self.bot.resolver.channel(config.COMMANDS_CHANNEL_ID)
             embed = self.create_commands_embed()
             
             # Simple in-memory cache for this session
@@ -231,9 +270,11 @@ class Admin(commands.Cog):
             if message_id and not force_update:
                 try:
                     message = await channel.fetch_message(message_id)
-                    await message.edit(embed=embed)
-                    logger.info("Command list updated in existing message.")
-                    return
+                    # The outbox resolves to None when the edit failed
+                    if await self.bot.outbox.call(outbound.route_of(channel), lambda: message.edit(embed=embed), outbound.LOW) is not None:
+                        logger.info("Command list updated in existing message.")
+                        return
+                    logger.info("Could not edit previous message, searching history...")
                 except discord.NotFound:
                     logger.info("Previous message not found, searching history...")
                 except Exception as e:
@@ -242,12 +283,15 @@ class Admin(commands.Cog):
             async for msg in channel.history(limit=50):
                 if msg.author == self.bot.user and msg.embeds:
                     if "Personal Bot Commands" in (msg.embeds[0].title or ""):
-                        await msg.edit(embed=embed)
+                        if await self.bot.outbox.call(outbound.route_of(channel), lambda: msg.edit(embed=embed), outbound.LOW) is None:
+                            break
                         self._message_id_cache = msg.id
                         logger.info("Found existing message and updated.")
                         return
 
-            message = await channel.send(embed=embed)
+            message = await self.bot.outbox.send(channel, outbound.LOW, embed=embed)
+            if message is None:
+                return
             self._message_id_cache = message.id
             logger.info("New command list sent.")
 
@@ -5,36 +5,91 @@ import datetime
 from datetime import timedelta
 import asyncio
 import logging
-from utils import storage, config
+from apscheduler.jobstores.base import JobLookupError
+from utils import async_storage, config, export, reminders, jobs, recurrence, archive, outbound
+from utils.pages import Listings, PageView, EMBED_FIELD_MAX, EMBED_TOTAL_MAX, clip
+from utils.records import Event
+from utils.reminders import ReminderEngine
+from utils.message_index import MessageIndex
 
 logger = logging.getLogger("discordbot")
 
+EVENTS_PER_PAGE = 15
+# A message holds at most 25 embed fields and 25 buttons
+REMINDERS_PER_MESSAGE = 25
+REMINDER_FOOTER = "Press ✅ on an event to stop its notifications."
+ACK_PREFIX = "reminder-ack:"
+
+
+class ReminderAck(discord.ui.DynamicItem[discord.ui.Button], template=ACK_PREFIX + r'(?P<event_id>.+)'):
+    """The ✅ button of one event in a reminder message. Its custom ID
+    carries the event ID, so it keeps working after a restart."""
+
+    def __init__(self, event_id, label="✅"):
+        super().__init__(discord.ui.Button(label=label, style=discord.ButtonStyle.success,
+                                           custom_id=ACK_PREFIX + event_id))
+        self.event_id = event_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match['event_id'], item.label)
+
+    async def callback(self, interaction: discord.Interaction):
+        cog = interaction.client.get_cog('Agenda')
+        if cog is not None:
+            await cog.acknowledge_reminder(interaction, self.event_id)
+
+
 class Agenda(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.active_reminders = {}      # event_id -> task
-        self.ack_events = {}            # event_id -> asyncio.Event
-        self.message_to_event = {}      # message_id -> event_id
+        self.reminders = ReminderEngine(self.send_event_reminders, self._reminders_finished)
+        self.reminder_messages = MessageIndex(config.REMINDER_MESSAGES_MAX)
+        self.listings = Listings()
+        self._dispatch_stats = {'batches': 0, 'reminders': 0, 'api_calls': 0}
 
     async def cog_load(self):
+        self.bot.add_dynamic_items(ReminderAck)
         self.bot.loop.create_task(self.schedule_event_reminders_on_startup())
 
+    async def cog_unload(self):
+        self.bot.remove_dynamic_items(ReminderAck)
+        self.reminders.stop()
+
     # --- COMMANDS ---
 
     @app_commands.command(name="agenda-add", description="Add event to agenda (DD-MM-YYYY HH:MM)")
-    async def agenda_add(self, interaction: discord.Interaction, date: str, time_str: str, event: str):
+    @app_commands.describe(
+        remind_before=f"Minutes before the event reminders start (default {config.REMINDER_START_MINUTES})",
+        nag_every=f"Minutes between reminders (default {config.REMINDER_INTERVAL_MINUTES})",
+        repeat="daily/weekly/monthly or an RRULE, e.g. FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=2025-12-31"
+    )
+    async def agenda_add(self, interaction: discord.Interaction, date: str, time_str: str, event: str,
+                         remind_before: app_commands.Range[int, 1] = None, nag_every: app_commands.Range[int, 1] = None,
+                         repeat: str = None):
         if not await self._ensure_owner(interaction): return
         try:
             datetime_obj = datetime.datetime.strptime(f"{date} {time_str}", "%d-%m-%Y %H:%M")
             if datetime_obj < datetime.datetime.now():
                 await interaction.response.send_message("❌ Cannot add event in the past.", ephemeral=True)
                 return
-            events = storage.load_events()
             import uuid
-            new_event = {"id": str(uuid.uuid4()), "user_id": interaction.user.id, "datetime_evento": datetime_obj, "evento": event}
-            events.append(new_event)
-            if storage.save_events(events):
-                await interaction.response.send_message(f"✅ Event saved: `{event}` on {date} at {time_str}", ephemeral=True)
+            extra = {}
+            if remind_before is not None:
+                extra[reminders.REMIND_BEFORE_KEY] = remind_before
+            if nag_every is not None:
+                extra[reminders.NAG_EVERY_KEY] = nag_every
+            if repeat:
+                try:
+                    recurrence.check_start(recurrence.parse_rule(repeat.upper()), datetime_obj)
+                except ValueError as e:
+                    await interaction.response.send_message(f"❌ Invalid repeat rule: {e}", ephemeral=True)
+                    return
+                extra[recurrence.RULE_KEY] = repeat.upper()
+            new_event = Event(str(uuid.uuid4()), interaction.user.id, datetime_obj, event, extra or None)
+            if await async_storage.add_event(new_event):
+                repeats = f", repeating {recurrence.describe(new_event)}" if repeat else ""
+                await interaction.response.send_message(f"✅ Event saved: `{event}` on {date} at {time_str}{repeats}", ephemeral=True)
                 # Schedule reminder if needed
                 self.schedule_new_event_reminder(new_event)
             else:
@@ -44,23 +99,27 @@ class Agenda(commands.Cog):
             await interaction.response.send_message("❌ Format error or unexpected error.", ephemeral=True)
 
     @app_commands.command(name="agenda-delete", description="Remove event from agenda by ID")
+    @app_commands.describe(event_id="Event ID; for a repeating event, series ID (all) or series@YYYYMMDDTHHMM (one date)")
     async def agenda_delete(self, interaction: discord.Interaction, event_id: str):
         if not await self._ensure_owner(interaction): return
         try:
-            events = storage.load_events()
-            new_events = [e for e in events if e['id'] != event_id]
-            if len(new_events) == len(events):
+            if not await async_storage.delete_event(event_id, interaction.user.id):
                 await interaction.response.send_message("❌ Event not found.", ephemeral=True)
                 return
-            if storage.save_events(new_events):
-                await interaction.response.send_message(f"🗑️ Event {event_id} removed.", ephemeral=True)
-                # Cancel reminder if active
-                if event_id in self.active_reminders:
-                    self.active_reminders[event_id].cancel()
-                    self.active_reminders.pop(event_id, None)
-                    self.ack_events.pop(event_id, None)
-            else:
-                await interaction.response.send_message("❌ Error during removal.", ephemeral=True)
+            await interaction.response.send_message(f"🗑️ Event {event_id} removed.", ephemeral=True)
+            # Cancel reminder if active (for a series, of any of its occurrences)
+            for active_id in self.reminders.event_ids():
+                if active_id == event_id or recurrence.split_id(active_id)[0] == event_id:
+                    self.reminders.cancel(active_id)
+            self._remove_job(f"event_start_{event_id}")
+            self._remove_job(f"event_active_{event_id}")
+            # The removed job may have been the one to schedule the
+            # occurrence after it; schedule that one here instead
+            series_id, when = recurrence.split_id(event_id)
+            if when is not None:
+                series = await async_storage.get_event(series_id, interaction.user.id)
+                if series is not None:
+                    self._schedule_occurrences(series, when + timedelta(minutes=1))
         except Exception as e:
             logger.exception(f"Error slash agenda delete: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -69,8 +128,8 @@ class Agenda(commands.Cog):
     async def today(self, interaction: discord.Interaction):
         if not await self._ensure_owner(interaction): return
         try:
-            events = [e for e in storage.load_events() if e['datetime_evento'].date() == datetime.datetime.now().date() and e['user_id'] == config.OWNER_ID]
-            await interaction.response.send_message(embed=self.create_events_embed(events, "🗓️ Today's Schedule"), ephemeral=True)
+            view = await async_storage.day_view(config.OWNER_ID, datetime.datetime.now().date())
+            await interaction.response.send_message(embed=self.create_day_embed(view, "🗓️ Today's Schedule"), ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash today: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -80,8 +139,8 @@ class Agenda(commands.Cog):
         if not await self._ensure_owner(interaction): return
         try:
             tomorrow_date = (datetime.datetime.now() + timedelta(days=1)).date()
-            events = [e for e in storage.load_events() if e['datetime_evento'].date() == tomorrow_date and e['user_id'] == config.OWNER_ID]
-            await interaction.response.send_message(embed=self.create_events_embed(events, "📅 Tomorrow's Schedule", discord.Color.green()), ephemeral=True)
+            view = await async_storage.day_view(config.OWNER_ID, tomorrow_date)
+            await interaction.response.send_message(embed=self.create_day_embed(view, "📅 Tomorrow's Schedule", discord.Color.green()), ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash tomorrow: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -90,10 +149,8 @@ class Agenda(commands.Cog):
     async def week(self, interaction: discord.Interaction):
         if not await self._ensure_owner(interaction): return
         try:
-            today_date = datetime.datetime.now().date()
-            end_week = (datetime.datetime.now() + timedelta(days=7)).date()
-            events = [e for e in storage.load_events() if today_date <= e['datetime_evento'].date() < end_week and e['user_id'] == config.OWNER_ID]
-            events.sort(key=lambda x: x['datetime_evento'])
+            start, _ = self._day_bounds(datetime.datetime.now().date())
+            events = await async_storage.events_between(config.OWNER_ID, start, start + timedelta(days=7))
             await interaction.response.send_message(embed=self.create_events_embed(events, "📆 Next 7 Days Schedule", discord.Color.orange()), ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash week: {e}")
@@ -103,10 +160,12 @@ class Agenda(commands.Cog):
     async def month(self, interaction: discord.Interaction):
         if not await self._ensure_owner(interaction): return
         try:
-            now = datetime.datetime.now()
-            events = [e for e in storage.load_events() if e['datetime_evento'].year == now.year and e['datetime_evento'].month == now.month and e['user_id'] == config.OWNER_ID]
-            events.sort(key=lambda x: x['datetime_evento'])
-            await interaction.response.send_message(embed=self.create_events_embed(events, "🗓️ Current Month Schedule", discord.Color.purple()), ephemeral=True)
+            start, end = self._month_bounds(datetime.datetime.now())
+            await self._send_listing(
+                interaction, ('month', start),
+                lambda: async_storage.events_between(config.OWNER_ID, start, end),
+                lambda events, first, total: self.create_events_embed(events, "🗓️ Current Month Schedule", discord.Color.purple())
+            )
         except Exception as e:
             logger.exception(f"Error slash month: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -115,13 +174,49 @@ class Agenda(commands.Cog):
     async def all_events(self, interaction: discord.Interaction):
         if not await self._ensure_owner(interaction): return
         try:
-            events = [e for e in storage.load_events() if e['user_id'] == config.OWNER_ID]
-            events.sort(key=lambda x: x['datetime_evento'])
-            await interaction.response.send_message(embed=self.create_events_embed(events, f"📋 Full Agenda - {len(events)} Events", discord.Color.gold()), ephemeral=True)
+            await self._send_listing(
+                interaction, ('all',),
+                lambda: async_storage.events_for_user(config.OWNER_ID),
+                lambda events, first, total: self.create_events_embed(events, f"📋 Full Agenda - {total} Events", discord.Color.gold())
+            )
         except Exception as e:
             logger.exception(f"Error slash all: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
 
+    @app_commands.command(name="history", description="Show past events of a month (YYYY-MM)")
+    @app_commands.describe(month="Month as YYYY-MM, e.g. 2025-03")
+    async def history(self, interaction: discord.Interaction, month: str):
+        if not await self._ensure_owner(interaction): return
+        try:
+            month = archive.parse_month(month)
+        except ValueError as e:
+            await interaction.response.send_message(f"❌ {e}.", ephemeral=True)
+            return
+        try:
+            await interaction.response.defer(ephemeral=True)
+            await self._send_listing(
+                interaction, ('history', month),
+                lambda: async_storage.archived_events(config.OWNER_ID, month),
+                lambda events, first, total: self.create_events_embed(events, f"🗄️ History - {month}", discord.Color.dark_grey())
+            )
+        except Exception as e:
+            logger.exception(f"Error slash history: {e}")
+            await interaction.followup.send("❌ Unexpected error.", ephemeral=True)
+
+    @app_commands.command(name="export-agenda", description="Export agenda events as CSV or NDJSON")
+    async def export_agenda(self, interaction: discord.Interaction, format: str = "csv"):
+        if not await self._ensure_owner(interaction): return
+        if format not in export.FORMATS:
+            await interaction.response.send_message("Use `csv` or `ndjson` as format.", ephemeral=True)
+            return
+        try:
+            await interaction.response.defer(ephemeral=True)
+            files = await async_storage.export_events(format)
+            await export.send_files(interaction, files)
+        except Exception as e:
+            logger.exception(f"Error slash export-agenda: {e}")
+            await interaction.followup.send("❌ Error exporting.", ephemeral=True)
+
     # --- HELPERS ---
 
     async def _ensure_owner(self, interaction: discord.Interaction) -> bool:
@@ -130,184 +225,361 @@ class Agenda(commands.Cog):
             return False
         return True
 
-    def create_events_embed(self, events, title, color=discord.Color.blue()):
-        embed = discord.Embed(title=title, color=color, timestamp=datetime.datetime.now())
-        if not events:
-            embed.add_field(name="✨ No events", value="No events scheduled.", inline=False)
-            return embed
+    async def _send_listing(self, interaction, key, load, render):
+        """Sends a paginated listing of events; see utils.pages."""
+        async def source():
+            return await self.listings.get(key, async_storage.version('events'), load, EVENTS_PER_PAGE, render,
+                                           self._event_page_starts)
+        await PageView(source, interaction.user.id).send(interaction)
+
+    @staticmethod
+    def _day_bounds(date):
+        start = datetime.datetime.combine(date, datetime.time.min)
+        return start, start + timedelta(days=1)
+
+    @staticmethod
+    def _month_bounds(now):
+        start = datetime.datetime(now.year, now.month, 1)
+        end = datetime.datetime(now.year + (now.month == 12), now.month % 12 + 1, 1)
+        return start, end
+
+    @classmethod
+    def _event_page_starts(cls, events):
+        """Positions where the pages of an event listing start: after at most
+        EVENTS_PER_PAGE events, or earlier once the day fields rendered by
+        create_events_embed() would exceed EMBED_TOTAL_MAX. `events` are in
+        time order."""
+        # Room for the longest title and the "Page n/m" footer
+        budget = EMBED_TOTAL_MAX - 256 - len("Page 9999/9999")
+        count = size = 0
+        day = field = None
+        for pos, event in enumerate(events):
+            line = min(len(cls._event_line(event)), EMBED_FIELD_MAX)
+            date = event.datetime_evento.date()
+            if count and date == day:
+                # Fields are clipped, so a long day stops growing the embed
+                grown = min(field + 1 + line, EMBED_FIELD_MAX)
+                cost = grown - field
+            else:
+                grown, cost = line, len(cls._day_name(date)) + line
+            if count and (count == EVENTS_PER_PAGE or size + cost > budget):
+                count = size = 0
+                grown, cost = line, len(cls._day_name(date)) + line
+            if count == 0:
+                yield pos
+            count += 1
+            size += cost
+            day, field = date, grown
 
+    def create_events_embed(self, events, title, color=discord.Color.blue()):
         events_by_date = {}
         for event in events:
-            date = event['datetime_evento'].date()
-            if date not in events_by_date:
-                events_by_date[date] = []
-            events_by_date[date].append((event['datetime_evento'].time(), event['evento']))
-
+            events_by_date.setdefault(event.datetime_evento.date(), []).append(event)
+        fields = []
         for date in sorted(events_by_date.keys()):
-            date_obj = datetime.datetime.strptime(str(date), "%Y-%m-%d")
-            date_formatted = date_obj.strftime("%d/%m/%Y")
-            weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-            weekday = weekdays[date_obj.weekday()]
-            events_list = "\n".join([f"• `{t.strftime('%H:%M')}` - {e}" for t, e in sorted(events_by_date[date], key=lambda x: x[0])])
-            embed.add_field(
-                name=f"📅 {weekday} {date_formatted}",
-                value=events_list,
-                inline=False
-            )
+            day_events = sorted(events_by_date[date], key=lambda e: e.datetime_evento.time())
+            fields.append(self._day_field(date, day_events))
+        return self._fields_embed(fields, title, color)
+
+    def create_day_embed(self, view, title, color=discord.Color.blue()):
+        """create_events_embed() for a DayView, whose field is rendered once."""
+        fields = view.rendered('field', lambda v: [self._day_field(v.date, v.events)] if v.events else [])
+        return self._fields_embed(fields, title, color)
+
+    @staticmethod
+    def _fields_embed(fields, title, color):
+        embed = discord.Embed(title=title, color=color, timestamp=datetime.datetime.now())
+        if not fields:
+            embed.add_field(name="✨ No events", value="No events scheduled.", inline=False)
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
         return embed
 
+    @classmethod
+    def _day_field(cls, date, events):
+        """(name, value) of the embed field listing one day's sorted events."""
+        lines = [cls._event_line(event) for event in events]
+        return cls._day_name(date), clip("\n".join(lines), EMBED_FIELD_MAX)
+
+    @staticmethod
+    def _day_name(date):
+        weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        return f"📅 {weekdays[date.weekday()]} {date.strftime('%d/%m/%Y')}"
+
+    @staticmethod
+    def _event_line(event):
+        text = event.evento
+        if recurrence.is_recurring(event):
+            text += f" 🔁 {recurrence.describe(event)}"
+        return f"• `{event.datetime_evento.strftime('%H:%M')}` - {text}"
+
     # --- REMINDER LOGIC ---
 
-    async def start_event_reminder_task(self, event):
-        """Starts the persistent cycle from T-2h until ack (or event start)."""
-        event_id = event['id']
-        if event_id in self.active_reminders:
+    async def send_event_reminders(self, events):
+        """Sends the urgent reminders due together as one message (DM and
+        channel), with a ✅ button per event. The reminder engine calls it
+        every nag interval from the start offset until ✅ or event time."""
+        try:
+            user = await self.bot.resolver.user(config.OWNER_ID)
+            channel = await self.bot.resolver.channel(config.REMINDER_CHANNEL_ID)
+        except Exception as e:
+            logger.exception(f"Error fetch user/channel: {e}")
             return
-        self.ack_events[event_id] = asyncio.Event()
-        task = asyncio.create_task(self.remind_until_ack(event))
-        self.active_reminders[event_id] = task
-        logger.info(f"Persistent reminder task activated for '{event['evento']}'")
 
-    async def remind_until_ack(self, event):
-        """Sends reminder every 15 minutes until reaction ✅ or event time."""
-        event_id = event['id']
-        event_dt = event['datetime_evento']
+        api_calls = 0
+        for batch, fields in self._reminder_batches(events):
+            embed = self._reminder_embed(fields)
+            view = discord.ui.View(timeout=None)
+            for event in batch:
+                view.add_item(ReminderAck(event.id, clip(f"✅ {event.evento}", 80)))
+            # Not worth sending once the next nag is due
+            expires = min(reminders.nag_every(event) for event in batch).total_seconds()
+            sends = [self.bot.outbox.send(target, outbound.URGENT, expires, content=content, embed=embed, view=view)
+                     for target, content in ((user, None), (channel, f"<@{config.OWNER_ID}>"))]
+            api_calls += len(sends)
+            for message in await asyncio.gather(*sends):
+                if message is None:
+                    continue
+                for event in batch:
+                    self.reminder_messages.add(event.id, message.channel.id, message.id)
+        self._dispatch_stats['batches'] += 1
+        self._dispatch_stats['reminders'] += len(events)
+        self._dispatch_stats['api_calls'] += api_calls
+        logger.info(f"Sent {len(events)} event reminders with {api_calls} API calls")
+
+    @staticmethod
+    def _reminder_batches(events):
+        """Splits `events` into (events, fields) batches that fit one embed:
+        at most REMINDERS_PER_MESSAGE fields and EMBED_TOTAL_MAX characters."""
+        now = datetime.datetime.now()
+        budget = EMBED_TOTAL_MAX - len(f"🚨 {REMINDERS_PER_MESSAGE} URGENT REMINDERS 🚨") - len(REMINDER_FOOTER)
+        batch, fields, size = [], [], 0
+        for event in events:
+            hours, rem = divmod(int((event.datetime_evento - now).total_seconds()), 3600)
+            minutes, _ = divmod(rem, 60)
+            name = clip(f"{event.evento} at {event.datetime_evento.strftime('%H:%M')}", 256)
+            value = f"⏳ {hours} hours and {minutes} minutes remaining"
+            if batch and (len(batch) == REMINDERS_PER_MESSAGE or size + len(name) + len(value) > budget):
+                yield batch, fields
+                batch, fields, size = [], [], 0
+            batch.append(event)
+            fields.append((name, value))
+            size += len(name) + len(value)
+        if batch:
+            yield batch, fields
+
+    @staticmethod
+    def _reminder_embed(fields):
+        embed = discord.Embed(
+            title="🚨 URGENT REMINDER 🚨" if len(fields) == 1 else f"🚨 {len(fields)} URGENT REMINDERS 🚨",
+            color=discord.Color.red()
+        )
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
+        embed.set_footer(text=REMINDER_FOOTER)
+        return embed
+
+    def dispatch_stats(self):
+        """Reminder batches sent, reminders in them and the REST calls they took."""
+        stats = dict(self._dispatch_stats)
+        stats['calls_per_batch'] = stats['api_calls'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
 
+    def _reminders_finished(self, event_id):
+        self.reminder_messages.pop(event_id)
+        self._remove_job(f"event_active_{event_id}")
+
+    def _remove_job(self, job_id):
         try:
-            while datetime.datetime.now() < event_dt and not self.ack_events[event_id].is_set():
-                try:
-                    user = await self.bot.fetch_user(config.OWNER_ID)
-                    channel = await self.bot.fetch_channel(config.REMINDER_CHANNEL_ID)
-                except Exception as e:
-                    logger.exception(f"Error fetch user/channel: {e}")
-                    try:
-                        await asyncio.wait_for(self.ack_events[event_id].wait(), timeout=15 * 60)
-                    except asyncio.TimeoutError:
-                        continue
-                    else:
-                        break
-
-                time_remaining = event_dt - datetime.datetime.now()
-                hours, rem = divmod(int(time_remaining.total_seconds()), 3600)
-                minutes, _ = divmod(rem, 60)
-
-                embed = discord.Embed(
-                    title="🚨 URGENT REMINDER 🚨",
-                    description=f"Event **{event['evento']}** is at **{event_dt.strftime('%H:%M')}**.",
-                    color=discord.Color.red()
-                )
-                embed.add_field(name="⏳ Time remaining", value=f"{hours} hours and {minutes} minutes")
-                embed.set_footer(text="Press ✅ to stop notifications.")
+            self.bot.scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
 
-                try:
-                    msg_private = await user.send(embed=embed)
-                    msg_channel = await channel.send(content=f"<@{config.OWNER_ID}>", embed=embed)
-                    await msg_private.add_reaction("✅")
-                    await msg_channel.add_reaction("✅")
-                    self.message_to_event[msg_private.id] = event_id
-                    self.message_to_event[msg_channel.id] = event_id
-                except Exception as e:
-                    logger.exception(f"Error sending reminder: {e}")
+    # Each future event has one stored job: "event_start_<id>" at the time
+    # its reminders start, replaced by "event_active_<id>" (due at the
+    # event time) while the reminder engine nags about it. After a restart
+    # only the few active jobs are read back; the agenda is not scanned.
+    # A recurring series has the job of its next occurrence only; each
+    # start job schedules the occurrence after it.
 
-                try:
-                    await asyncio.wait_for(self.ack_events[event_id].wait(), timeout=15 * 60)
-                except asyncio.TimeoutError:
-                    continue
-                else:
-                    break
-        finally:
-            self.ack_events.pop(event_id, None)
-            self.active_reminders.pop(event_id, None)
-            to_del = [mid for mid, eid in self.message_to_event.items() if eid == event_id]
-            for mid in to_del:
-                self.message_to_event.pop(mid, None)
+    def _activate_event_reminders(self, event):
+        if not self.reminders.schedule(event):
+            return False
+        self.bot.scheduler.add_job(
+            jobs.event_reminders, 'date', run_date=event.datetime_evento, args=[event.id, event.user_id],
+            id=f"event_active_{event.id}", replace_existing=True
+        )
+        self._remove_job(f"event_start_{event.id}")
+        return True
+
+    async def start_event_reminders(self, event_id, user_id):
+        """Hands an event to the reminder engine once its reminder window
+        opens (used by scheduler). Deleted or past events are ignored."""
+        event = await async_storage.get_event(event_id, user_id)
+        if event is not None and self._activate_event_reminders(event):
+            logger.info(f"Persistent reminders activated for '{event.evento}'")
+        series_id, when = recurrence.split_id(event_id)
+        if when is not None:
+            series = await async_storage.get_event(series_id, user_id)
+            if series is not None:
+                self._schedule_occurrences(series, when + timedelta(minutes=1))
 
     async def schedule_event_reminders_on_startup(self):
         await self.bot.wait_until_ready()
-        logger.info("Scheduling event reminders on startup...")
-        now = datetime.datetime.now()
-        for event in storage.load_events():
-            self.schedule_new_event_reminder(event)
+        if self.bot.jobstore.created:
+            # First start with the job store: add the jobs of existing events
+            await self.schedule_event_reminders()
+        else:
+            active = self.bot.jobstore.get_jobs_with_prefix("event_active_")
+            for job in active:
+                await self.start_event_reminders(*job.args)
+            logger.info(f"Resumed reminders for {len(active)} events")
+        self.reminders.start()
+
+    async def schedule_event_reminders(self, user_id=None):
+        """(Re)creates the reminder jobs of every stored event, or of the
+        events in the agenda file of `user_id` (after a restore)."""
+        count = 0
+        for event in await async_storage.load_events(user_id):
+            count += self.schedule_new_event_reminder(event)
+        logger.info(f"Scheduled reminders for {count} events")
 
     def schedule_new_event_reminder(self, event):
+        """Creates the reminder job of an event, or of the next occurrence
+        of a series. Returns False if there is nothing left to remind of."""
+        if recurrence.is_recurring(event):
+            return self._schedule_occurrences(event, datetime.datetime.now())
+        return self._schedule_reminder(event)
+
+    def _schedule_occurrences(self, series, after):
+        # Occurrences whose reminders should already be running are started
+        # now; the first later one gets a start job and the chain stops
         now = datetime.datetime.now()
-        event_dt = event['datetime_evento']
+        scheduled = False
+        for when in recurrence.occurrences(series, max(after, now)):
+            occurrence = recurrence.occurrence(series, when)
+            scheduled = self._schedule_reminder(occurrence, now) or scheduled
+            if when - reminders.remind_before(occurrence) > now:
+                break
+        return scheduled
+
+    def _schedule_reminder(self, event, now=None):
+        now = now or datetime.datetime.now()
+        event_dt = event.datetime_evento
         if now >= event_dt:
-            return
-        reminder_start_time = event_dt - timedelta(hours=2)
+            return False
+        reminder_start_time = event_dt - reminders.remind_before(event)
         if now >= reminder_start_time:
-            self.bot.loop.create_task(self.start_event_reminder_task(event))
-        else:
-            self.bot.scheduler.add_job(
-                self.start_event_reminder_task, 'date',
-                run_date=reminder_start_time,
-                args=[event],
-                id=f"start_nag_{event['id']}",
-                misfire_grace_time=3600,
-                replace_existing=True
-            )
+            return self._activate_event_reminders(event)
+        self.bot.scheduler.add_job(
+            jobs.event_reminders, 'date', run_date=reminder_start_time, args=[event.id, event.user_id],
+            id=f"event_start_{event.id}", replace_existing=True
+        )
+        return True
+
+    async def daily_reminder(self):
+        logger.info(f"Running daily midnight reminder check...")
+        if config.OWNER_ID <= 0:
+            logger.warning("OWNER_ID not configured. Skipping daily reminder dispatch.")
+            return
+        today = datetime.datetime.now().date()
+        view = await async_storage.day_view(config.OWNER_ID, today)
+        # Pre-warm tomorrow's view for /tomorrow and tomorrow night's summary
+        await async_storage.day_view(config.OWNER_ID, today + timedelta(days=1))
+        if not view.events:
+            logger.info("No events for today.")
+            return
+
+        message = view.rendered('summary', self._daily_summary)
 
-    async def daily_reminder(self):
-        logger.info(f"Running daily midnight reminder check...")
-        if config.OWNER_ID <= 0:
-            logger.warning("OWNER_ID not configured. Skipping daily reminder dispatch.")
-            return
-        today_date = datetime.datetime.now().date()
-        events = storage.load_events()
-        todays_events = [e for e in events if e['datetime_evento'].date() == today_date and e['user_id'] == config.OWNER_ID]
-        if not todays_events:
-            logger.info("No events for today.")
-            return
+        try:
+            user = await self.bot.resolver.user(config.OWNER_ID)
+            await self.bot.outbox.send(user, outbound.NORMAL, content=message)
+            if config.REMINDER_CHANNEL_ID > 0:
+                channel = await self.bot.resolver.channel(config.REMINDER_CHANNEL_ID)
+                await self.bot.outbox.send(channel, outbound.NORMAL, content=message)
+            else:
+                logger.info("REMINDER_CHANNEL_ID not configured. Sent only DM notification.")
+        except Exception as e:
+            logger.exception(f"Error sending daily reminder: {e}")
 
+    @staticmethod
+    def _daily_summary(view):
         message = "🔔 **DAILY SUMMARY!** Here is your schedule for today:\n"
-        todays_events.sort(key=lambda x: x['datetime_evento'].time())
-        for event in todays_events:
-            message += f"- `{event['datetime_evento'].strftime('%H:%M')}`: {event['evento']}\n"
-
-        try:
-            user = await self.bot.fetch_user(config.OWNER_ID)
-            await user.send(message)
-            if config.REMINDER_CHANNEL_ID > 0:
-                channel = await self.bot.fetch_channel(config.REMINDER_CHANNEL_ID)
-                await channel.send(message)
-            else:
-                logger.info("REMINDER_CHANNEL_ID not configured. Sent only DM notification.")
-        except Exception as e:
-            logger.exception(f"Error sending daily reminder: {e}")
-
-    def clean_old_events(self):
-        events = storage.load_events()
+        for event in view.events:
+            message += f"- `{event.datetime_evento.strftime('%H:%M')}`: {event.evento}\n"
+        return message
+
+    async def clean_old_events(self):
         threshold = datetime.datetime.now() - timedelta(days=1)
-        valid_events = [e for e in events if e['datetime_evento'] >= threshold]
-        removed_count = len(events) - len(valid_events)
-        if removed_count > 0 and storage.save_events(valid_events):
+        removed_count = await async_storage.purge_events_before(threshold)
+        if removed_count > 0:
             logger.info(f"Removed {removed_count} old events.")
 
-    @commands.Cog.listener()
-    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        if payload.user_id != config.OWNER_ID:
-            return
-        if getattr(payload.emoji, "name", None) != "✅":
-            return
+    async def acknowledge_reminder(self, interaction: discord.Interaction, event_id):
+        """✅ pressed on a reminder: stops the reminders of that event only."""
+        if not await self._ensure_owner(interaction): return
+        # Taken before cancel(), which forgets them
+        messages = self.reminder_messages.messages_of(event_id)
+        orphans = self.reminder_messages.pop(event_id)
+        active = self.reminders.cancel(event_id)
 
-        event_id = self.message_to_event.get(payload.message_id)
-        if not event_id:
+        try:
+            # The pressed message keeps the fields and buttons of the other events
+            remaining = self._without_event(interaction.message, event_id)
+            if remaining is not None:
+                embed, view = remaining
+                await interaction.response.edit_message(embed=embed, view=view)
+            else:
+                await interaction.response.edit_message(content="👍 Reminder confirmed and stopped.", embed=None, view=None)
+            if not active:
+                await interaction.followup.send("This reminder was no longer active.", ephemeral=True)
+        except Exception as e:
+            logger.exception(f"Error acknowledging reminder: {e}")
+        # Every other message of the event goes once it reminds of nothing
+        # else (earlier nags), or loses the event's field and button (the
+        # DM/channel copy of a shared batch, shared nags)
+        messages.pop(interaction.message.id, None)
+        orphans.pop(interaction.message.id, None)
+        await asyncio.gather(
+            *(self._delete_message(cid, mid) for mid, cid in orphans.items()),
+            *(self._strip_event(cid, mid, event_id) for mid, cid in messages.items() if mid not in orphans))
+
+    def _without_event(self, message, event_id):
+        """(embed, view) of a reminder message without the field and button
+        of `event_id`, or None if it reminds of no other event."""
+        buttons = [c for row in message.components for c in getattr(row, 'children', ())
+                   if isinstance(c, discord.Button) and (c.custom_id or '').startswith(ACK_PREFIX)]
+        fields = message.embeds[0].fields if message.embeds else []
+        view = discord.ui.View(timeout=None)
+        kept = []
+        # Fields and buttons are added in the same order (send_event_reminders)
+        for pos, button in enumerate(buttons):
+            if button.custom_id == ACK_PREFIX + event_id:
+                continue
+            view.add_item(ReminderAck(button.custom_id.removeprefix(ACK_PREFIX), button.label))
+            if pos < len(fields):
+                kept.append((fields[pos].name, fields[pos].value))
+        if not view.children:
+            return None
+        return self._reminder_embed(kept), view
+
+    async def _strip_event(self, channel_id, message_id, event_id):
+        route = f"channel:{channel_id}"
+        partial = self.bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+        message = await self.bot.outbox.call(route, partial.fetch, outbound.LOW)
+        if message is None:
             return
+        remaining = self._without_event(message, event_id)
+        if remaining is None:
+            await self.bot.outbox.call(route, message.delete, outbound.LOW)
+            return
+        embed, view = remaining
+        await self.bot.outbox.call(route, lambda: message.edit(embed=embed, view=view), outbound.LOW)
 
-        ev_flag = self.ack_events.get(event_id)
-        if ev_flag and not ev_flag.is_set():
-            ev_flag.set()
-
-        try:
-            channel = self.bot.get_channel(payload.channel_id) or await self.bot.fetch_channel(payload.channel_id)
-            await channel.send("👍 Reminder confirmed and stopped.")
-            try:
-                msg = await channel.fetch_message(payload.message_id)
-                await msg.delete()
-            except Exception:
-                pass
-        except Exception:
-            pass
+    async def _delete_message(self, channel_id, message_id):
+        message = self.bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+        await self.bot.outbox.call(f"channel:{channel_id}", message.delete, outbound.LOW)
 
 async def setup(bot):
     await bot.add_cog(Agenda(bot))
@@ -7,7 +7,7 @@ import io
 import datetime
 import pyotp
 import logging
-from utils import security, common, storage, config
+from utils import security, common, async_storage, config
 
 logger = logging.getLogger("discordbot")
 
@@ -143,7 +143,7 @@ class System(commands.Cog):
         secret = pyotp.random_base32()
         
         # Save
-        if not storage.save_secret_2fa(secret):
+        if not await async_storage.save_secret_2fa(secret):
             await interaction.followup.send("❌ Error saving configuration.", ephemeral=True)
             return
 
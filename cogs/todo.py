@@ -4,32 +4,35 @@ from discord.ext import commands
 import datetime
 import uuid
 import logging
-from utils import storage, config, security
+from utils import async_storage, security, export
+from utils.records import Todo
+from utils.pages import Listings, PageView, EMBED_DESCRIPTION_MAX, clip
 
 logger = logging.getLogger("discordbot")
 
+SEARCH_RESULTS_LIMIT = 25
+TODOS_PER_PAGE = 20
+
 class ToDo(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.listings = Listings()
 
     @app_commands.command(name="todo-add", description="Add a task to To-Do list")
     async def todo_add(self, interaction: discord.Interaction, text: str):
         if not await security.ensure_owner(interaction): return
         await interaction.response.defer(ephemeral=True)
         try:
-            items = storage.load_todo()
-            new_item = {
-                'id': str(uuid.uuid4()),
-                'user_id': interaction.user.id,
-                'text': text,
-                'created': datetime.datetime.now().isoformat(),
-                'done': False
-            }
-            items.append(new_item)
-            if storage.save_todo(items):
-                await interaction.followup.send(f"✅ Task added: **{text}** (ID: `{new_item['id']}`)")
-            else:
-                await interaction.followup.send("❌ Error saving.", ephemeral=True)
+            new_item = Todo(
+                id=str(uuid.uuid4()),
+                user_id=interaction.user.id,
+                text=text,
+                created=datetime.datetime.now().isoformat(),
+                done=False
+            )
+            async with async_storage.edit_todo(interaction.user.id) as items:
+                items.append(new_item)
+            await interaction.followup.send(f"✅ Task added: **{text}** (ID: `{new_item.id}`)")
         except Exception as e:
             logger.exception(f"Error slash todo add: {e}")
             await interaction.followup.send("❌ Unexpected error.", ephemeral=True)
@@ -38,21 +41,17 @@ class ToDo(commands.Cog):
     async def todo_list(self, interaction: discord.Interaction):
         if not await security.ensure_owner(interaction): return
         try:
-            items = [i for i in storage.load_todo() if i['user_id'] == interaction.user.id]
-            if not items:
+            user_id = interaction.user.id
+
+            async def source():
+                return await self.listings.get(
+                    user_id, async_storage.version('todo'),
+                    lambda: async_storage.todos_for_user(user_id), TODOS_PER_PAGE, self.render_todo_page
+                )
+            if not (await source()).items:
                 await interaction.response.send_message("✨ No tasks in your To-Do list.", ephemeral=True)
                 return
-            lines = []
-            for idx, it in enumerate(items, start=1):
-                if it.get('done'):
-                    txt = f"~~{it['text']}~~"
-                    status = "✅"
-                else:
-                    txt = it['text']
-                    status = "🔲"
-                lines.append(f"{idx}. {status} {txt} (`{it['id'][:8]}`)")
-            embed = discord.Embed(title="📝 To-Do List", description="\n".join(lines), color=discord.Color.blurple())
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await PageView(source, user_id).send(interaction)
         except Exception as e:
             logger.exception(f"Error slash todo list: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -61,16 +60,16 @@ class ToDo(commands.Cog):
     async def todo_view(self, interaction: discord.Interaction, id_or_index: str):
         if not await security.ensure_owner(interaction): return
         try:
-            items = storage.load_todo()
+            items = await async_storage.load_todo(interaction.user.id)
             item = self.find_todo(items, id_or_index, interaction.user.id)
             if not item:
                 await interaction.response.send_message("❌ Task not found.", ephemeral=True)
                 return
-            status = "✅ Completed" if item.get('done') else "🔲 Not completed"
-            embed = discord.Embed(title=f"📝 Task: {item['text']}", color=discord.Color.blue())
-            embed.add_field(name="ID", value=item['id'], inline=False)
+            status = "✅ Completed" if item.done else "🔲 Not completed"
+            embed = discord.Embed(title=f"📝 Task: {item.text}", color=discord.Color.blue())
+            embed.add_field(name="ID", value=item.id, inline=False)
             embed.add_field(name="Status", value=status, inline=True)
-            embed.add_field(name="Created", value=item.get('created', 'N/A'), inline=True)
+            embed.add_field(name="Created", value=item.created or 'N/A', inline=True)
             await interaction.response.send_message(embed=embed, ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash todo view: {e}")
@@ -80,17 +79,15 @@ class ToDo(commands.Cog):
     async def todo_done(self, interaction: discord.Interaction, id_or_index: str):
         if not await security.ensure_owner(interaction): return
         try:
-            items = storage.load_todo()
-            target = self.find_todo(items, id_or_index, interaction.user.id)
+            async with async_storage.edit_todo(interaction.user.id) as items:
+                target = self.find_todo(items, id_or_index, interaction.user.id)
+                if target:
+                    target.done = True
+                    target.done_at = datetime.datetime.now().isoformat()
             if not target:
                 await interaction.response.send_message("❌ Task not found.", ephemeral=True)
                 return
-            for it in items:
-                if it['id'] == target['id']:
-                    it['done'] = True
-                    it['done_at'] = datetime.datetime.now().isoformat()
-            storage.save_todo(items)
-            await interaction.response.send_message(f"✅ Task marked as done: **{target['text']}**", ephemeral=True)
+            await interaction.response.send_message(f"✅ Task marked as done: **{target.text}**", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash todo done: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -99,14 +96,14 @@ class ToDo(commands.Cog):
     async def todo_remove(self, interaction: discord.Interaction, id_or_index: str):
         if not await security.ensure_owner(interaction): return
         try:
-            items = storage.load_todo()
-            target = self.find_todo(items, id_or_index, interaction.user.id)
+            async with async_storage.edit_todo(interaction.user.id) as items:
+                target = self.find_todo(items, id_or_index, interaction.user.id)
+                if target:
+                    items.remove(target)
             if not target:
                 await interaction.response.send_message("❌ Task not found.", ephemeral=True)
                 return
-            items = [i for i in items if i['id'] != target['id']]
-            storage.save_todo(items)
-            await interaction.response.send_message(f"🗑️ Task removed: **{target['text']}**", ephemeral=True)
+            await interaction.response.send_message(f"🗑️ Task removed: **{target.text}**", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash todo remove: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -115,43 +112,50 @@ class ToDo(commands.Cog):
     async def todo_export(self, interaction: discord.Interaction):
         if not await security.ensure_owner(interaction): return
         try:
-            if not storage.os.path.exists(config.TODO_FILE):
-                await interaction.response.send_message("No todo file to export.", ephemeral=True)
+            await interaction.response.defer(ephemeral=True)
+            file_path = await async_storage.data_file('todo', interaction.user.id)
+            await async_storage.checkpoint(file_path)
+            if not await async_storage.data_file_exists(file_path):
+                await interaction.followup.send("No todo file to export.", ephemeral=True)
                 return
-            await interaction.response.send_message(file=discord.File(config.TODO_FILE), ephemeral=True)
+            files = await async_storage.export_data_file(file_path)
+            await export.send_files(interaction, files)
+        except ValueError:
+            await interaction.followup.send("❌ todo.json is too large to attach. Use `/export-todo format:ndjson`.", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash todo export: {e}")
-            await interaction.response.send_message("❌ Error during export.", ephemeral=True)
+            await interaction.followup.send("❌ Error during export.", ephemeral=True)
 
-    @app_commands.command(name="export-todo", description="Export To-Do list as CSV")
-    async def export_todo_csv(self, interaction: discord.Interaction):
+    @app_commands.command(name="export-todo", description="Export To-Do list as CSV or NDJSON")
+    async def export_todo_csv(self, interaction: discord.Interaction, format: str = "csv"):
         if not await security.ensure_owner(interaction): return
+        if format not in export.FORMATS:
+            await interaction.response.send_message("Use `csv` or `ndjson` as format.", ephemeral=True)
+            return
         try:
             await interaction.response.defer(ephemeral=True)
-            items = storage.load_todo()
-            csv_bytes = storage.todo_to_csv(items)
-            bio = storage.io.BytesIO(csv_bytes)
-            bio.seek(0)
-            await interaction.followup.send(file=discord.File(bio, filename="todo_export.csv"), ephemeral=True)
+            files = await async_storage.export_todo(format)
+            await export.send_files(interaction, files)
         except Exception as e:
             logger.exception(f"Error slash export-todo: {e}")
-            await interaction.response.send_message("❌ Error exporting.", ephemeral=True)
+            await interaction.followup.send("❌ Error exporting.", ephemeral=True)
 
-    @app_commands.command(name="search-todo", description="Search in your To-Do list (substring match)")
+    @app_commands.command(name="search-todo", description="Search your To-Do list (words or prefixes, tag:name, prio:level)")
     async def search_todo(self, interaction: discord.Interaction, query: str):
         if not await security.ensure_owner(interaction): return
         try:
-            items = [i for i in storage.load_todo() if i.get('user_id') == interaction.user.id]
-            matches = [i for i in items if query.lower() in i.get('text', '').lower()]
+            matches, total = await async_storage.search_todo(interaction.user.id, query, SEARCH_RESULTS_LIMIT)
             if not matches:
                 await interaction.response.send_message("No results.", ephemeral=True)
                 return
             lines = []
             for idx, it in enumerate(matches, start=1):
-                status = "✅" if it.get('done') else "🔲"
-                pr = it.get('priority', 'normal')
-                tags = ','.join(it.get('tags', [])) if it.get('tags') else ''
-                lines.append(f"{idx}. {status} {it.get('text')} (`{it['id'][:8]}`) [prio:{pr}]{(' ['+tags+']') if tags else ''}")
+                status = "✅" if it.done else "🔲"
+                pr = it.priority or 'normal'
+                tags = ','.join(it.tags) if it.tags else ''
+                lines.append(f"{idx}. {status} {it.text} (`{it.id[:8]}`) [prio:{pr}]{(' ['+tags+']') if tags else ''}")
+            if total > len(matches):
+                lines.append(f"… and {total - len(matches)} more. Refine the query to narrow it down.")
             embed = discord.Embed(title=f"🔎 Results for: {query}", description="\n".join(lines), color=discord.Color.blurple())
             await interaction.response.send_message(embed=embed, ephemeral=True)
         except Exception as e:
@@ -162,14 +166,11 @@ class ToDo(commands.Cog):
     async def clear_completed(self, interaction: discord.Interaction):
         if not await security.ensure_owner(interaction): return
         try:
-            items = storage.load_todo()
-            before = len(items)
-            items = [i for i in items if not (i.get('user_id') == interaction.user.id and i.get('done'))]
-            removed = before - len(items)
-            if storage.save_todo(items):
-                await interaction.response.send_message(f"🧹 Removed {removed} completed tasks.", ephemeral=True)
-            else:
-                await interaction.response.send_message("❌ Error saving.", ephemeral=True)
+            async with async_storage.edit_todo(interaction.user.id) as items:
+                before = len(items)
+                items[:] = [i for i in items if not (i.user_id == interaction.user.id and i.done)]
+                removed = before - len(items)
+            await interaction.response.send_message(f"🧹 Removed {removed} completed tasks.", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash clear-completed: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -182,16 +183,14 @@ class ToDo(commands.Cog):
             await interaction.response.send_message("Invalid priority. Use: low, normal, high, urgent.", ephemeral=True)
             return
         try:
-            items = storage.load_todo()
-            target = self.find_todo(items, id_or_index, interaction.user.id)
+            async with async_storage.edit_todo(interaction.user.id) as items:
+                target = self.find_todo(items, id_or_index, interaction.user.id)
+                if target:
+                    target.priority = level
             if not target:
                 await interaction.response.send_message("Task not found.", ephemeral=True)
                 return
-            for it in items:
-                if it['id'] == target['id']:
-                    it['priority'] = level
-            storage.save_todo(items)
-            await interaction.response.send_message(f"✅ Priority set to {level} for: **{target['text']}**", ephemeral=True)
+            await interaction.response.send_message(f"✅ Priority set to {level} for: **{target.text}**", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash set-priority: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
@@ -204,27 +203,38 @@ class ToDo(commands.Cog):
             await interaction.response.send_message("Invalid action. Use add or remove.", ephemeral=True)
             return
         try:
-            items = storage.load_todo()
-            target = self.find_todo(items, id_or_index, interaction.user.id)
-            if not target:
-                await interaction.response.send_message("Task not found.", ephemeral=True)
-                return
-            for it in items:
-                if it['id'] == target['id']:
-                    tags = set(it.get('tags', []))
+            async with async_storage.edit_todo(interaction.user.id) as items:
+                target = self.find_todo(items, id_or_index, interaction.user.id)
+                if target:
+                    tags = set(target.tags or [])
                     if action == 'add':
                         tags.add(tag)
                     else:
                         tags.discard(tag)
-                    it['tags'] = list(tags)
-            storage.save_todo(items)
-            await interaction.response.send_message(f"✅ Tag {action} executed on: **{target['text']}**", ephemeral=True)
+                    target.tags = list(tags)
+            if not target:
+                await interaction.response.send_message("Task not found.", ephemeral=True)
+                return
+            await interaction.response.send_message(f"✅ Tag {action} executed on: **{target.text}**", ephemeral=True)
         except Exception as e:
             logger.exception(f"Error slash tag-todo: {e}")
             await interaction.response.send_message("❌ Unexpected error.", ephemeral=True)
 
+    @staticmethod
+    def render_todo_page(items, first, total):
+        lines = []
+        for idx, it in enumerate(items, start=first + 1):
+            if it.done:
+                txt = f"~~{it.text}~~"
+                status = "✅"
+            else:
+                txt = it.text
+                status = "🔲"
+            lines.append(f"{idx}. {status} {txt} (`{it.id[:8]}`)")
+        return discord.Embed(title="📝 To-Do List", description=clip("\n".join(lines), EMBED_DESCRIPTION_MAX), color=discord.Color.blurple())
+
     def find_todo(self, items, id_or_index, user_id):
-        user_items = [i for i in items if i.get('user_id') == user_id]
+        user_items = [i for i in items if i.user_id == user_id]
         if id_or_index.isdigit():
             idx = int(id_or_index) - 1
             if 0 <= idx < len(user_items):
@@ -232,7 +242,7 @@ class ToDo(commands.Cog):
             return None
         # id prefix
         for it in user_items:
-            if it.get('id', '').startswith(id_or_index):
+            if (it.id or '').startswith(id_or_index):
                 return it
         return None
 
@@ -7,12 +7,13 @@ import random
 import string
 import io
 import aiohttp
-import asyncio
 import logging
-from utils import common, config, security
+from utils import common, config, security, jobs, outbound
 
 logger = logging.getLogger("discordbot")
 
+POMODORO_MISFIRE_SECONDS = 5 * 60
+
 class Utilities(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -27,7 +28,8 @@ class Utilities(commands.Cog):
         try:
             reminder_time = datetime.datetime.now() + delta
             job_id = f"reminder_{interaction.user.id}_{int(time.time())}"
-            self.bot.scheduler.add_job(self.send_single_reminder, 'date', run_date=reminder_time, args=[interaction.user.id, message], id=job_id)
+            self.bot.scheduler.add_job(jobs.remindme, 'date', run_date=reminder_time,
+                                       args=[interaction.user.id, message, reminder_time.isoformat()], id=job_id)
             
             if delta.total_seconds() < 60:
                 duration_str = f"{int(delta.total_seconds())} seconds"
@@ -223,46 +225,58 @@ class Utilities(commands.Cog):
             await interaction.response.send_message("Invalid values for minutes/cycles.", ephemeral=True)
             return
         await interaction.response.send_message(f"⏱️ Starting Pomodoro: {minutes}min x {cycles} cycle(s){(' - '+label) if label else ''}", ephemeral=True)
+        self._schedule_pomodoro_cycle(interaction.user.id, minutes, 1, cycles, label, notify_channel)
 
-        async def _runner(user_id, minutes, cycles, label, notify_channel):
-            try:
-                for i in range(1, cycles + 1):
-                    await asyncio.sleep(minutes * 60)
-                    usr = await self.bot.fetch_user(user_id)
-                    txt = f"🔔 Pomodoro finished ({i}/{cycles})" + (f" - {label}" if label else "")
-                    try:
-                        await usr.send(txt)
-                    except Exception:
-                        logger.warning("Cannot send DM for pomodoro")
-                    if notify_channel:
-                        try:
-                            ch = await self.bot.fetch_channel(config.REMINDER_CHANNEL_ID)
-                            await ch.send(f"🔔 <@{user_id}> {txt}")
-                        except Exception:
-                            logger.exception("Cannot notify channel for pomodoro")
-            except asyncio.CancelledError:
-                logger.info("Pomodoro cancelled")
-            except Exception:
-                logger.exception("Error running Pomodoro")
+    def _schedule_pomodoro_cycle(self, user_id, minutes, cycle, cycles, label, notify_channel):
+        # A cycle end more than POMODORO_MISFIRE_SECONDS late (bot offline)
+        # is dropped together with the rest of the session
+        self.bot.scheduler.add_job(
+            jobs.pomodoro, 'date',
+            run_date=datetime.datetime.now() + datetime.timedelta(minutes=minutes),
+            args=[user_id, minutes, cycle, cycles, label, notify_channel],
+            id=f"pomodoro_{user_id}_{int(time.time())}_{cycle}",
+            misfire_grace_time=POMODORO_MISFIRE_SECONDS
+        )
 
-        asyncio.create_task(_runner(interaction.user.id, minutes, cycles, label, notify_channel))
+    async def pomodoro_cycle_done(self, user_id, minutes, cycle, cycles, label, notify_channel):
+        """Notifies the end of a Pomodoro cycle and schedules the next one (used by scheduler)."""
+        try:
+            if cycle < cycles:
+                self._schedule_pomodoro_cycle(user_id, minutes, cycle + 1, cycles, label, notify_channel)
+            usr = await self.bot.resolver.user(user_id)
+            txt = f"🔔 Pomodoro finished ({cycle}/{cycles})" + (f" - {label}" if label else "")
+            if await self.bot.outbox.send(usr, outbound.NORMAL, content=txt) is None:
+                logger.warning("Cannot send DM for pomodoro")
+            if notify_channel:
+                try:
+                    ch = await self.bot.resolver.channel(config.REMINDER_CHANNEL_ID)
+                    await self.bot.outbox.send(ch, outbound.NORMAL, content=f"🔔 <@{user_id}> {txt}")
+                except Exception:
+                    logger.exception("Cannot notify channel for pomodoro")
+        except Exception:
+            logger.exception("Error running Pomodoro")
 
-    async def send_single_reminder(self, user_id, message):
-        """Sends a single reminder (used by scheduler)."""
+    async def send_single_reminder(self, user_id, message, due=None):
+        """Sends a single reminder (used by scheduler). `due` is when it was
+        set for; a reminder delivered late (bot offline) says so."""
         try:
-            user = await self.bot.fetch_user(user_id)
+            user = await self.bot.resolver.user(user_id)
             embed = discord.Embed(
                 title="⏰ REMINDER!",
                 description=message,
                 color=discord.Color.orange(),
                 timestamp=datetime.datetime.now()
             )
+            if due:
+                late = datetime.datetime.now() - datetime.datetime.fromisoformat(due)
+                if late.total_seconds() > 60:
+                    embed.add_field(name="⌛ Late", value=f"Due at {datetime.datetime.fromisoformat(due).strftime('%d/%m/%Y %H:%M')}, the bot was offline.")
             embed.set_footer(text="Reminder set with !remindme")
-            await user.send(embed=embed)
-            logger.info(f"Reminder sent to {user.name}: {message}")
+            if await self.bot.outbox.send(user, outbound.URGENT, embed=embed) is not None:
+                logger.info(f"Reminder sent to {user.name}: {message}")
             try:
-                channel = await self.bot.fetch_channel(config.REMINDER_CHANNEL_ID)
-                await channel.send(f"🔔 <@{user_id}> {message}")
+                channel = await self.bot.resolver.channel(config.REMINDER_CHANNEL_ID)
+                await self.bot.outbox.send(channel, outbound.URGENT, content=f"🔔 <@{user_id}> {message}")
             except Exception as e:
                 logger.exception(f"Error sending reminder to channel: {e}")
         except Exception as e:
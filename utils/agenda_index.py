@@ -0,0 +1,152 @@
+import bisect
+import heapq
+from utils import recurrence
+
+
+class AgendaIndex:
+    """Events kept sorted by `datetime_evento`, partitioned per user.
+
+    Each partition holds parallel lists of sort keys `(datetime, id)` and
+    events, so a range lookup is two binary searches plus a slice:
+    O(log N + k). Inserts and deletes keep the order incrementally.
+
+    Recurring series (see utils.recurrence) are kept apart, per user, and
+    only their occurrences inside a queried range are generated.
+    """
+
+    def __init__(self, events=()):
+        self._keys = {}         # user_id -> [(datetime_evento, id), ...]
+        self._events = {}       # user_id -> [event, ...] (same order)
+        self._series = {}       # user_id -> {id: series}
+        self._where = {}        # event id -> (user_id, key), key None for a series
+        by_user = {}
+        for event in events:
+            if recurrence.is_recurring(event):
+                self._add_series(event)
+                continue
+            by_user.setdefault(event.user_id, []).append(event)
+        for user_id, user_events in by_user.items():
+            user_events.sort(key=self._key)
+            self._keys[user_id] = [self._key(e) for e in user_events]
+            self._events[user_id] = user_events
+            for key in self._keys[user_id]:
+                self._where[key[1]] = (user_id, key)
+
+    @staticmethod
+    def _key(event):
+        return (event.datetime_evento, event.id)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, event_id):
+        return event_id in self._where
+
+    def _add_series(self, event):
+        self._series.setdefault(event.user_id, {})[event.id] = event
+        self._where[event.id] = (event.user_id, None)
+
+    def add(self, event):
+        if event.id in self._where:
+            self.remove(event.id)
+        if recurrence.is_recurring(event):
+            self._add_series(event)
+            return
+        user_id = event.user_id
+        key = self._key(event)
+        keys = self._keys.setdefault(user_id, [])
+        pos = bisect.bisect_right(keys, key)
+        keys.insert(pos, key)
+        self._events.setdefault(user_id, []).insert(pos, event)
+        self._where[event.id] = (user_id, key)
+
+    def remove(self, event_id):
+        """Removes an event by ID and returns it (None if unknown)."""
+        where = self._where.pop(event_id, None)
+        if where is None:
+            return None
+        user_id, key = where
+        if key is None:
+            return self._series[user_id].pop(event_id)
+        keys = self._keys[user_id]
+        pos = bisect.bisect_left(keys, key)
+        del keys[pos]
+        return self._events[user_id].pop(pos)
+
+    def get(self, event_id):
+        where = self._where.get(event_id)
+        if where is None:
+            return None
+        user_id, key = where
+        if key is None:
+            return self._series[user_id][event_id]
+        keys = self._keys[user_id]
+        return self._events[user_id][bisect.bisect_left(keys, key)]
+
+    def between(self, user_id, start, end):
+        """Events of `user_id` with start <= datetime_evento < end, in order.
+        Occurrences of recurring series are new Event objects."""
+        keys = self._keys.get(user_id)
+        found = []
+        if keys:
+            lo = bisect.bisect_left(keys, (start,))
+            hi = bisect.bisect_left(keys, (end,), lo)
+            found = self._events[user_id][lo:hi]
+        series = self._series.get(user_id)
+        if not series:
+            return found
+        occurrences = recurrence.expand(series.values(), start, end)
+        return list(heapq.merge(found, occurrences, key=self._key))
+
+    def count_after(self, threshold):
+        """Number of events (all users) with datetime_evento >= threshold;
+        a series counts once if it has an occurrence from then on."""
+        return (sum(len(keys) - bisect.bisect_left(keys, (threshold,)) for keys in self._keys.values())
+                + sum(1 for series in self._series.values() for s in series.values()
+                      if recurrence.next_occurrence(s, threshold) is not None))
+
+    def for_user(self, user_id):
+        """Events of `user_id` in order; a series appears once, at its first occurrence."""
+        events = self._events.get(user_id, ())
+        series = sorted(self._series.get(user_id, {}).values(), key=self._key)
+        return list(heapq.merge(events, series, key=self._key))
+
+    def series(self, user_id=None):
+        """The recurring series of `user_id`, or of every user."""
+        if user_id is not None:
+            return list(self._series.get(user_id, {}).values())
+        return [s for series in self._series.values() for s in series.values()]
+
+    def _ended_series(self, threshold):
+        for series in self._series.values():
+            for event in series.values():
+                expires = recurrence.expires_at(event)
+                if expires is not None and expires < threshold:
+                    yield event
+
+    def expired(self, threshold):
+        """The events expire_before(threshold) would drop, without dropping
+        them: O(log N) per partition plus the expired events."""
+        found = list(self._ended_series(threshold))
+        for user_id, keys in self._keys.items():
+            found.extend(self._events[user_id][:bisect.bisect_left(keys, (threshold,))])
+        return found
+
+    def expire_before(self, threshold):
+        """Drops every event older than `threshold` (the sorted prefix of each
+        partition) and every series whose last occurrence is, and returns the
+        removed events."""
+        removed = list(self._ended_series(threshold))
+        for event in removed:
+            del self._series[event.user_id][event.id]
+        for user_id, keys in self._keys.items():
+            cut = bisect.bisect_left(keys, (threshold,))
+            if not cut:
+                continue
+            events = self._events[user_id]
+            removed.extend(events[:cut])
+            del keys[:cut]
+            del events[:cut]
+        for event in removed:
+            self._where.pop(event.id, None)
+        return removed
@@ -0,0 +1,90 @@
+import gzip
+import os
+import re
+import zlib
+import logging
+from utils import codec, recurrence, wal
+from utils.records import Event
+
+logger = logging.getLogger("discordbot")
+
+# Cold archive of expired agenda events.
+#
+# Events removed by the daily cleanup are appended to one gzip file per
+# month of their date, in an "archive" folder next to the agenda file
+# they came from (so each shard has its own):
+#
+#   archive/2025-03.ndjson.gz
+#
+# Every cleanup adds a gzip member of NDJSON lines to the file, which
+# gzip readers see as one stream. A month is read back line by line, so
+# a query never holds more than one record of the archive in memory.
+# Events are archived before they leave the live store; after a crash in
+# between they may be archived twice, and readers skip repeated IDs.
+
+ARCHIVE_DIR = "archive"
+_MONTH = re.compile(r'^(\d{4})-(\d{2})$')
+_SUFFIX = ".ndjson.gz"
+
+def directory_for(data_file):
+    return os.path.join(os.path.dirname(data_file), ARCHIVE_DIR)
+
+def month_of(event):
+    """The "YYYY-MM" partition of an event (of its last occurrence for a series)."""
+    when = recurrence.expires_at(event) or event.datetime_evento
+    return when.strftime("%Y-%m")
+
+def parse_month(text):
+    """Validates a "YYYY-MM" month. Raises ValueError."""
+    match = _MONTH.match(text.strip())
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Invalid month '{text}', use YYYY-MM")
+    return text.strip()
+
+def _path(directory, month):
+    return os.path.join(directory, month + _SUFFIX)
+
+def append(directory, events):
+    """Appends `events` to their monthly files. Returns how many were written."""
+    by_month = {}
+    for event in events:
+        by_month.setdefault(month_of(event), []).append(event)
+    if not by_month:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    mode = wal.fsync_mode()
+    for month, group in sorted(by_month.items()):
+        data = gzip.compress(b"".join(codec.dumps_line(e.to_dict()) + b"\n" for e in group))
+        with open(_path(directory, month), 'ab') as f:
+            f.write(data)
+            if mode != 'never':
+                f.flush()
+                os.fsync(f.fileno())
+    return sum(len(group) for group in by_month.values())
+
+def months(directory):
+    """Archived months, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len(_SUFFIX)] for name in names if name.endswith(_SUFFIX) and _MONTH.match(name[:-len(_SUFFIX)]))
+
+def read(directory, month, user_id=None):
+    """Yields the archived events of `month` ("YYYY-MM"), of `user_id` only
+    if given, in the order they were archived."""
+    path = _path(directory, month)
+    if not os.path.exists(path):
+        return
+    seen = set()
+    with gzip.open(path, 'rb') as f:
+        try:
+            for line in f:
+                data = codec.loads(line)
+                if data.get('id') in seen or (user_id is not None and data.get('user_id') != user_id):
+                    continue
+                seen.add(data.get('id'))
+                yield Event.from_dict(data)
+        except (EOFError, zlib.error, gzip.BadGzipFile, ValueError) as e:
+            # An append cut short by a crash: everything before it is intact
+            logger.warning(f"Archive {path} ends with a damaged record: {e}")
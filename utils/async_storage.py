@@ -0,0 +1,335 @@
+import asyncio
+import contextlib
+import datetime
+import logging
+from utils import storage, config, export
+from utils.day_views import DayViews
+from utils.journal import copy_item
+
+logger = logging.getLogger("discordbot")
+
+# Async facade over utils.storage for slash handlers and scheduler jobs.
+# Reads run in a worker thread. save_events/save_todo only stage the new
+# list and wake the writer task, which waits WRITE_COALESCE_MS for more
+# saves and then writes the latest list once. Reads see staged lists, and
+# every other mutation flushes them first, so callers always observe
+# their own writes. Read-modify-write sequences go through edit_events()
+# / edit_todo() so that two commands cannot overwrite each other's changes.
+# Lists are staged per partition (see storage.partition()), so with the
+# sharded layout an edit only rewrites the caller's files.
+# Day queries are answered from `day_views` (see utils.day_views), which
+# the event mutations below keep up to date. version() counts the changes
+# of each kind, for caches of other query results. Edits of the kinds in
+# _INCREMENTAL also stage the items they touched, so the save only has to
+# re-index those (see storage.save_todo()).
+# A staged save that fails stays staged and is retried with backoff. Until
+# it is written every other storage call raises WriteError instead of
+# running against a store that lacks it (a delete would otherwise be
+# undone when the stale list is finally written). write_failure() reports
+# the problem, and `alert` is awaited with a message once it persists.
+
+_SAVERS = {
+    'events': storage.save_events,
+    'todo': storage.save_todo,
+}
+_INCREMENTAL = ('todo',)
+
+_pending = {}               # (kind, partition) -> latest staged list
+_changes = {}               # (kind, partition) -> {id: item or None} staged since the last write, None if unknown
+_edit_locks = {}            # kind -> asyncio.Lock
+_write_lock = None
+_wakeup = None
+_writer_task = None
+_versions = {kind: 0 for kind in _SAVERS}
+_failure = None             # {'kind', 'since', 'attempts'} while staged saves keep failing
+alert = None                # async callable(message), set by the bot
+day_views = DayViews(config.DAY_VIEWS_MAX)
+
+class WriteError(RuntimeError):
+    """Staged saves could not be written, so the store lacks changes that
+    were already reported as done."""
+
+
+def _ensure_writer():
+    global _write_lock, _wakeup, _writer_task
+    if _write_lock is None:
+        _write_lock = asyncio.Lock()
+        _wakeup = asyncio.Event()
+        _edit_locks.update({kind: asyncio.Lock() for kind in _SAVERS})
+    if _writer_task is None or _writer_task.done():
+        _writer_task = asyncio.get_running_loop().create_task(_writer())
+
+async def _writer():
+    while True:
+        await _wakeup.wait()
+        _wakeup.clear()
+        await asyncio.sleep(config.WRITE_COALESCE_MS / 1000)
+        try:
+            async with _write_lock:
+                await _write_pending()
+        except WriteError as e:
+            delay = min(config.WRITE_RETRY_MAX_SECONDS, 2 ** _failure['attempts'])
+            logger.error(f"{e}; retrying in {delay} s")
+            await asyncio.sleep(delay)
+            _wakeup.set()
+        except Exception as e:
+            logger.exception(f"Error in storage writer: {e}")
+
+async def _write_pending():
+    """Writes every staged list. Must be called with _write_lock held.
+    Raises WriteError if one fails; it stays staged."""
+    global _failure
+    while _pending:
+        key, items = next(iter(_pending.items()))
+        kind, part = key
+        changes = _changes.get(key)
+        # Re-applying changes a newer stage merged in on top of these is harmless
+        args = (items, part) if changes is None else (items, part, dict(changes))
+        ok = await asyncio.to_thread(_SAVERS[kind], *args)
+        if not ok:
+            await _write_failed(kind)
+        # A newer save may have been staged while this one was writing
+        if _pending.get(key) is items:
+            del _pending[key]
+            _changes.pop(key, None)
+    if _failure is not None:
+        logger.info(f"Deferred saves written again after {_failure['attempts']} failed attempts")
+        _failure = None
+
+async def _write_failed(kind):
+    global _failure
+    if _failure is None:
+        _failure = {'kind': kind, 'since': datetime.datetime.now(), 'attempts': 0}
+    _failure['attempts'] += 1
+    attempts = _failure['attempts']
+    if attempts == config.WRITE_ALERT_ATTEMPTS and alert is not None:
+        try:
+            await alert(f"⚠️ Saving {kind} has failed {attempts} times since "
+                        f"{_failure['since'].strftime('%H:%M:%S')}. Recent changes are not on disk yet; "
+                        f"commands are refused until a retry succeeds.")
+        except Exception as e:
+            logger.exception(f"Error sending storage alert: {e}")
+    raise WriteError(f"Deferred save of {kind} failed ({attempts} attempts); keeping it staged")
+
+def write_failure():
+    """{'kind', 'since', 'attempts'} while staged saves keep failing, else None."""
+    return dict(_failure) if _failure is not None else None
+
+async def _locked(fn, *args, kind=None):
+    """Flushes staged saves, then runs a storage call in a worker thread.
+    Calls that modify `kind` also wait for open edits of it."""
+    _ensure_writer()
+    async with contextlib.AsyncExitStack() as stack:
+        if kind:
+            await stack.enter_async_context(_edit_locks[kind])
+        try:
+            async with _write_lock:
+                await _write_pending()
+                return await asyncio.to_thread(fn, *args)
+        finally:
+            if kind:
+                _versions[kind] += 1
+
+async def _load(kind, user_id, loader):
+    """The staged list of the partition, or `loader(user_id)` from storage.
+    A staged list of an overlapping partition is written first."""
+    part = storage.partition(user_id)
+    if (kind, part) in _pending:
+        return [copy_item(it) for it in _pending[(kind, part)]]
+    if any(k == kind and (p is None or part is None) for k, p in _pending):
+        return await _locked(loader, user_id)
+    return await asyncio.to_thread(loader, user_id)
+
+@contextlib.asynccontextmanager
+async def _edit(kind, user_id, loader):
+    _ensure_writer()
+    async with _edit_locks[kind]:
+        items = await loader(user_id)
+        original = [copy_item(it) for it in items]
+        yield items
+        changes = _changes_between(original, items)
+        if changes is None or changes or [it.id for it in items] != [it.id for it in original]:
+            _stage(kind, items, user_id, changes if kind in _INCREMENTAL else None)
+
+def _changes_between(original, items):
+    """{id: item, or None if it was removed} of the items an edit touched,
+    or None when items without a unique ID make that ambiguous."""
+    before = {it.id: it for it in original}
+    changes = {}
+    seen = set()
+    for it in items:
+        key = it.id
+        if not key or key in seen:
+            return None
+        seen.add(key)
+        if before.get(key) != it:
+            changes[key] = it
+    for key in before:
+        if key not in seen:
+            changes[key] = None
+    return changes
+
+async def flush():
+    """Writes all staged saves now and forces batched journal appends to
+    disk. Call on shutdown and in tests."""
+    _ensure_writer()
+    async with _write_lock:
+        await _write_pending()
+        await asyncio.to_thread(storage.sync)
+
+async def recover():
+    """Startup recovery of the data files; see storage.recover()."""
+    day_views.invalidate()
+    return await _locked(storage.recover)
+
+def version(kind):
+    """A number that changes whenever the 'events' or 'todo' data may have."""
+    return _versions[kind]
+
+def _stage(kind, items, user_id=None, changes=None):
+    _ensure_writer()
+    _versions[kind] += 1
+    key = (kind, storage.partition(user_id))
+    known = _changes.get(key, {}) if key in _pending else {}
+    _changes[key] = None if changes is None or known is None else {**known, **changes}
+    _pending[key] = [copy_item(it) for it in items]
+    if kind == 'events':
+        day_views.invalidate(user_id)
+    _wakeup.set()
+    return True
+
+# --- EVENTS ---
+
+async def load_events(user_id=None):
+    return await _load('events', user_id, storage.load_events)
+
+async def save_events(events, user_id=None):
+    return _stage('events', events, user_id)
+
+def edit_events(user_id=None):
+    """`async with edit_events() as events:` - mutate the list in place;
+    it is saved on exit if it changed. With `user_id`, the list may be
+    limited to that user's partition."""
+    return _edit('events', user_id, load_events)
+
+async def add_event(event):
+    try:
+        return await _locked(storage.add_event, event, kind='events')
+    finally:
+        day_views.added(event)
+
+async def delete_event(event_id, user_id=None):
+    try:
+        return await _locked(storage.delete_event, event_id, user_id, kind='events')
+    finally:
+        day_views.removed(event_id, user_id)
+
+async def purge_events_before(threshold):
+    try:
+        return await _locked(storage.purge_events_before, threshold, kind='events')
+    finally:
+        day_views.expired(threshold)
+
+async def count_events(after=None):
+    return await _locked(storage.count_events, after)
+
+async def events_between(user_id, start, end):
+    return await _locked(storage.events_between, user_id, start, end)
+
+async def events_for_user(user_id):
+    return await _locked(storage.events_for_user, user_id)
+
+async def day_view(user_id, date):
+    """The DayView of `user_id`'s events on `date`, built on first use."""
+    view = day_views.get(user_id, date)
+    if view is None:
+        generation = day_views.generation
+        start = datetime.datetime.combine(date, datetime.time.min)
+        events = await events_between(user_id, start, start + datetime.timedelta(days=1))
+        view = day_views.put(user_id, date, events, generation)
+    return view
+
+async def get_event(event_id, user_id=None):
+    return await _locked(storage.get_event, event_id, user_id)
+
+async def archived_months(user_id):
+    return await asyncio.to_thread(storage.archived_months, user_id)
+
+async def archived_events(user_id, month):
+    # The archive is append-only and read without the store lock
+    return await asyncio.to_thread(storage.archived_events, user_id, month)
+
+# --- TODO ---
+
+async def load_todo(user_id=None):
+    return await _load('todo', user_id, storage.load_todo)
+
+async def save_todo(items, user_id=None):
+    return _stage('todo', items, user_id)
+
+def edit_todo(user_id=None):
+    """`async with edit_todo(user_id) as items:` - mutate the list in place;
+    it is saved on exit if it changed. With `user_id`, the list may be
+    limited to that user's partition, so filter by user as before."""
+    return _edit('todo', user_id, load_todo)
+
+async def todos_for_user(user_id, done=None):
+    return await _locked(storage.todos_for_user, user_id, done)
+
+async def search_todo(user_id, query, limit=None):
+    return await _locked(storage.search_todo, user_id, query, limit)
+
+# --- FILES & BACKUPS ---
+
+async def data_file(kind, user_id):
+    """Path of the 'agenda' or 'todo' file holding `user_id`'s data."""
+    return await asyncio.to_thread(storage.data_file, kind, user_id)
+
+async def data_files(kind):
+    return await asyncio.to_thread(storage.data_files, kind)
+
+async def checkpoint(file_path):
+    return await _locked(storage.checkpoint, file_path)
+
+async def data_file_exists(file_path):
+    return await asyncio.to_thread(storage.os.path.exists, file_path)
+
+async def create_backup_file(file_path, keep=10):
+    return await _locked(storage.create_backup_file, file_path, keep)
+
+async def list_backups(file_path, details=False, limit=None):
+    return await asyncio.to_thread(storage.list_backups, file_path, details, limit)
+
+async def restore_backup(file_path, backup_filename):
+    try:
+        return await _locked(storage.restore_backup, file_path, backup_filename, kind=_kind_of(file_path))
+    finally:
+        if _kind_of(file_path) == 'events':
+            day_views.invalidate()
+
+async def clear_data_file(file_path):
+    try:
+        return await _locked(storage.clear_data_file, file_path, kind=_kind_of(file_path))
+    finally:
+        if _kind_of(file_path) == 'events':
+            day_views.invalidate()
+
+def _kind_of(file_path):
+    return {'todo': 'todo', 'agenda': 'events'}.get(storage.kind_of(file_path))
+
+async def export_events(fmt):
+    """Streams every event into CSV/NDJSON attachment files; see utils.export."""
+    # The generator only starts reading once the worker thread holds the lock
+    return await _locked(export.export_records, storage.iter_events(), export.EVENT_FIELDS, fmt, "agenda_export")
+
+async def export_todo(fmt):
+    return await _locked(export.export_records, storage.iter_todo(), export.TODO_FIELDS, fmt, "todo_export")
+
+async def export_data_file(file_path):
+    return await asyncio.to_thread(export.export_file, file_path)
+
+async def load_secret_2fa():
+    return await asyncio.to_thread(storage.load_secret_2fa)
+
+async def save_secret_2fa(secret):
+    return await asyncio.to_thread(storage.save_secret_2fa, secret)
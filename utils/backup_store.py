@@ -0,0 +1,375 @@
+import collections
+import hashlib
+import json
+import os
+import shutil
+import zlib
+import datetime
+import threading
+import logging
+
+logger = logging.getLogger("discordbot")
+
+# Content-addressed backup store.
+#
+# A snapshot is split into content-defined chunks: a chunk ends after a line
+# whose CRC matches BOUNDARY_MASK (once it holds at least MIN_CHUNK bytes),
+# or when it reaches MAX_CHUNK. Boundaries therefore follow the content, so
+# inserting or deleting a task only changes the chunks around it. Each chunk
+# is stored once under its SHA-256 in `chunks/`, and the snapshot itself is
+# a small manifest listing its chunks. Chunks are zlib-compressed on the
+# way to disk and decompressed while streaming a restore:
+#
+#   .todo.json.backups/
+#       todo.json.bak.20250101_120000.manifest
+#       chunks/ab/ab12....z
+#
+# Uncompressed chunks (manifest version 1) and plain full-copy backups from
+# older versions (no .manifest suffix) are still listed and restorable.
+#
+# Retention is tiered: besides the newest `keep` backups, prune() keeps the
+# newest backup of every hour for a day, of every day for a month and of
+# every month beyond that.
+#
+# Backup names and chunk reference counts are kept in memory, seeded from
+# one directory listing the first time a file is backed up. Rotating then
+# only touches the backups that expire and the chunks nobody else uses.
+
+MANIFEST_SUFFIX = ".manifest"
+COMPRESSED_SUFFIX = ".z"
+COMPRESS_LEVEL = 6
+MIN_CHUNK = 2 * 1024
+MAX_CHUNK = 64 * 1024
+READ_SIZE = 16 * 1024
+BOUNDARY_MASK = 0x3F
+STAMP_FORMAT = '%Y%m%d_%H%M%S'
+
+# (max age, bucket format): the newest backup of each bucket is kept
+RETENTION = (
+    (datetime.timedelta(days=1), '%Y%m%d%H'),
+    (datetime.timedelta(days=31), '%Y%m%d'),
+    (None, '%Y%m'),
+)
+
+_lock = threading.RLock()
+_rotations = {}             # (directory, prefix) -> Rotation
+_chunk_refs = {}            # backup dir -> {chunk path: manifests using it}
+
+def backup_dir(file_path):
+    return os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.backups")
+
+def _chunk_path(bak_dir, digest, compressed=True):
+    name = digest + COMPRESSED_SUFFIX if compressed else digest
+    return os.path.join(bak_dir, "chunks", digest[:2], name)
+
+def _is_compressed(manifest):
+    return manifest.get('compression') == 'zlib'
+
+def _chunk_files(bak_dir, manifest):
+    compressed = _is_compressed(manifest)
+    return {_chunk_path(bak_dir, chunk[0], compressed) for chunk in manifest['chunks']}
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning(f"Could not remove old backup {path}")
+
+def iter_chunks(f):
+    """Yields content-defined chunks read from the binary file `f`."""
+    buf = bytearray()
+    while True:
+        line = f.readline(MAX_CHUNK)
+        if not line:
+            break
+        buf += line
+        if len(buf) >= MAX_CHUNK or (len(buf) >= MIN_CHUNK and zlib.crc32(line) & BOUNDARY_MASK == 0):
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
+
+def _write_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _write_compressed(path, data):
+    """Streams `data` through a zlib encoder into `path`; returns bytes written."""
+    tmp_path = path + ".tmp"
+    encoder = zlib.compressobj(COMPRESS_LEVEL)
+    with open(tmp_path, 'wb') as f:
+        view = memoryview(data)
+        for pos in range(0, len(view), READ_SIZE):
+            f.write(encoder.compress(view[pos:pos + READ_SIZE]))
+        f.write(encoder.flush())
+        written = f.tell()
+    os.replace(tmp_path, path)
+    return written
+
+# --- ROTATION ---
+
+def _stamp_of(name):
+    try:
+        return datetime.datetime.strptime(name.rsplit('.bak.', 1)[1], STAMP_FORMAT)
+    except (IndexError, ValueError):
+        return None
+
+def retained(names, keep, now=None):
+    """The subset of `names` (newest first) that the retention policy keeps."""
+    now = now or datetime.datetime.now()
+    kept = set(names[:keep])
+    buckets = set()
+    for name in names:
+        stamp = _stamp_of(name)
+        if stamp is None:
+            kept.add(name)  # Never prune what we cannot date
+            continue
+        for max_age, bucket_format in RETENTION:
+            if max_age is None or now - stamp < max_age:
+                bucket = (bucket_format, stamp.strftime(bucket_format))
+                break
+        if bucket not in buckets:
+            buckets.add(bucket)
+            kept.add(name)
+    return kept
+
+class Rotation:
+    """The backups of one file, oldest first, kept in memory.
+
+    Plain rotation is a ring: adding a backup past `keep` expires exactly
+    the oldest one. Tiered rotation applies RETENTION to the (small) list
+    of backups instead. Neither looks at the directory again.
+    """
+
+    def __init__(self, names=(), tiered=False):
+        self.tiered = tiered
+        self._names = collections.deque(sorted(names))
+
+    def __len__(self):
+        return len(self._names)
+
+    def newest_first(self):
+        return list(reversed(self._names))
+
+    def add(self, name):
+        # Two backups within the same second share a name and a file
+        if not self._names or self._names[-1] != name:
+            self._names.append(name)
+
+    def expire(self, keep):
+        """Forgets the backups that fall out of the policy and returns them."""
+        if not self.tiered:
+            expired = []
+            while len(self._names) > keep:
+                expired.append(self._names.popleft())
+            return expired
+        kept = retained(self.newest_first(), keep)
+        expired = [n for n in self._names if n not in kept]
+        if expired:
+            self._names = collections.deque(n for n in self._names if n in kept)
+        return expired
+
+def _rotation(directory, prefix, tiered):
+    """The rotation of `directory`/`prefix*`, seeded by one listdir on first use."""
+    key = (directory, prefix)
+    rotation = _rotations.get(key)
+    if rotation is None:
+        names = set()
+        if os.path.isdir(directory):
+            for entry in os.listdir(directory):
+                if not entry.startswith(prefix) or entry.endswith('.tmp'):
+                    continue
+                names.add(entry[:-len(MANIFEST_SUFFIX)] if entry.endswith(MANIFEST_SUFFIX) else entry)
+        rotation = _rotations[key] = Rotation(names, tiered)
+    return rotation
+
+def _snapshot_rotation(file_path):
+    return _rotation(backup_dir(file_path), os.path.basename(file_path) + '.bak.', tiered=True)
+
+def _refs(bak_dir):
+    """Chunk reference counts of `bak_dir`, read from its manifests once."""
+    refs = _chunk_refs.get(bak_dir)
+    if refs is None:
+        refs = _chunk_refs[bak_dir] = collections.Counter()
+        if os.path.isdir(bak_dir):
+            for entry in os.listdir(bak_dir):
+                if entry.endswith(MANIFEST_SUFFIX):
+                    with open(os.path.join(bak_dir, entry), 'r', encoding='utf-8') as f:
+                        refs.update(_chunk_files(bak_dir, json.load(f)))
+    return refs
+
+def rotate_copy(file_path, keep):
+    """Keeps the current `file_path` as `<file>.bak.<stamp>` next to it and
+    deletes the copy that falls out of the newest `keep`. The copy is a
+    hard link where possible, so `file_path` never goes missing while the
+    caller replaces it."""
+    directory = os.path.dirname(file_path)
+    prefix = os.path.basename(file_path) + '.bak.'
+    name = prefix + datetime.datetime.now().strftime(STAMP_FORMAT)
+    with _lock:
+        rotation = _rotation(directory, prefix, tiered=False)
+        bak_path = os.path.join(directory, name)
+        _remove(bak_path)
+        try:
+            os.link(file_path, bak_path)
+        except OSError:
+            shutil.copy2(file_path, bak_path)
+        rotation.add(name)
+        for old in rotation.expire(keep):
+            _remove(os.path.join(directory, old))
+
+# --- SNAPSHOTS ---
+
+def create_snapshot(file_path, keep):
+    """Stores a snapshot of `file_path`, applies the retention policy and
+    returns the backup name."""
+    bak_dir = backup_dir(file_path)
+    base = os.path.basename(file_path)
+    stamp = datetime.datetime.now().strftime(STAMP_FORMAT)
+    name = f"{base}.bak.{stamp}"
+    with _lock:
+        rotation = _snapshot_rotation(file_path)
+        refs = _refs(bak_dir)
+        whole = hashlib.sha256()
+        chunks = []
+        size = stored = added = 0
+        with open(file_path, 'rb') as f:
+            for data in iter_chunks(f):
+                digest = hashlib.sha256(data).hexdigest()
+                whole.update(data)
+                path = _chunk_path(bak_dir, digest)
+                if os.path.exists(path):
+                    chunk_stored = os.path.getsize(path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    chunk_stored = _write_compressed(path, data)
+                    added += chunk_stored
+                size += len(data)
+                stored += chunk_stored
+                chunks.append([digest, len(data), chunk_stored])
+        manifest = {
+            'version': 2,
+            'source': base,
+            'created': datetime.datetime.now().isoformat(),
+            'compression': 'zlib',
+            'size': size,
+            'stored': stored,
+            'added': added,
+            'sha256': whole.hexdigest(),
+            'chunks': chunks,
+        }
+        # Same second as the previous backup: it is replaced
+        previous = read_manifest(file_path, name)
+        os.makedirs(bak_dir, exist_ok=True)
+        _write_atomic(os.path.join(bak_dir, name + MANIFEST_SUFFIX), json.dumps(manifest).encode('utf-8'))
+        refs.update(_chunk_files(bak_dir, manifest))
+        if previous is not None:
+            # Released only now, so chunks the new manifest shares are kept
+            _release(refs, _chunk_files(bak_dir, previous))
+        rotation.add(name)
+        logger.info(f"Backup {name}: {len(chunks)} chunks, {size} bytes compressed to {stored}, {added} bytes new on disk")
+        prune(file_path, keep)
+    return name
+
+def list_snapshots(file_path):
+    """Backup names for `file_path`, newest first (manifests and legacy copies)."""
+    with _lock:
+        return _snapshot_rotation(file_path).newest_first()
+
+def snapshot_info(file_path, name):
+    """Returns {'name', 'size', 'stored', 'added'} for a backup: original size,
+    compressed size of all its chunks and bytes it added to the store."""
+    manifest = read_manifest(file_path, name)
+    if manifest is None:
+        size = os.path.getsize(os.path.join(backup_dir(file_path), name))
+        return {'name': name, 'size': size, 'stored': size, 'added': size}
+    size = manifest['size']
+    stored = manifest.get('stored', size)
+    return {'name': name, 'size': size, 'stored': stored, 'added': manifest.get('added', stored)}
+
+def read_manifest(file_path, name):
+    path = os.path.join(backup_dir(file_path), name + MANIFEST_SUFFIX)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def restore_snapshot(file_path, name, dest_path):
+    """Streams backup `name` of `file_path` into `dest_path`."""
+    bak_dir = backup_dir(file_path)
+    manifest = read_manifest(file_path, name)
+    if manifest is None:
+        legacy = os.path.join(bak_dir, name)
+        if not os.path.exists(legacy):
+            raise FileNotFoundError(legacy)
+        with open(legacy, 'rb') as src, open(dest_path, 'wb') as dst:
+            for data in iter(lambda: src.read(MAX_CHUNK), b''):
+                dst.write(data)
+        return
+    compressed = _is_compressed(manifest)
+    whole = hashlib.sha256()
+    with open(dest_path, 'wb') as dst:
+        for chunk in manifest['chunks']:
+            decoder = zlib.decompressobj() if compressed else None
+            with open(_chunk_path(bak_dir, chunk[0], compressed), 'rb') as src:
+                for block in iter(lambda: src.read(READ_SIZE), b''):
+                    data = decoder.decompress(block) if decoder else block
+                    whole.update(data)
+                    dst.write(data)
+            if decoder:
+                data = decoder.flush()
+                whole.update(data)
+                dst.write(data)
+    if whole.hexdigest() != manifest['sha256']:
+        os.remove(dest_path)
+        raise ValueError(f"Backup {name} is corrupt (checksum mismatch)")
+
+def prune(file_path, keep):
+    """Applies the tiered retention policy (plus the newest `keep` backups),
+    deleting expired backups and the chunks only they referenced."""
+    bak_dir = backup_dir(file_path)
+    with _lock:
+        refs = _refs(bak_dir)
+        for name in _snapshot_rotation(file_path).expire(keep):
+            manifest = read_manifest(file_path, name)
+            _remove(os.path.join(bak_dir, name + MANIFEST_SUFFIX))
+            _remove(os.path.join(bak_dir, name))
+            if manifest is None:
+                continue
+            _release(refs, _chunk_files(bak_dir, manifest))
+
+def _release(refs, paths):
+    """Drops one reference to each chunk in `paths`, deleting the chunks
+    nothing references anymore."""
+    for path in paths:
+        refs[path] -= 1
+        if refs[path] <= 0:
+            del refs[path]
+            _remove(path)
+
+def collect_garbage(file_path):
+    """Full mark-and-sweep: removes chunk files that no manifest references
+    (e.g. left behind by an interrupted backup). Run at startup by
+    storage.recover(). Returns how many were removed."""
+    bak_dir = backup_dir(file_path)
+    chunks_dir = os.path.join(bak_dir, "chunks")
+    if not os.path.exists(chunks_dir):
+        return 0
+    removed = 0
+    with _lock:
+        _chunk_refs.pop(bak_dir, None)
+        live = _refs(bak_dir)
+        for sub in os.listdir(chunks_dir):
+            sub_path = os.path.join(chunks_dir, sub)
+            for entry in os.listdir(sub_path):
+                path = os.path.join(sub_path, entry)
+                if path not in live:
+                    _remove(path)
+                    removed += 1
+    if removed:
+        logger.info(f"Removed {removed} unreferenced backup chunks of {file_path}")
+    return removed
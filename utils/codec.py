@@ -0,0 +1,63 @@
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON codec for the data files. Uses orjson when it is installed and the
+# standard library otherwise. datetime values are turned into ISO strings
+# by the encoder itself, without a conversion pass over the records first.
+# The stdlib fallback writes compact JSON with one list element per line
+# (as schema._write_stream does), so that backups can still be split at
+# record boundaries (see utils.backup_store); `indent` would switch json to
+# its pure-Python encoder, which is several times slower on large files.
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+_encoder = json.JSONEncoder(ensure_ascii=False, default=_default)
+
+def _lines(obj):
+    """Compact JSON text of `obj` with the elements of its lists (at the
+    top level or in a top-level dict) on lines of their own."""
+    if isinstance(obj, list):
+        if not obj:
+            return "[]"
+        return "[\n  " + ",\n  ".join(_encoder.encode(v) for v in obj) + "\n]"
+    if isinstance(obj, dict):
+        return "{" + ", ".join(
+            f"{_encoder.encode(str(k))}: {_lines(v) if isinstance(v, list) else _encoder.encode(v)}"
+            for k, v in obj.items()
+        ) + "}"
+    return _encoder.encode(obj)
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj):
+    """Encodes `obj` as UTF-8 JSON bytes (indented with orjson, one record
+    per line otherwise)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_INDENT_2)
+    return _lines(obj).encode('utf-8')
+
+def dumps_line(obj):
+    """Encodes `obj` as UTF-8 JSON bytes on a single line."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, default=_default).encode('utf-8')
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+def write_file(path, obj):
+    data = dumps(obj)
+    with open(path, 'wb') as f:
+        f.write(data)
@@ -47,3 +47,52 @@ COMMANDS_CHANNEL_ID = get_int_env("COMMANDS_CHANNEL_ID", 0)
 AGENDA_FILE = os.path.join(DATA_DIR, "agenda.json")
 TODO_FILE = os.path.join(DATA_DIR, "todo.json")
 SECRET_2FA_FILE = os.path.join(DATA_DIR, "secret_2fa.json")
+JOBS_FILE = os.path.join(DATA_DIR, "jobs.db")
+
+def get_bool_env(name, default):
+    val = os.getenv(name)
+    if val is None or str(val).strip() == "":
+        return default
+    return str(val).strip().lower() in ("1", "true", "yes", "on")
+
+# Storage options
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+SQLITE_FILE = os.path.join(DATA_DIR, "bot.db")
+TODO_JOURNAL = get_bool_env("TODO_JOURNAL", False)
+AGENDA_JOURNAL = get_bool_env("AGENDA_JOURNAL", False)
+JOURNAL_MAX_BYTES = get_int_env("JOURNAL_MAX_BYTES", 1024 * 1024)
+
+# When writes are forced to disk: "always", "batched" (journal appends at
+# most FSYNC_BATCH_MS later) or "never" (see utils/wal.py)
+FSYNC_MODE = os.getenv("FSYNC_MODE", "batched").strip().lower()
+FSYNC_BATCH_MS = get_int_env("FSYNC_BATCH_MS", 100)
+WRITE_COALESCE_MS = get_int_env("WRITE_COALESCE_MS", 500)
+# A failed deferred save is retried with exponential backoff up to this
+# many seconds apart; the owner is alerted after WRITE_ALERT_ATTEMPTS tries
+WRITE_RETRY_MAX_SECONDS = get_int_env("WRITE_RETRY_MAX_SECONDS", 60)
+WRITE_ALERT_ATTEMPTS = get_int_env("WRITE_ALERT_ATTEMPTS", 3)
+
+# "single" keeps everyone's data in agenda.json/todo.json; "sharded" gives
+# each user their own files under SHARDS_DIR (JSON backend only)
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "single").strip().lower()
+SHARDS_DIR = os.path.join(DATA_DIR, "users")
+
+# Event reminders start this many minutes before an event and repeat every
+# REMINDER_INTERVAL_MINUTES until acknowledged (events can override both)
+REMINDER_START_MINUTES = get_int_env("REMINDER_START_MINUTES", 120)
+REMINDER_INTERVAL_MINUTES = get_int_env("REMINDER_INTERVAL_MINUTES", 15)
+# Reminder messages remembered for ✅ (least recently reminded events are
+# forgotten first)
+REMINDER_MESSAGES_MAX = get_int_env("REMINDER_MESSAGES_MAX", 1000)
+# Event reminders due within this many seconds of each other are sent as
+# one message
+REMINDER_BATCH_SECONDS = get_int_env("REMINDER_BATCH_SECONDS", 60)
+
+# How long (seconds) users and channels fetched over REST are reused
+RESOLVER_TTL_SECONDS = get_int_env("RESOLVER_TTL_SECONDS", 3600)
+
+# Per-day agenda views kept for the daily summary, /today and /tomorrow
+DAY_VIEWS_MAX = get_int_env("DAY_VIEWS_MAX", 64)
+
+# Exports larger than this are compressed or split (Discord attachment limit)
+EXPORT_MAX_BYTES = get_int_env("EXPORT_MAX_BYTES", 8 * 1024 * 1024)
@@ -0,0 +1,92 @@
+import collections
+from utils import recurrence
+
+# Materialised per-day agenda views.
+#
+# The midnight summary, /today and /tomorrow all show "the events of user U
+# on date D". A DayView holds that list, sorted by time, plus whatever the
+# callers rendered from it (embed fields, summary text), so repeating a
+# query costs a dict lookup. Views are kept per (user, date) in least
+# recently used order, at most `max_days` of them.
+#
+# Every agenda mutation drops the views it can affect, and only those:
+#   - a new one-off event: its day
+#   - a new series: every view of its user (occurrences can fall anywhere)
+#   - a deleted event or series: the views that contain it
+#   - the nightly cleanup: the days up to its threshold
+# A view built while a mutation ran is not stored (see `generation`).
+
+
+class DayView:
+    """Events of one user on one day, sorted by time, with rendered forms."""
+
+    __slots__ = ('user_id', 'date', 'events', '_rendered')
+
+    def __init__(self, user_id, date, events):
+        self.user_id = user_id
+        self.date = date
+        self.events = tuple(sorted(events, key=lambda e: e.datetime_evento))
+        self._rendered = {}
+
+    def rendered(self, key, render):
+        """`render(self)`, computed once per view and `key`."""
+        if key not in self._rendered:
+            self._rendered[key] = render(self)
+        return self._rendered[key]
+
+    def contains(self, event_id):
+        """True if the event, or an occurrence of the series, is in the view."""
+        return any(e.id == event_id or recurrence.split_id(e.id)[0] == event_id for e in self.events)
+
+
+class DayViews:
+    """DayViews by (user, date)."""
+
+    def __init__(self, max_days=None):
+        self.max_days = max_days
+        self.generation = 0         # bumped by every invalidation
+        self._views = collections.OrderedDict()     # (user_id, date) -> DayView
+
+    def __len__(self):
+        return len(self._views)
+
+    def get(self, user_id, date):
+        view = self._views.get((user_id, date))
+        if view is not None:
+            self._views.move_to_end((user_id, date))
+        return view
+
+    def put(self, user_id, date, events, generation=None):
+        """Builds the view of `events`. It is only kept if nothing was
+        invalidated since `generation` was read, i.e. while they were loaded."""
+        view = DayView(user_id, date, events)
+        if generation is None or generation == self.generation:
+            self._views[(user_id, date)] = view
+            self._views.move_to_end((user_id, date))
+            if self.max_days is not None:
+                while len(self._views) > self.max_days:
+                    self._views.popitem(last=False)
+        return view
+
+    def _drop(self, keys):
+        self.generation += 1
+        for key in keys:
+            del self._views[key]
+
+    def added(self, event):
+        if recurrence.is_recurring(event):
+            self.invalidate(event.user_id)
+        else:
+            self.invalidate(event.user_id, event.datetime_evento.date())
+
+    def removed(self, event_id, user_id=None):
+        self._drop([key for key, view in self._views.items()
+                    if (user_id is None or key[0] == user_id) and view.contains(event_id)])
+
+    def expired(self, threshold):
+        self._drop([key for key in self._views if key[1] <= threshold.date()])
+
+    def invalidate(self, user_id=None, date=None):
+        """Drops one day of a user, every day of a user, or everything."""
+        self._drop([key for key in self._views
+                    if (user_id is None or key[0] == user_id) and (date is None or key[1] == date)])
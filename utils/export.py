@@ -0,0 +1,150 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import discord
+from utils import config
+
+# Streaming exports. Records are encoded one line at a time and written
+# into spooled temp files (in memory up to SPOOL_MAX_BYTES, then on disk),
+# so memory stays flat however many records there are. An export that does
+# not fit in one attachment is gzip-compressed; if it still does not fit,
+# it is split on record boundaries into several standalone parts.
+
+SPOOL_MAX_BYTES = 1024 * 1024
+GZIP_SLACK = 64 * 1024      # data the encoder may still hold before flushing
+
+TODO_FIELDS = ('id', 'user_id', 'text', 'created', 'done', 'done_at', 'priority', 'tags')
+# Extra event keys a CSV row must keep too: recurrence (utils.recurrence)
+# and the reminder overrides (utils.reminders); empty for events without them
+EVENT_FIELDS = ('id', 'user_id', 'datetime_evento', 'evento', 'rrule', 'exdate', 'remind_before', 'nag_every')
+FORMATS = ('csv', 'ndjson')
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return ','.join(value)
+    # One record per line, so exports can be split between lines
+    return str(value).replace('\n', ' ')
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+def csv_lines(records, fields):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for record in records:
+        data = record.to_dict()
+        writer.writerow([_csv_value(data.get(f)) for f in fields])
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+
+def ndjson_lines(records):
+    for record in records:
+        yield (json.dumps(record.to_dict(), ensure_ascii=False, default=_json_default) + '\n').encode('utf-8')
+
+def _csv_header(fields):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(fields)
+    return buf.getvalue().encode('utf-8')
+
+def _pack(lines, header, limit, compress):
+    """Writes `lines` into spooled parts of at most `limit` bytes, each
+    starting with `header`."""
+    parts = []
+    spool = out = None
+    rows = 0
+
+    def start():
+        nonlocal spool, out, rows
+        if out is not spool:
+            out.close()
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        out = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+        out.write(header)
+        parts.append(spool)
+        rows = 0
+
+    start()
+    for line in lines:
+        size = spool.tell() + (GZIP_SLACK if compress else 0)
+        # A part always takes at least one record, even an oversized one
+        if rows and size + len(line) > limit:
+            start()
+        out.write(line)
+        rows += 1
+    if out is not spool:
+        out.close()
+    return parts
+
+def _reread(parts, header):
+    for part in parts:
+        part.seek(len(header))
+        yield from iter(part.readline, b'')
+
+def _as_file(spool):
+    # Before Python 3.11 SpooledTemporaryFile is not an io.IOBase, which
+    # discord.File requires; hand over the underlying file instead.
+    return spool if isinstance(spool, io.IOBase) else spool._file
+
+def export_records(records, fields, fmt, basename, limit=None):
+    """Streams `records` as CSV or NDJSON and returns [(filename, file), ...]
+    with every file under `limit` bytes. The caller closes the files."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    limit = limit or config.EXPORT_MAX_BYTES
+    if fmt == 'csv':
+        header, lines = _csv_header(fields), csv_lines(records, fields)
+    else:
+        header, lines = b'', ndjson_lines(records)
+    parts = _pack(lines, header, limit, compress=False)
+    suffix = fmt
+    if len(parts) > 1:
+        raw = parts
+        parts = _pack(_reread(raw, header), header, limit, compress=True)
+        for part in raw:
+            part.close()
+        suffix += '.gz'
+    files = []
+    for idx, part in enumerate(parts, start=1):
+        part.seek(0)
+        name = f"{basename}.{suffix}" if len(parts) == 1 else f"{basename}.part{idx}of{len(parts)}.{suffix}"
+        files.append((name, _as_file(part)))
+    return files
+
+def export_file(path, limit=None):
+    """Returns [(filename, file)] for an existing data file, gzip-compressed
+    through a spooled temp file if it is over `limit`. Raises ValueError if
+    even the compressed file does not fit."""
+    limit = limit or config.EXPORT_MAX_BYTES
+    name = os.path.basename(path)
+    if os.path.getsize(path) <= limit:
+        return [(name, open(path, 'rb'))]
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    with open(path, 'rb') as src, gzip.GzipFile(filename=name, fileobj=spool, mode='wb') as out:
+        for data in iter(lambda: src.read(SPOOL_MAX_BYTES), b''):
+            out.write(data)
+    if spool.tell() > limit:
+        spool.close()
+        raise ValueError(f"{name} is too large to attach even compressed")
+    spool.seek(0)
+    return [(name + '.gz', _as_file(spool))]
+
+async def send_files(interaction, files):
+    """Sends export files as follow-ups (one attachment per message, so each
+    request stays under the limit) and closes them."""
+    try:
+        for name, f in files:
+            await interaction.followup.send(file=discord.File(f, filename=name), ephemeral=True)
+    finally:
+        for _, f in files:
+            f.close()
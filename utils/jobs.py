@@ -0,0 +1,42 @@
+import logging
+
+logger = logging.getLogger("discordbot")
+
+# Functions run by the scheduler's persistent job store.
+#
+# A stored job keeps a reference to its function ("utils.jobs:remindme")
+# and its pickled arguments, so jobs cannot point at cog methods: they are
+# these module-level functions with plain arguments, which reach the cogs
+# through the bot registered with bind(). Jobs restored at startup may run
+# before the bot is connected, so each waits for it first.
+
+_bot = None
+
+def bind(bot):
+    global _bot
+    _bot = bot
+
+async def _cog(name):
+    await _bot.wait_until_ready()
+    cog = _bot.get_cog(name)
+    if cog is None:
+        logger.warning(f"Cog {name} not loaded, skipping scheduled job")
+    return cog
+
+async def remindme(user_id, message, due=None):
+    """A /remindme reminder. `due` is the ISO time it was set for."""
+    cog = await _cog('Utilities')
+    if cog:
+        await cog.send_single_reminder(user_id, message, due)
+
+async def pomodoro(user_id, minutes, cycle, cycles, label=None, notify_channel=False):
+    """End of Pomodoro cycle `cycle` of `cycles`."""
+    cog = await _cog('Utilities')
+    if cog:
+        await cog.pomodoro_cycle_done(user_id, minutes, cycle, cycles, label, notify_channel)
+
+async def event_reminders(event_id, user_id):
+    """Start (or, after a restart, resume) the reminders of an event."""
+    cog = await _cog('Agenda')
+    if cog:
+        await cog.start_event_reminders(event_id, user_id)
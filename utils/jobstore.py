@@ -0,0 +1,142 @@
+import os
+import pickle
+import sqlite3
+import threading
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+# APScheduler job store on a local SQLite file (JOBS_FILE), so scheduled
+# reminders survive restarts. It is APScheduler's SQLAlchemyJobStore
+# written against the sqlite3 module, as the rest of the bot's SQLite code
+# is, to avoid the extra dependency. Jobs are pickled, so their functions
+# must be importable by reference (see utils/jobs.py) and their arguments
+# plain data.
+#
+# The scheduler only ever asks for the next run time and the jobs that are
+# due, both answered from the index on next_run_time: startup cost and
+# memory do not grow with the number of pending jobs.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    next_run_time REAL,
+    job_state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_next_run_time ON jobs(next_run_time);
+"""
+
+
+class SQLiteJobStore(BaseJobStore):
+    """Stores jobs in the `jobs` table of an SQLite database file."""
+
+    def __init__(self, path, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.path = path
+        self.pickle_protocol = pickle_protocol
+        self.created = False        # True if start() created the database
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self.created = not os.path.exists(self.path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def lookup_job(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT job_state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("WHERE next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT next_run_time FROM jobs WHERE next_run_time IS NOT NULL ORDER BY next_run_time LIMIT 1"
+            ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def get_jobs_with_prefix(self, prefix):
+        """Jobs whose ID starts with `prefix`, read through the primary key
+        index instead of loading every job."""
+        return self._get_jobs("WHERE id >= ? AND id < ?", (prefix, prefix + "\U0010ffff"))
+
+    def add_job(self, job):
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                        (job.id, datetime_to_utc_timestamp(job.next_run_time), self._state(job))
+                    )
+            except sqlite3.IntegrityError:
+                raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with self._lock:
+            with self._conn:
+                cur = self._conn.execute(
+                    "UPDATE jobs SET next_run_time = ?, job_state = ? WHERE id = ?",
+                    (datetime_to_utc_timestamp(job.next_run_time), self._state(job), job.id)
+                )
+        if cur.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with self._lock:
+            with self._conn:
+                cur = self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        if cur.rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM jobs")
+
+    def shutdown(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _state(self, job):
+        return pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where="", params=()):
+        jobs = []
+        failed = []
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, job_state FROM jobs {where} ORDER BY next_run_time", params).fetchall()
+            for job_id, job_state in rows:
+                try:
+                    jobs.append(self._reconstitute_job(job_state))
+                except BaseException:
+                    self._logger.exception(f'Unable to restore job "{job_id}" -- removing it')
+                    failed.append((job_id,))
+            if failed:
+                with self._conn:
+                    self._conn.executemany("DELETE FROM jobs WHERE id = ?", failed)
+        return jobs
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (path={self.path})>"
@@ -0,0 +1,186 @@
+import os
+import threading
+import logging
+from utils import schema
+from utils.wal import WriteAheadLog
+
+logger = logging.getLogger("discordbot")
+
+
+def copy_item(item):
+    """Copies an item (a dict or a record) one level deep so callers can
+    mutate it freely."""
+    if not isinstance(item, dict):
+        return item.copy()
+    return {k: (list(v) if isinstance(v, list) else v) for k, v in item.items()}
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+
+class Journal:
+    """Append-only change log on top of a JSON list snapshot.
+
+    Items are records of `record_type` (see utils.records) keyed by their
+    `id`; on disk they are the usual list of dicts. Each save appends
+    `put`/`del` records only for the items that changed to a
+    WriteAheadLog, and loading replays them on top of the snapshot. Once
+    the journal grows past `max_bytes` a background thread folds it back
+    into a fresh snapshot.
+
+    Snapshot writes are serialised by `_snapshot_lock`, always taken before
+    `_lock`: the compactor holds it from copying the items to truncating
+    the journal, so a full snapshot written by save() can neither land in
+    between (and be overwritten by an older copy) nor share its temp file.
+    Appends only need `_lock` and go on while the compactor writes.
+    """
+
+    def __init__(self, path, write_snapshot, record_type, max_bytes=1024 * 1024):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.wal = WriteAheadLog(self.journal_path)
+        self.max_bytes = max_bytes
+        self._write_snapshot = write_snapshot
+        self._record_type = record_type
+        self._lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        self._items = None          # id -> item, in list order
+        self._signature = None
+        self._compactor = None
+
+    # --- PUBLIC API ---
+
+    def load(self):
+        with self._lock:
+            self._ensure_loaded()
+            return [copy_item(it) for it in self._items.values()]
+
+    def save(self, items):
+        with self._lock:
+            self._ensure_loaded()
+            ops = self._diff(items)
+            if ops is not None and len(ops) <= max(64, len(items) // 4):
+                return self._append(ops)
+        # Reordered lists or bulk changes are cheaper as a snapshot
+        with self._snapshot_lock, self._lock:
+            self._items = {(it.id or f"#{idx}"): copy_item(it) for idx, it in enumerate(items)}
+            self._write_snapshot(list(self._items.values()))
+            self.wal.truncate(None)
+            self._signature = self._stat()
+        return True
+
+    def compact(self):
+        """Folds the journal into the snapshot. Safe to call from any thread."""
+        with self._snapshot_lock:
+            with self._lock:
+                self._ensure_loaded()
+                items = list(self._items.values())
+                offset = self.wal.size()
+            if offset == 0:
+                return
+            self._write_snapshot(items)
+            with self._lock:
+                self.wal.truncate(offset)
+                self._signature = self._stat()
+        logger.info(f"Journal compacted into: {self.path}")
+
+    def recover(self):
+        """Replays the journal now (cutting off a torn tail) instead of on
+        first use. Returns the number of items."""
+        with self._lock:
+            self._items = None
+            self._ensure_loaded()
+            return len(self._items)
+
+    def sync(self):
+        """Forces batched journal appends to disk."""
+        self.wal.sync()
+
+    def reset(self):
+        """Drops the journal and in-memory state (after restores or deletes)."""
+        with self._lock:
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+            self._items = None
+            self._signature = None
+
+    # --- INTERNALS ---
+
+    def _stat(self):
+        return (file_signature(self.path), file_signature(self.journal_path))
+
+    def _ensure_loaded(self):
+        sig = self._stat()
+        if self._items is not None and sig == self._signature:
+            return
+        items = {}
+        if os.path.exists(self.path):
+            for idx, data in enumerate(schema.read_items(self.path)):
+                it = self._record_type.from_dict(data)
+                items[it.id or f"#{idx}"] = it
+        if os.path.exists(self.journal_path):
+            self._replay(items)
+        self._items = items
+        self._signature = self._stat()
+
+    def _replay(self, items):
+        for record in self.wal.replay():
+            if record.get('op') == 'put':
+                item = self._record_type.from_dict(record['item'])
+                items[item.id] = item
+            elif record.get('op') == 'del':
+                items.pop(record['id'], None)
+
+    def _diff(self, items):
+        """Returns the put/del ops turning the current state into `items`,
+        or None when the change cannot be expressed as a journal append."""
+        new = {}
+        for it in items:
+            key = it.id
+            if not key or key in new:
+                return None
+            new[key] = it
+        kept = [k for k in self._items if k in new]
+        if list(new)[:len(kept)] != kept:
+            return None
+        ops = [('del', k) for k in self._items if k not in new]
+        for key, it in new.items():
+            if self._items.get(key) != it:
+                ops.append(('put', it))
+        return ops
+
+    def _append(self, ops):
+        """Journals `ops`. Must be called with _lock held."""
+        if ops:
+            records = []
+            for op, payload in ops:
+                if op == 'put':
+                    records.append({'op': 'put', 'item': payload.to_dict()})
+                    self._items[payload.id] = copy_item(payload)
+                else:
+                    records.append({'op': 'del', 'id': payload})
+                    self._items.pop(payload, None)
+            self.wal.append(records)
+            self._signature = self._stat()
+            if self._signature[1] and self._signature[1][1] > self.max_bytes:
+                self._start_compactor()
+        return True
+
+    def _start_compactor(self):
+        if self._compactor and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_worker, name="journal-compactor", daemon=True)
+        self._compactor.start()
+
+    def _compact_worker(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.exception(f"Error compacting journal {self.journal_path}: {e}")
@@ -0,0 +1,57 @@
+import collections
+
+
+class MessageIndex:
+    """Reminder messages sent for each event, and the events of each message.
+
+    A message can remind of several events at once. Both directions are
+    dicts, so finding an event's messages or forgetting them costs
+    O(messages of that event). Events are kept in least recently used
+    order; once more than `max_messages` messages are indexed, the least
+    recently used events are dropped whole.
+    """
+
+    def __init__(self, max_messages=None):
+        self.max_messages = max_messages
+        self._by_event = collections.OrderedDict()  # event_id -> {message_id: channel_id}
+        self._events_of = {}                        # message_id -> {event_id, ...}
+
+    def __len__(self):
+        return len(self._events_of)
+
+    def __contains__(self, message_id):
+        return message_id in self._events_of
+
+    def add(self, event_id, channel_id, message_id):
+        messages = self._by_event.get(event_id)
+        if messages is None:
+            messages = self._by_event[event_id] = {}
+        else:
+            self._by_event.move_to_end(event_id)
+        messages[message_id] = channel_id
+        self._events_of.setdefault(message_id, set()).add(event_id)
+        if self.max_messages is not None:
+            while len(self._events_of) > self.max_messages and len(self._by_event) > 1:
+                self.pop(next(iter(self._by_event)))
+
+    def events_of(self, message_id):
+        """IDs of the events a message still reminds of."""
+        return set(self._events_of.get(message_id, ()))
+
+    def messages_of(self, event_id):
+        """{message_id: channel_id} of an event's messages."""
+        return dict(self._by_event.get(event_id, ()))
+
+    def pop(self, event_id):
+        """Forgets an event's messages. Returns those left reminding of no
+        other event, as {message_id: channel_id}."""
+        orphans = {}
+        for message_id, channel_id in self._by_event.pop(event_id, {}).items():
+            events = self._events_of.get(message_id)
+            if events is None:
+                continue
+            events.discard(event_id)
+            if not events:
+                del self._events_of[message_id]
+                orphans[message_id] = channel_id
+        return orphans
@@ -0,0 +1,230 @@
+import asyncio
+import itertools
+import logging
+import time
+import discord
+
+logger = logging.getLogger("discordbot")
+
+# Outbound queue for the messages the bot sends on its own (reminders,
+# summaries, Pomodoro, the command list), so that bursts - a restart
+# catching up, the midnight summary on top of event nags - go out in order
+# of importance instead of racing each other for the rate limits.
+#
+# Every send, edit or delete is queued with a priority class:
+#   URGENT  event nags, /remindme
+#   NORMAL  daily summary, Pomodoro
+#   LOW     command list, clean-up of old reminder messages
+# and a route, the channel (or user, for DMs) it goes to. Each route has a
+# token bucket sized after Discord's per-channel limit (5 messages per 5
+# seconds); calls whose route is out of tokens wait aside for a refill,
+# without holding up other routes, and then go back to the queue in their
+# original order. Higher classes always go first.
+#
+# discord.py waits out short rate limits itself; longer ones are raised
+# as RateLimited (see max_ratelimit_timeout in bot.py) and, like a 429 or
+# a Discord server error, retried here after `retry_after`, so a waiting
+# call never blocks a worker. Calls are dropped when the queue is full
+# (URGENT ones are always accepted), when they expire before they can be
+# sent, or after MAX_ATTEMPTS; a dropped call resolves to None.
+
+URGENT, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = {URGENT: 'urgent', NORMAL: 'normal', LOW: 'low'}
+
+ROUTE_BURST = 5             # calls a route can make at once
+ROUTE_PER_SECOND = 1.0      # and its refill rate
+MAX_DEPTH = 500
+MAX_ATTEMPTS = 4
+WORKERS = 2
+
+def route_of(target):
+    """Rate-limit route of a messageable: a user's DMs or a channel."""
+    if isinstance(target, (discord.User, discord.Member)):
+        return f"dm:{target.id}"
+    return f"channel:{target.id}"
+
+
+class TokenBucket:
+    """`burst` tokens, refilled at `rate` per second."""
+
+    def __init__(self, burst=ROUTE_BURST, rate=ROUTE_PER_SECOND):
+        self.burst = burst
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self, now=None):
+        """Takes a token. Returns 0, or the seconds to wait for one."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, seconds, now=None):
+        """No tokens for `seconds` (a rate limit reported by Discord)."""
+        now = time.monotonic() if now is None else now
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class _Call:
+    __slots__ = ('priority', 'seq', 'route', 'fn', 'future', 'queued', 'expires', 'attempts')
+
+    def __init__(self, priority, seq, route, fn, future, expires):
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.fn = fn
+        self.future = future
+        self.queued = time.monotonic()
+        self.expires = expires
+        self.attempts = 0
+
+
+class Outbox:
+    """Priority queue of outbound Discord calls with per-route rate limits."""
+
+    def __init__(self, workers=WORKERS, max_depth=MAX_DEPTH):
+        self.workers = workers
+        self.max_depth = max_depth
+        self._queue = None          # asyncio.PriorityQueue of (priority, seq, call)
+        self._tasks = []
+        self._buckets = {}          # route -> TokenBucket
+        self._waiting = {}          # route -> calls waiting for a token
+        self._seq = itertools.count()
+        self._depth = {p: 0 for p in PRIORITY_NAMES}
+        self._stats = {'sent': 0, 'retried': 0, 'dropped_full': 0, 'dropped_expired': 0,
+                       'dropped_failed': 0, 'wait_seconds': 0.0, 'wait_max': 0.0}
+
+    def send(self, target, priority=NORMAL, expires=None, **kwargs):
+        """Queues `target.send(**kwargs)`. Returns a future of the Message
+        (None if the call was dropped). `expires` is a delay in seconds
+        after which the message is not worth sending anymore."""
+        return self.call(route_of(target), lambda: target.send(**kwargs), priority, expires)
+
+    def call(self, route, fn, priority=NORMAL, expires=None):
+        """Queues `await fn()` on `route`. Returns a future of its result."""
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        if priority != URGENT and self.depth() >= self.max_depth:
+            self._stats['dropped_full'] += 1
+            logger.warning(f"Outbound queue full, dropping {PRIORITY_NAMES[priority]} call to {route}")
+            future.set_result(None)
+            return future
+        deadline = time.monotonic() + expires if expires is not None else None
+        self._depth[priority] += 1
+        self._put(_Call(priority, next(self._seq), route, fn, future, deadline))
+        return future
+
+    def depth(self):
+        return sum(self._depth.values())
+
+    def stats(self):
+        """Queue depth per class, wait before sending and drop counters."""
+        stats = dict(self._stats)
+        stats['depth'] = {PRIORITY_NAMES[p]: n for p, n in self._depth.items()}
+        stats['wait_avg_ms'] = stats.pop('wait_seconds') / stats['sent'] * 1000 if stats['sent'] else 0.0
+        stats['wait_max_ms'] = stats.pop('wait_max') * 1000
+        return stats
+
+    async def stop(self, timeout=5):
+        """Gives queued calls up to `timeout` seconds, then drops the rest."""
+        deadline = time.monotonic() + timeout
+        while self.depth() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        while self._queue is not None and not self._queue.empty():
+            self._finish(self._queue.get_nowait()[2], None)
+        for calls in self._waiting.values():
+            for call in calls:
+                self._finish(call, None)
+        self._waiting.clear()
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.get_running_loop().create_task(self._work()))
+
+    def _put(self, call):
+        self._queue.put_nowait((call.priority, call.seq, call))
+
+    def _wait(self, call, delay):
+        """Sets `call` aside until its route has tokens again."""
+        waiting = self._waiting.get(call.route)
+        if waiting is None:
+            waiting = self._waiting[call.route] = []
+            asyncio.get_running_loop().call_later(delay, self._release, call.route)
+        waiting.append(call)
+
+    def _release(self, route):
+        for call in self._waiting.pop(route, ()):
+            self._put(call)
+
+    def _finish(self, call, result):
+        self._depth[call.priority] -= 1
+        if not call.future.done():
+            call.future.set_result(result)
+
+    async def _work(self):
+        while True:
+            _, _, call = await self._queue.get()
+            now = time.monotonic()
+            if call.expires is not None and now >= call.expires:
+                self._stats['dropped_expired'] += 1
+                self._finish(call, None)
+                continue
+            bucket = self._buckets.get(call.route)
+            if bucket is None:
+                bucket = self._buckets[call.route] = TokenBucket()
+            wait = bucket.take(now)
+            if wait > 0:
+                self._wait(call, wait)
+                continue
+            await self._attempt(call, bucket)
+
+    async def _attempt(self, call, bucket):
+        call.attempts += 1
+        started = time.monotonic()
+        try:
+            result = await call.fn()
+        except Exception as e:
+            retry_after = self._retry_after(e, call.attempts)
+            if retry_after is not None and call.attempts < MAX_ATTEMPTS:
+                self._stats['retried'] += 1
+                logger.warning(f"Outbound call to {call.route} failed ({e}), retrying in {retry_after:.1f}s")
+                bucket.block(retry_after)
+                self._put(call)
+                return
+            self._stats['dropped_failed'] += 1
+            logger.exception(f"Error in outbound call to {call.route}: {e}")
+            self._finish(call, None)
+            return
+        waited = started - call.queued
+        self._stats['sent'] += 1
+        self._stats['wait_seconds'] += waited
+        self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+        self._finish(call, result)
+
+    @staticmethod
+    def _retry_after(error, attempts):
+        """Seconds to wait before retrying after `error`, or None if it is final."""
+        if isinstance(error, discord.RateLimited):
+            return error.retry_after
+        if isinstance(error, discord.HTTPException):
+            if error.status == 429:
+                try:
+                    return float(error.response.headers.get('Retry-After', 1))
+                except (AttributeError, TypeError, ValueError):
+                    return 1.0
+            if error.status >= 500:
+                return float(2 ** attempts)
+        return None
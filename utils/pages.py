@@ -0,0 +1,139 @@
+import collections
+import logging
+import discord
+
+logger = logging.getLogger("discordbot")
+
+# Paginated listings (/all, /month, /todo-list).
+#
+# A listing is loaded once into a Pages object: the items, already in
+# display order, and the pages rendered from them so far. A page is a
+# slice of the items rendered into an embed the first time it is shown,
+# so flipping back and forth never re-reads or re-sorts the store.
+# Listings keeps the Pages of recent listings together with the data
+# version they were loaded at (async_storage.version()) and only loads a
+# listing again after its data changed. PageView is the ◀/▶ message
+# component moving a cursor over the pages.
+
+EMBED_DESCRIPTION_MAX = 4096
+EMBED_FIELD_MAX = 1024
+EMBED_TOTAL_MAX = 6000      # title, description, fields and footer together
+
+def clip(text, limit):
+    """`text` cut to at most `limit` characters."""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class Pages:
+    """`items` split into pages of `per_page`, each rendered on first use
+    by `render(items, first, total)`: the page's items, the position of the
+    first one in the listing and the size of the listing. `split(items)`,
+    if given, yields the position of the first item of each page instead,
+    for listings whose pages must also fit EMBED_TOTAL_MAX."""
+
+    def __init__(self, items, per_page, render, version=None, split=None):
+        self.items = items
+        self.per_page = per_page
+        self.render = render
+        self.version = version
+        starts = split(items) if split is not None else range(0, len(items), per_page)
+        self._starts = list(starts) or [0]
+        self._rendered = {}
+
+    def __len__(self):
+        return len(self._starts)
+
+    def page(self, number):
+        """The embed of page `number` (from 0)."""
+        embed = self._rendered.get(number)
+        if embed is None:
+            first = self._starts[number]
+            end = self._starts[number + 1] if number + 1 < len(self._starts) else len(self.items)
+            embed = self.render(self.items[first:end], first, len(self.items))
+            if len(self) > 1:
+                embed.set_footer(text=f"Page {number + 1}/{len(self)}")
+            self._rendered[number] = embed
+        return embed
+
+
+class Listings:
+    """Pages of recent listings by key, at most `max_entries` of them."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._pages = collections.OrderedDict()     # key -> Pages
+
+    async def get(self, key, version, load, per_page, render, split=None):
+        """The Pages of listing `key`; `await load()` gives its items and is
+        only called if there are none yet for data `version`."""
+        pages = self._pages.get(key)
+        if pages is None or pages.version != version:
+            pages = Pages(await load(), per_page, render, version, split)
+            self._pages[key] = pages
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+        return pages
+
+
+class PageView(discord.ui.View):
+    """◀/▶ buttons over the Pages returned by `await source()`, asked again
+    on every flip so that a change to the data shows up. Only `owner_id`
+    can use them."""
+
+    def __init__(self, source, owner_id, timeout=300):
+        super().__init__(timeout=timeout)
+        self.source = source
+        self.owner_id = owner_id
+        self.cursor = 0
+        self.message = None
+
+    async def send(self, interaction: discord.Interaction):
+        """Sends page 1 as the (ephemeral) response to `interaction`, or as
+        a followup if the response was deferred."""
+        pages = await self.source()
+        kwargs = {'embed': pages.page(0), 'ephemeral': True}
+        if len(pages) > 1:
+            self._update_buttons(pages)
+            kwargs['view'] = self
+        if interaction.response.is_done():
+            message = await interaction.followup.send(wait=True, **kwargs)
+        else:
+            await interaction.response.send_message(**kwargs)
+            message = await interaction.original_response() if len(pages) > 1 else None
+        if len(pages) > 1:
+            self.message = message
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.cursor - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.cursor + 1)
+
+    async def _show(self, interaction, cursor):
+        try:
+            pages = await self.source()
+            self.cursor = max(0, min(cursor, len(pages) - 1))
+            self._update_buttons(pages)
+            await interaction.response.edit_message(embed=pages.page(self.cursor), view=self)
+        except Exception as e:
+            logger.exception(f"Error changing page: {e}")
+
+    def _update_buttons(self, pages):
+        self.previous_page.disabled = self.cursor == 0
+        self.next_page.disabled = self.cursor >= len(pages) - 1
+
+    async def on_timeout(self):
+        if self.message is None:
+            return
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,133 @@
+import datetime
+
+# In-memory record types for agenda events and To-Do tasks.
+#
+# Both use __slots__, so a record is a fixed-size object instead of a dict
+# with its own hash table. Files and database rows still use plain dicts:
+# from_dict()/to_dict() convert at the storage boundary, and keys a record
+# does not know about are kept in `extra` so they survive a round trip.
+
+
+class Event:
+    """An agenda event.
+
+    `datetime_evento` may be given as a datetime or as the ISO string read
+    from disk; a string is parsed the first time the attribute is read.
+    """
+
+    __slots__ = ('id', 'user_id', '_datetime', 'evento', 'extra')
+
+    KEYS = frozenset(('id', 'user_id', 'datetime_evento', 'evento'))
+
+    def __init__(self, id, user_id, datetime_evento, evento, extra=None):
+        self.id = id
+        self.user_id = user_id
+        self._datetime = datetime_evento
+        self.evento = evento
+        self.extra = extra
+
+    @property
+    def datetime_evento(self):
+        value = self._datetime
+        if isinstance(value, str):
+            value = self._datetime = datetime.datetime.fromisoformat(value)
+        return value
+
+    @datetime_evento.setter
+    def datetime_evento(self, value):
+        self._datetime = value
+
+    def isoformat(self):
+        """The event time as an ISO string, without parsing it."""
+        value = self._datetime
+        return value if isinstance(value, str) or value is None else value.isoformat()
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = None
+        if data.keys() - cls.KEYS:
+            extra = {k: v for k, v in data.items() if k not in cls.KEYS}
+        return cls(data.get('id'), data.get('user_id'), data.get('datetime_evento'), data.get('evento'), extra)
+
+    def to_dict(self):
+        data = {'id': self.id, 'user_id': self.user_id, 'datetime_evento': self._datetime, 'evento': self.evento}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def copy(self):
+        return Event(self.id, self.user_id, self._datetime, self.evento, dict(self.extra) if self.extra else None)
+
+    def __eq__(self, other):
+        if not isinstance(other, Event):
+            return NotImplemented
+        return (self.id == other.id and self.user_id == other.user_id and self.evento == other.evento
+                and self.datetime_evento == other.datetime_evento and (self.extra or None) == (other.extra or None))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Event(id={self.id!r}, user_id={self.user_id!r}, datetime_evento={self._datetime!r}, evento={self.evento!r})"
+
+
+class Todo:
+    """A To-Do task. `priority`, `tags` and `done_at` are None until set."""
+
+    __slots__ = ('id', 'user_id', 'text', 'created', 'done', 'done_at', 'priority', 'tags', 'extra')
+
+    KEYS = frozenset(('id', 'user_id', 'text', 'created', 'done', 'done_at', 'priority', 'tags'))
+
+    def __init__(self, id, user_id, text, created=None, done=False, done_at=None, priority=None, tags=None, extra=None):
+        self.id = id
+        self.user_id = user_id
+        self.text = text
+        self.created = created
+        self.done = done
+        self.done_at = done_at
+        self.priority = priority
+        self.tags = tags
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = None
+        if data.keys() - cls.KEYS:
+            extra = {k: v for k, v in data.items() if k not in cls.KEYS}
+        return cls(
+            data.get('id'), data.get('user_id'), data.get('text'), data.get('created'),
+            data.get('done', False), data.get('done_at'), data.get('priority'), data.get('tags'), extra
+        )
+
+    def to_dict(self):
+        data = {'id': self.id, 'user_id': self.user_id, 'text': self.text}
+        if self.created is not None:
+            data['created'] = self.created
+        data['done'] = self.done
+        if self.done_at is not None:
+            data['done_at'] = self.done_at
+        if self.priority is not None:
+            data['priority'] = self.priority
+        if self.tags is not None:
+            data['tags'] = self.tags
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def copy(self):
+        return Todo(
+            self.id, self.user_id, self.text, self.created, self.done, self.done_at, self.priority,
+            list(self.tags) if self.tags is not None else None, dict(self.extra) if self.extra else None
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, Todo):
+            return NotImplemented
+        return (self.id == other.id and self.user_id == other.user_id and self.text == other.text
+                and self.created == other.created and self.done == other.done and self.done_at == other.done_at
+                and self.priority == other.priority and self.tags == other.tags
+                and (self.extra or None) == (other.extra or None))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Todo(id={self.id!r}, user_id={self.user_id!r}, text={self.text!r}, done={self.done!r})"
@@ -0,0 +1,264 @@
+import calendar
+import datetime
+import functools
+from datetime import timedelta
+from utils.records import Event
+
+# Recurring agenda events.
+#
+# A series is stored once, as an event whose `datetime_evento` is the first
+# occurrence and whose extra keys hold an RRULE-style rule and the
+# occurrences removed from it:
+#
+#   {"id": "...", "datetime_evento": "2025-03-03T10:00:00", "evento": "Standup",
+#    "rrule": "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=2025-06-30", "exdate": ["2025-03-05T10:00:00"]}
+#
+# Supported rule parts: FREQ (DAILY, WEEKLY, MONTHLY), INTERVAL, BYDAY
+# (MO..SU; for MONTHLY also with an ordinal, e.g. 2TU or -1FR), UNTIL
+# (a date or date-time, inclusive) and COUNT (counted before EXDATE is
+# applied, as in RFC 5545). Occurrences keep the time of day of the first
+# one and are generated lazily, only for the window a query asks for.
+#
+# An occurrence is returned as an Event with the ID "<series id>@<YYYYmmddTHHMM>"
+# so reminders, acknowledgements and deletes can address a single one.
+
+RULE_KEY = 'rrule'
+EXDATE_KEY = 'exdate'
+SERIES_KEY = 'series'
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+_ID_FORMAT = "%Y%m%dT%H%M"
+
+
+class Rule:
+    """A parsed recurrence rule."""
+
+    __slots__ = ('freq', 'interval', 'byday', 'until', 'count')
+
+    def __init__(self, freq, interval=1, byday=(), until=None, count=None):
+        self.freq = freq
+        self.interval = interval
+        self.byday = byday          # ((ordinal or None, weekday 0-6), ...)
+        self.until = until
+        self.count = count
+
+
+def _parse_until(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y%m%dT%H%M%S")
+    except ValueError:
+        pass
+    try:
+        until = datetime.datetime.strptime(value, "%Y%m%d")
+    except ValueError:
+        until = datetime.datetime.fromisoformat(value)
+    # A bare date (20250105 or 2025-01-05) includes that whole day
+    return until if 'T' in value or ' ' in value else until.replace(hour=23, minute=59, second=59)
+
+def _parse_byday(value):
+    days = []
+    for part in value.split(','):
+        part = part.strip().upper()
+        ordinal, day = part[:-2], part[-2:]
+        if day not in WEEKDAYS:
+            raise ValueError(f"Unknown weekday '{part}'")
+        ordinal = int(ordinal) if ordinal not in ('', '+') else None
+        if ordinal == 0 or (ordinal is not None and abs(ordinal) > 5):
+            raise ValueError(f"Invalid weekday ordinal '{part}'")
+        days.append((ordinal, WEEKDAYS.index(day)))
+    return tuple(days)
+
+@functools.lru_cache(maxsize=256)
+def parse_rule(text):
+    """Parses an RRULE string ("FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10"). A bare
+    frequency ("weekly") is accepted as well. Raises ValueError."""
+    parts = {}
+    for item in text.strip().removeprefix('RRULE:').split(';'):
+        if not item.strip():
+            continue
+        key, sep, value = item.partition('=')
+        if not sep:
+            key, value = 'FREQ', key
+        parts[key.strip().upper()] = value.strip()
+    freq = parts.pop('FREQ', '').upper()
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+    interval = int(parts.pop('INTERVAL', 1))
+    if interval < 1:
+        raise ValueError("INTERVAL must be positive")
+    byday = _parse_byday(parts.pop('BYDAY')) if 'BYDAY' in parts else ()
+    if freq != 'MONTHLY' and any(ordinal for ordinal, _ in byday):
+        raise ValueError("BYDAY ordinals are only valid with FREQ=MONTHLY")
+    until = _parse_until(parts.pop('UNTIL')) if 'UNTIL' in parts else None
+    count = int(parts.pop('COUNT')) if 'COUNT' in parts else None
+    if count is not None and count < 1:
+        raise ValueError("COUNT must be positive")
+    if parts:
+        raise ValueError(f"Unsupported rule parts: {', '.join(parts)}")
+    return Rule(freq, interval, byday, until, count)
+
+def _daily_weekdays(rule, dtstart):
+    """Weekdays a DAILY rule's periods can fall on: with an INTERVAL that is
+    a multiple of 7 every period is on dtstart's weekday."""
+    return {(dtstart.weekday() + step * rule.interval) % 7 for step in range(7)}
+
+def check_start(rule, dtstart):
+    """Raises ValueError if `rule` can never produce an occurrence for a
+    series starting at `dtstart`."""
+    if rule.freq == 'DAILY' and rule.byday:
+        weekdays = {weekday for _, weekday in rule.byday}
+        if not weekdays & _daily_weekdays(rule, dtstart):
+            raise ValueError(f"BYDAY never matches: every {rule.interval} days from "
+                             f"{WEEKDAYS[dtstart.weekday()]} always falls on {WEEKDAYS[dtstart.weekday()]}")
+
+def is_recurring(event):
+    return bool(event.extra and event.extra.get(RULE_KEY))
+
+def _rule(event):
+    return parse_rule(event.extra[RULE_KEY])
+
+def _exdates(event):
+    return {datetime.datetime.fromisoformat(d) for d in event.extra.get(EXDATE_KEY) or ()}
+
+def _month_days(year, month, byday):
+    """Days of the month matching BYDAY, in order."""
+    first_weekday, length = calendar.monthrange(year, month)
+    days = set()
+    for ordinal, weekday in byday:
+        matching = [d for d in range(1 + (weekday - first_weekday) % 7, length + 1, 7)]
+        if ordinal is None:
+            days.update(matching)
+        elif -len(matching) <= ordinal <= len(matching):
+            days.add(matching[ordinal - 1 if ordinal > 0 else ordinal])
+    return sorted(days)
+
+def _period_of(rule, dtstart, when):
+    """Index of the period (day, week or month, in INTERVAL steps) containing `when`."""
+    if rule.freq == 'DAILY':
+        span = (when.date() - dtstart.date()).days
+    elif rule.freq == 'WEEKLY':
+        span = ((when.date() - timedelta(days=when.weekday())) - (dtstart.date() - timedelta(days=dtstart.weekday()))).days // 7
+    else:
+        span = (when.year - dtstart.year) * 12 + when.month - dtstart.month
+    return max(0, span // rule.interval)
+
+def _candidates(rule, dtstart, period):
+    """Occurrence times of each period from `period` on, before COUNT,
+    UNTIL and EXDATE are applied. May include times before `dtstart`."""
+    weekdays = sorted({weekday for _, weekday in rule.byday})
+    if rule.freq == 'DAILY' and weekdays and not set(weekdays) & _daily_weekdays(rule, dtstart):
+        # No period can ever match (stored before check_start existed)
+        return
+    monday = dtstart - timedelta(days=dtstart.weekday())
+    while True:
+        if rule.freq == 'DAILY':
+            day = dtstart + timedelta(days=period * rule.interval)
+            if not weekdays or day.weekday() in weekdays:
+                yield day
+        elif rule.freq == 'WEEKLY':
+            week = monday + timedelta(weeks=period * rule.interval)
+            for weekday in weekdays or (dtstart.weekday(),):
+                yield week + timedelta(days=weekday)
+        else:
+            year, month = divmod(dtstart.month - 1 + period * rule.interval, 12)
+            year, month = dtstart.year + year, month + 1
+            if rule.byday:
+                days = _month_days(year, month, rule.byday)
+            else:
+                # Months without that day are skipped, as in RFC 5545
+                days = [dtstart.day] if dtstart.day <= calendar.monthrange(year, month)[1] else []
+            for day in days:
+                yield dtstart.replace(year=year, month=month, day=day)
+        period += 1
+
+def occurrences(event, start=None, end=None):
+    """Yields the times of the series' occurrences with start <= time < end,
+    in order, computing only what the window needs."""
+    rule = _rule(event)
+    dtstart = event.datetime_evento
+    excluded = _exdates(event)
+    # With COUNT every earlier occurrence has to be counted; without it the
+    # generator can start at the period containing `start`
+    period = _period_of(rule, dtstart, start) if start is not None and rule.count is None else 0
+    seen = 0
+    for when in _candidates(rule, dtstart, period):
+        if when < dtstart:
+            continue
+        if (rule.until is not None and when > rule.until) or (end is not None and when >= end):
+            return
+        seen += 1
+        if rule.count is not None and seen > rule.count:
+            return
+        if when not in excluded and (start is None or when >= start):
+            yield when
+
+def next_occurrence(event, after):
+    """Time of the first occurrence at or after `after`, or None."""
+    return next(occurrences(event, after), None)
+
+def expires_at(event):
+    """When an event stops being current: its time for a one-off event, the
+    last occurrence for a bounded series, None for an endless one."""
+    if not is_recurring(event):
+        return event.datetime_evento
+    rule = _rule(event)
+    if rule.until is None and rule.count is None:
+        return None
+    last = None
+    for last in occurrences(event):
+        pass
+    return last or event.datetime_evento
+
+def occurrence_id(series_id, when):
+    return f"{series_id}@{when.strftime(_ID_FORMAT)}"
+
+def split_id(event_id):
+    """(series id, occurrence time) for an occurrence ID, else (event_id, None)."""
+    series_id, sep, stamp = (event_id or '').partition('@')
+    if not sep:
+        return event_id, None
+    try:
+        return series_id, datetime.datetime.strptime(stamp, _ID_FORMAT)
+    except ValueError:
+        return event_id, None
+
+def occurrence(event, when):
+    """The occurrence of `event` at `when`, as a one-off Event."""
+    extra = {k: v for k, v in (event.extra or {}).items() if k not in (RULE_KEY, EXDATE_KEY)}
+    extra[SERIES_KEY] = event.id
+    return Event(occurrence_id(event.id, when), event.user_id, when, event.evento, extra)
+
+def expand(events, start, end):
+    """The occurrences with start <= time < end of the series in `events`,
+    sorted by time."""
+    found = [occurrence(e, when) for e in events for when in occurrences(e, start, end)]
+    found.sort(key=lambda e: (e.datetime_evento, e.id))
+    return found
+
+def find_occurrence(event, when):
+    """The occurrence of `event` at `when`, or None if there is none."""
+    if next_occurrence(event, when) != when:
+        return None
+    return occurrence(event, when)
+
+def without_occurrence(event, when):
+    """A copy of the series with the occurrence at `when` removed, or None
+    if it has no such occurrence."""
+    if find_occurrence(event, when) is None:
+        return None
+    updated = event.copy()
+    updated.extra[EXDATE_KEY] = sorted(set(event.extra.get(EXDATE_KEY) or ()) | {when.isoformat()})
+    return updated
+
+def describe(event):
+    """Short text for the rule of a series ("weekly on MO,WE until 30/06/2025")."""
+    rule = _rule(event)
+    text = rule.freq.lower() if rule.interval == 1 else f"every {rule.interval} {dict(DAILY='days', WEEKLY='weeks', MONTHLY='months')[rule.freq]}"
+    if rule.byday:
+        text += " on " + ",".join(f"{o or ''}{WEEKDAYS[d]}" for o, d in rule.byday)
+    if rule.until is not None:
+        text += f" until {rule.until.strftime('%d/%m/%Y')}"
+    if rule.count is not None:
+        text += f", {rule.count} times"
+    return text
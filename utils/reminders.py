@@ -0,0 +1,184 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+from datetime import timedelta
+from utils import config
+
+logger = logging.getLogger("discordbot")
+
+# Reminder scheduling for agenda events.
+#
+# Every pending reminder is one entry (next fire time, seq, event id) in a
+# min-heap, and a single task sleeps until the earliest one is due. After a
+# reminder is sent the entry goes back with its next time, until the event
+# starts. Acknowledging or deleting an event marks its entry dead in O(1);
+# dead entries are dropped when they reach the top of the heap, so every
+# change costs O(log n) amortised and no task or job exists per event.
+#
+# Reminders falling due within REMINDER_BATCH_SECONDS of the earliest one
+# are sent together in a single send() call, and they are all due again
+# one nag interval later, so events whose windows overlap keep sharing
+# their messages instead of each costing its own.
+#
+# An event can override the defaults through two keys stored with it
+# (kept in Event.extra):
+#   remind_before  minutes before the event the reminders start
+#   nag_every      minutes between two reminders
+
+REMIND_BEFORE_KEY = 'remind_before'
+NAG_EVERY_KEY = 'nag_every'
+
+def _minutes(event, key, default):
+    value = (event.extra or {}).get(key)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+def remind_before(event):
+    return timedelta(minutes=_minutes(event, REMIND_BEFORE_KEY, config.REMINDER_START_MINUTES))
+
+def nag_every(event):
+    return timedelta(minutes=_minutes(event, NAG_EVERY_KEY, config.REMINDER_INTERVAL_MINUTES))
+
+
+class ReminderEngine:
+    """Reminds of every scheduled event from its start offset until it
+    starts, every nag interval, unless it is cancelled first, by calling
+    `send(events)` with the events due within `window` of each other.
+    `finished(event_id)` is called when an event leaves the schedule."""
+
+    def __init__(self, send, finished=None, window=None):
+        self._send = send
+        self._finished = finished
+        self.window = timedelta(seconds=config.REMINDER_BATCH_SECONDS) if window is None else window
+        self._heap = []             # [when, seq, event_id], ordered by when
+        self._entries = {}          # event_id -> (heap entry, event)
+        self._firing = set()        # ids whose reminder is being sent
+        self._dead = 0              # cancelled entries still in the heap
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, event_id):
+        return event_id in self._entries
+
+    def event_ids(self):
+        """IDs of the events with pending reminders."""
+        return list(self._entries) + list(self._firing)
+
+    def next_deadline(self):
+        """Time of the earliest pending reminder, or None."""
+        self._drop_dead()
+        return self._heap[0][0] if self._heap else None
+
+    def schedule(self, event, now=None):
+        """Adds (or re-times) the reminders of `event`. Returns False if the
+        event has already started."""
+        now = now or datetime.datetime.now()
+        event_dt = event.datetime_evento
+        if event_dt is None or now >= event_dt:
+            return False
+        self._discard(event.id)
+        self._firing.discard(event.id)
+        self._push(max(event_dt - remind_before(event), now), event)
+        return True
+
+    def cancel(self, event_id):
+        """Stops the reminders of an event (acknowledged or deleted)."""
+        if self._discard(event_id) or event_id in self._firing:
+            self._firing.discard(event_id)
+            self._done(event_id)
+            return True
+        return False
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _push(self, when, event):
+        entry = [when, next(self._seq), event.id]
+        self._entries[event.id] = (entry, event)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def _discard(self, event_id):
+        found = self._entries.pop(event_id, None)
+        if found is None:
+            return False
+        found[0][2] = None          # dead: skipped when it reaches the top
+        self._dead += 1
+        if self._dead > 64 and self._dead * 2 > len(self._heap):
+            # Mostly dead (e.g. after a mass delete): rebuild in O(n)
+            self._heap = [entry for entry in self._heap if entry[2] is not None]
+            heapq.heapify(self._heap)
+            self._dead = 0
+        return True
+
+    def _drop_dead(self):
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+            self._dead -= 1
+
+    def _pop_due(self, now):
+        due = []
+        self._drop_dead()
+        while self._heap and self._heap[0][0] <= now:
+            when, _, event_id = heapq.heappop(self._heap)
+            due.append((when, self._entries.pop(event_id)[1]))
+            self._drop_dead()
+        return due
+
+    def _done(self, event_id):
+        if self._finished is not None:
+            try:
+                self._finished(event_id)
+            except Exception as e:
+                logger.exception(f"Error finishing reminders of {event_id}: {e}")
+
+    async def _fire(self, events):
+        try:
+            await self._send(events)
+        except Exception as e:
+            logger.exception(f"Error sending {len(events)} reminders: {e}")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                await self._wakeup.wait()
+                continue
+            delay = (deadline - datetime.datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now = datetime.datetime.now()
+            due = self._pop_due(now + self.window)
+            self._firing.update(event.id for _, event in due)
+            await self._fire([event for _, event in due])
+            for _, event in due:
+                if event.id not in self._firing:
+                    continue        # cancelled or re-scheduled while sending
+                self._firing.discard(event.id)
+                # From this batch's time, so that the batch stays together
+                following = now + nag_every(event)
+                if following < event.datetime_evento:
+                    self._push(following, event)
+                else:
+                    self._done(event.id)
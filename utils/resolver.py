@@ -0,0 +1,87 @@
+import asyncio
+import time
+import logging
+from utils import config
+
+logger = logging.getLogger("discordbot")
+
+# Shared lookup of Discord users and channels for the notification paths.
+#
+# A lookup tries, in order:
+#   1. the gateway cache (bot.get_user / bot.get_channel), free
+#   2. objects fetched earlier, kept for RESOLVER_TTL_SECONDS
+#   3. a REST call (fetch_user / fetch_channel)
+# Concurrent misses for the same object share a single REST call. Failed
+# fetches are not cached, so the next lookup tries again.
+
+
+class Resolver:
+    """Users and channels by ID, with as few REST calls as possible."""
+
+    def __init__(self, bot, ttl=None):
+        self.bot = bot
+        self.ttl = config.RESOLVER_TTL_SECONDS if ttl is None else ttl
+        self._cache = {}            # (kind, id) -> (expires at, object)
+        self._inflight = {}         # (kind, id) -> task fetching it
+        self._stats = {'gateway_hits': 0, 'cache_hits': 0, 'misses': 0, 'merged': 0,
+                       'errors': 0, 'fetch_seconds': 0.0, 'fetch_max': 0.0}
+
+    async def user(self, user_id):
+        return await self._resolve('user', user_id, self.bot.get_user, self.bot.fetch_user)
+
+    async def channel(self, channel_id):
+        return await self._resolve('channel', channel_id, self.bot.get_channel, self.bot.fetch_channel)
+
+    def invalidate(self, kind=None, object_id=None):
+        """Forgets one cached object, every object of a kind, or everything."""
+        if object_id is not None:
+            self._cache.pop((kind, object_id), None)
+        else:
+            for key in [k for k in self._cache if kind is None or k[0] == kind]:
+                del self._cache[key]
+
+    def stats(self):
+        """Counters since start: hits per layer, REST misses, merged misses,
+        failed fetches and fetch latency (average and max, in ms)."""
+        s = dict(self._stats)
+        fetches = s['misses'] - s['errors']
+        s['fetch_avg_ms'] = s.pop('fetch_seconds') * 1000 / fetches if fetches else 0.0
+        s['fetch_max_ms'] = s.pop('fetch_max') * 1000
+        s['entries'] = len(self._cache)
+        return s
+
+    async def _resolve(self, kind, object_id, get, fetch):
+        obj = get(object_id)
+        if obj is not None:
+            self._stats['gateway_hits'] += 1
+            return obj
+        key = (kind, object_id)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._stats['cache_hits'] += 1
+                return cached[1]
+            del self._cache[key]
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats['merged'] += 1
+        else:
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(key, fetch))
+        # shield: a cancelled caller must not cancel the others' fetch
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, fetch):
+        self._stats['misses'] += 1
+        start = time.perf_counter()
+        try:
+            obj = await fetch(key[1])
+        except Exception:
+            self._stats['errors'] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        elapsed = time.perf_counter() - start
+        self._stats['fetch_seconds'] += elapsed
+        self._stats['fetch_max'] = max(self._stats['fetch_max'], elapsed)
+        self._cache[key] = (time.monotonic() + self.ttl, obj)
+        return obj
@@ -0,0 +1,147 @@
+import datetime
+import json
+import os
+import re
+import logging
+from utils import codec, wal, backup_store
+
+logger = logging.getLogger("discordbot")
+
+# Versioned layout of the agenda/todo data files.
+#
+# Since version 2 a data file is an object whose first two keys are the
+# schema version and the record list:
+#
+#   {"schema": 2, "items": [{...}, {...}]}
+#
+# Version 1 files are the bare list. Loaders only accept SCHEMA_VERSION and
+# read records as they are; older files are upgraded once at startup by
+# upgrade(), which streams the records through the MIGRATIONS steps into a
+# new file, so no compatibility code runs on every load. Files from a newer
+# version of the bot are refused rather than misread.
+
+SCHEMA_VERSION = 2
+READ_SIZE = 64 * 1024
+BACKUP_KEEP = 10
+
+_HEADER = re.compile(r'\s*\{\s*"schema"\s*:\s*(\d+)\s*,\s*"items"\s*:\s*(\[)')
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+class SchemaError(ValueError):
+    """A data file has a schema version this code cannot read."""
+
+
+def _event_v2(record):
+    # Version 1 events could store only a date, as `data_evento`
+    legacy = record.pop('data_evento', None)
+    if record.get('datetime_evento') is None and legacy is not None:
+        record['datetime_evento'] = datetime.datetime.strptime(legacy, "%Y-%m-%d").isoformat()
+    return record
+
+# kind -> {version: step upgrading a record from that version to the next}.
+# A version without a step only changes the file header.
+MIGRATIONS = {
+    'agenda': {1: _event_v2},
+    'todo': {},
+}
+
+def wrap(items):
+    """The file contents for `items` (dicts) at the current version."""
+    return {'schema': SCHEMA_VERSION, 'items': items}
+
+def unwrap(data, path):
+    version = data.get('schema') if isinstance(data, dict) else 1
+    if version != SCHEMA_VERSION:
+        raise SchemaError(f"{path} has schema version {version}, expected {SCHEMA_VERSION}")
+    return data['items']
+
+def read_items(path):
+    """The records of a current-version data file."""
+    return unwrap(codec.read_file(path), path)
+
+def _open_items(f):
+    """(version, buffer, offset of the opening '[' of the record list)."""
+    buf = f.read(READ_SIZE)
+    stripped = buf.lstrip()
+    if stripped.startswith('['):
+        return 1, buf, len(buf) - len(stripped)
+    match = _HEADER.match(buf)
+    if match is None:
+        raise SchemaError(f"{f.name} is not a data file this bot recognises")
+    return int(match.group(1)), buf, match.start(2)
+
+def _iter_array(f, buf, pos):
+    """Yields the elements of the JSON array starting at buf[pos], reading
+    more of `f` as needed."""
+    decoder = json.JSONDecoder()
+    pos += 1
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        if buf.startswith(']', pos):
+            return
+        try:
+            if pos == len(buf):
+                raise ValueError("need more data")
+            value, pos = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise SchemaError(f"{f.name} ends in the middle of a record")
+            more = f.read(READ_SIZE)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield value
+
+def file_version(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return _open_items(f)[0]
+
+def _write_stream(tmp_path, records):
+    """Writes the current-version file for `records` to `tmp_path` one
+    record at a time."""
+    with open(tmp_path, 'wb') as out:
+        out.write(b'{"schema": %d, "items": [' % SCHEMA_VERSION)
+        separator = b"\n  "
+        for record in records:
+            out.write(separator)
+            out.write(codec.dumps_line(record))
+            separator = b",\n  "
+        out.write(b"\n]}\n")
+        if wal.fsync_mode() != 'never':
+            out.flush()
+            os.fsync(out.fileno())
+
+def upgrade(path, kind, backup=True):
+    """Brings the data file `path` to SCHEMA_VERSION in one streaming pass,
+    after taking a backup of it. Returns the version it had."""
+    if not os.path.exists(path):
+        return SCHEMA_VERSION
+    with open(path, 'r', encoding='utf-8') as f:
+        version, buf, pos = _open_items(f)
+        if version == SCHEMA_VERSION:
+            return version
+        if version > SCHEMA_VERSION:
+            raise SchemaError(f"{path} has schema version {version}, newer than this bot supports ({SCHEMA_VERSION})")
+        steps = [MIGRATIONS[kind].get(v) for v in range(version, SCHEMA_VERSION)]
+        steps = [step for step in steps if step is not None]
+        if backup:
+            backup_store.create_snapshot(path, BACKUP_KEEP)
+        records = _iter_array(f, buf, pos)
+        for step in steps:
+            records = map(step, records)
+        _write_stream(path + ".tmp", records)
+    # Replaced only once the source is closed: Windows refuses to replace an open file
+    os.replace(path + ".tmp", path)
+    logger.info(f"Upgraded {path} from schema version {version} to {SCHEMA_VERSION}")
+    return version
+
+def run(files):
+    """Upgrades every (path, kind) in `files`. Raises SchemaError if any
+    of them comes from a newer version."""
+    upgraded = 0
+    for path, kind in files:
+        if upgrade(path, kind) != SCHEMA_VERSION:
+            upgraded += 1
+    return upgraded
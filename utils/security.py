@@ -3,7 +3,7 @@ import pyotp
 import asyncio
 import ctypes
 import platform
-from utils import config, storage
+from utils import config, async_storage
 
 def request_physical_confirmation(message: str, title: str = "Bot Security Confirmation") -> bool:
     """
@@ -29,7 +29,7 @@ async def check_security(interaction: discord.Interaction, otp: str, action_name
     - If OTP is not provided: physical popup (Local Mode)
     """
     if otp:
-        secret = storage.load_secret_2fa()
+        secret = await async_storage.load_secret_2fa()
         if not secret:
             await interaction.followup.send("❌ 2FA not configured. Run `/setup-2fa` from PC before using remote commands.", ephemeral=True)
             return False
@@ -0,0 +1,163 @@
+import os
+import logging
+import threading
+from utils import config, codec, schema, recurrence
+from utils.journal import Journal, file_signature
+from utils.records import Event, Todo
+
+logger = logging.getLogger("discordbot")
+
+# Per-user data layout (STORAGE_LAYOUT=sharded, JSON backend).
+#
+# Every user gets a directory under SHARDS_DIR with their own agenda.json
+# and todo.json, so a command only reads and rewrites the caller's data.
+# Journals and backups live next to each shard file, as they do next to
+# the single files:
+#
+#   users/
+#       catalog.json
+#       123456789012345678/agenda.json
+#       123456789012345678/todo.json
+#       123456789012345678/.todo.json.backups/
+#
+# The catalog lists which users have which files, with their record count
+# and the time of each user's oldest event. Jobs that span every user
+# (reminders, cleanup, stats, exports) use it to find the shards to open,
+# and the daily cleanup skips shards with nothing to purge.
+
+CATALOG_VERSION = 1
+CATALOG_FILE = os.path.join(config.SHARDS_DIR, "catalog.json")
+
+_lock = threading.RLock()
+_catalog = None             # user id (str) -> {'agenda': n, 'todo': n, 'oldest': iso}
+_catalog_sig = None
+
+def _base_files():
+    return {'agenda': config.AGENDA_FILE, 'todo': config.TODO_FILE}
+
+def kind_of(file_path):
+    """'agenda' or 'todo' for a single data file or a shard of it, else None."""
+    name = os.path.basename(file_path)
+    for kind, path in _base_files().items():
+        if name == os.path.basename(path):
+            return kind
+    return None
+
+def shard_path(kind, user_id):
+    return os.path.join(config.SHARDS_DIR, str(user_id), os.path.basename(_base_files()[kind]))
+
+def _user_of(file_path):
+    return os.path.basename(os.path.dirname(file_path))
+
+# --- CATALOG ---
+
+def _load():
+    """The catalog, read from disk when it changed. The first time the
+    sharded layout is used, the single files are split into shards."""
+    global _catalog, _catalog_sig
+    sig = file_signature(CATALOG_FILE)
+    if _catalog is not None and sig == _catalog_sig:
+        return _catalog
+    if sig is None:
+        migrate(config.AGENDA_FILE, config.TODO_FILE)
+        sig = file_signature(CATALOG_FILE)
+    data = codec.read_file(CATALOG_FILE)
+    if data.get('version') != CATALOG_VERSION:
+        raise ValueError(f"Unsupported catalog version in {CATALOG_FILE}: {data.get('version')}")
+    _catalog, _catalog_sig = data['users'], sig
+    return _catalog
+
+def _save(users):
+    global _catalog, _catalog_sig
+    os.makedirs(config.SHARDS_DIR, exist_ok=True)
+    tmp_path = CATALOG_FILE + ".tmp"
+    codec.write_file(tmp_path, {'version': CATALOG_VERSION, 'users': users})
+    os.replace(tmp_path, CATALOG_FILE)
+    _catalog, _catalog_sig = users, file_signature(CATALOG_FILE)
+
+def _entry(kind, items):
+    entry = {kind: len(items)}
+    if kind == 'agenda':
+        # When the shard next has something to purge; endless series never expire
+        oldest = min((t for t in map(recurrence.expires_at, items) if t is not None), default=None)
+        entry['oldest'] = oldest.isoformat() if oldest else None
+    return entry
+
+def _apply(users, kind, user, items, exists):
+    """Updates `users` in place for a shard now holding `items`."""
+    entry = users.setdefault(user, {})
+    if items or exists:
+        entry.update(_entry(kind, items))
+    else:
+        entry.pop(kind, None)
+        if kind == 'agenda':
+            entry.pop('oldest', None)
+        if not entry:
+            del users[user]
+
+def note(file_path, items):
+    """Records that the shard `file_path` now holds `items`."""
+    kind = kind_of(file_path)
+    with _lock:
+        users = _load()
+        updated = {user: dict(entry) for user, entry in users.items()}
+        _apply(updated, kind, _user_of(file_path), items, os.path.exists(file_path))
+        if updated != users:
+            _save(updated)
+
+def users(kind):
+    """IDs of the users that have a `kind` shard, in ascending order."""
+    with _lock:
+        return sorted((int(u) for u, entry in _load().items() if kind in entry))
+
+def users_with_events_before(threshold):
+    """Users whose oldest event is older than `threshold`."""
+    stamp = threshold.isoformat()
+    with _lock:
+        return sorted(int(u) for u, entry in _load().items() if entry.get('oldest') and entry['oldest'] < stamp)
+
+def count(kind):
+    with _lock:
+        return sum(entry.get(kind, 0) for entry in _load().values())
+
+# --- MIGRATION ---
+
+def split(records):
+    """Groups records by user, keeping their order: {user id (str): records}."""
+    groups = {}
+    for record in records:
+        groups.setdefault(str(record.user_id or 0), []).append(record)
+    return groups
+
+def _write_shard(path, records):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    codec.write_file(tmp_path, schema.wrap([r.to_dict() for r in records]))
+    os.replace(tmp_path, path)
+
+def migrate(agenda_path, todo_path):
+    """Splits the single agenda/todo files (with their pending journals,
+    see AGENDA_JOURNAL/TODO_JOURNAL) into per-user shards and writes the
+    catalog. The original files are left in place. Returns the number of
+    users migrated."""
+    with _lock:
+        schema.run([(agenda_path, 'agenda'), (todo_path, 'todo')])
+        # Through Journal whatever the settings: a journal left by an
+        # earlier run still holds changes the snapshot lacks
+        events = Journal(agenda_path, None, Event).load()
+        items = Journal(todo_path, None, Todo).load()
+        users = {}
+        for kind, records in (('agenda', events), ('todo', items)):
+            for user, group in split(records).items():
+                path = shard_path(kind, user)
+                _write_shard(path, group)
+                _apply(users, kind, user, group, True)
+        # Written last: a missing catalog means the split did not finish
+        _save(users)
+    logger.info(f"Migrated {len(events)} events and {len(items)} tasks into {len(users)} user shards in {config.SHARDS_DIR}")
+    return len(users)
+
+if __name__ == "__main__":
+    if os.path.exists(CATALOG_FILE):
+        raise SystemExit(f"{CATALOG_FILE} already exists; the data is already split into shards.")
+    migrate(config.AGENDA_FILE, config.TODO_FILE)
@@ -0,0 +1,297 @@
+import json
+import os
+import sqlite3
+import threading
+import logging
+from utils import config, wal, schema, recurrence
+from utils.records import Event, Todo
+
+logger = logging.getLogger("discordbot")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    datetime_evento TEXT NOT NULL,
+    evento TEXT,
+    extra TEXT,
+    recurring INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_events_user_dt ON events(user_id, datetime_evento);
+CREATE INDEX IF NOT EXISTS idx_events_recurring ON events(recurring, user_id);
+
+CREATE TABLE IF NOT EXISTS todos (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    user_id INTEGER,
+    text TEXT,
+    created TEXT,
+    done INTEGER NOT NULL DEFAULT 0,
+    done_at TEXT,
+    priority TEXT,
+    tags TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_todos_user_done ON todos(user_id, done);
+"""
+
+# FSYNC_MODE as SQLite durability settings. In WAL mode NORMAL only syncs
+# at checkpoints, so recent commits may be lost on power failure but the
+# database stays consistent (the "batched" trade-off).
+SYNCHRONOUS = {'always': 'FULL', 'batched': 'NORMAL', 'never': 'OFF'}
+
+# Stored in PRAGMA user_version. A database reading 0 is new, or its
+# import from the JSON files never committed, and is (re)imported.
+SCHEMA_VERSION = 1
+
+_conn = None
+_lock = threading.RLock()
+
+def _connect():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.SQLITE_FILE), exist_ok=True)
+        conn = sqlite3.connect(config.SQLITE_FILE, check_same_thread=False)
+        try:
+            _open(conn)
+        except Exception:
+            # Not cached: the next call starts over, retrying the import
+            conn.close()
+            raise
+        _conn = conn
+    return _conn
+
+def _open(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS[wal.fsync_mode()]}")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise schema.SchemaError(f"{config.SQLITE_FILE} has schema version {version}, newer than this bot supports ({SCHEMA_VERSION})")
+    conn.executescript(SCHEMA)
+    if version == 0:
+        # The version is only stamped in the import's transaction
+        migrate_from_json(config.AGENDA_FILE, config.TODO_FILE, conn)
+
+def check_schema():
+    """Opens the database, raising schema.SchemaError if it is too new."""
+    with _lock:
+        _connect()
+
+# --- ROW CONVERSION ---
+
+def _extra(record):
+    return json.dumps(record.extra, ensure_ascii=False) if record.extra else None
+
+def _event_to_row(event):
+    return (event.id, event.user_id, event.isoformat(), event.evento, _extra(event), int(recurrence.is_recurring(event)))
+
+def _row_to_event(row):
+    # datetime_evento stays an ISO string until the event's time is read
+    return Event(row[0], row[1], row[2], row[3], json.loads(row[4]) if row[4] else None)
+
+def _todo_to_row(item, seq):
+    tags = item.tags
+    return (
+        item.id, seq, item.user_id, item.text, item.created,
+        1 if item.done else 0, item.done_at, item.priority,
+        json.dumps(tags, ensure_ascii=False) if tags is not None else None,
+        _extra(item)
+    )
+
+def _row_to_todo(row):
+    return Todo(
+        row[0], row[2], row[3], row[4], bool(row[5]), row[6], row[7],
+        json.loads(row[8]) if row[8] is not None else None,
+        json.loads(row[9]) if row[9] else None
+    )
+
+# --- EVENTS ---
+
+_EVENT_SELECT = "SELECT id, user_id, datetime_evento, evento, extra, recurring FROM events"
+_EVENT_INSERT = "INSERT OR REPLACE INTO events (id, user_id, datetime_evento, evento, extra, recurring) VALUES (?, ?, ?, ?, ?, ?)"
+
+def load_events():
+    with _lock:
+        rows = _connect().execute(f"{_EVENT_SELECT} ORDER BY datetime_evento").fetchall()
+    return [_row_to_event(r) for r in rows]
+
+def iter_events():
+    """Yields events in time order straight from the cursor."""
+    with _lock:
+        for row in _connect().execute(f"{_EVENT_SELECT} ORDER BY datetime_evento"):
+            yield _row_to_event(row)
+
+def save_events(events):
+    """Replaces the stored events with `events`, writing only what changed."""
+    new_rows = {r[0]: r for r in (_event_to_row(e) for e in events)}
+    with _lock:
+        conn = _connect()
+        with conn:
+            old_rows = {r[0]: r for r in conn.execute(_EVENT_SELECT)}
+            conn.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in old_rows if i not in new_rows])
+            conn.executemany(_EVENT_INSERT, [r for i, r in new_rows.items() if old_rows.get(i) != r])
+
+def add_event(event):
+    with _lock:
+        conn = _connect()
+        with conn:
+            conn.execute(_EVENT_INSERT, _event_to_row(event))
+
+def _series(user_id=None):
+    query, params = f"{_EVENT_SELECT} WHERE recurring = 1", ()
+    if user_id is not None:
+        query, params = query + " AND user_id = ?", (user_id,)
+    return [_row_to_event(r) for r in _connect().execute(query, params)]
+
+def get_event(event_id):
+    """The event (or series) with this ID, or None."""
+    with _lock:
+        row = _connect().execute(f"{_EVENT_SELECT} WHERE id = ?", (event_id,)).fetchone()
+    return _row_to_event(row) if row else None
+
+def delete_event(event_id):
+    """Deletes an event or series; an occurrence ID removes just that
+    occurrence from its series."""
+    series_id, when = recurrence.split_id(event_id)
+    with _lock:
+        conn = _connect()
+        if when is not None:
+            series = get_event(series_id)
+            updated = recurrence.without_occurrence(series, when) if series else None
+            if updated is None:
+                return False
+            with conn:
+                conn.execute(_EVENT_INSERT, _event_to_row(updated))
+            return True
+        with conn:
+            cur = conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+    return cur.rowcount > 0
+
+def expired_events(threshold):
+    """Events older than `threshold` and series whose last occurrence is."""
+    with _lock:
+        rows = _connect().execute(
+            f"{_EVENT_SELECT} WHERE recurring = 0 AND datetime_evento < ? ORDER BY datetime_evento", (threshold.isoformat(),)
+        ).fetchall()
+        ended = [s for s in _series() if (recurrence.expires_at(s) or threshold) < threshold]
+    return [_row_to_event(r) for r in rows] + ended
+
+def delete_events(event_ids):
+    """Deletes events by ID. Returns how many existed."""
+    with _lock:
+        conn = _connect()
+        with conn:
+            cur = conn.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in event_ids])
+    return cur.rowcount
+
+def count_events(after=None):
+    """Number of events, or of those at or after `after` (a series counts
+    once if it has an occurrence from then on)."""
+    with _lock:
+        if after is None:
+            return _connect().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        count = _connect().execute(
+            "SELECT COUNT(*) FROM events WHERE recurring = 0 AND datetime_evento >= ?", (after.isoformat(),)
+        ).fetchone()[0]
+        return count + sum(1 for s in _series() if recurrence.next_occurrence(s, after) is not None)
+
+def events_between(user_id, start, end):
+    """Events of `user_id` with start <= datetime_evento < end, sorted by
+    time, including the occurrences of recurring series."""
+    with _lock:
+        rows = _connect().execute(
+            f"{_EVENT_SELECT} WHERE user_id = ? AND datetime_evento >= ? AND datetime_evento < ? AND recurring = 0 ORDER BY datetime_evento",
+            (user_id, start.isoformat(), end.isoformat())
+        ).fetchall()
+        series = [s for s in _series(user_id) if s.isoformat() < end.isoformat()]
+    events = [_row_to_event(r) for r in rows]
+    if not series:
+        return events
+    return sorted(events + recurrence.expand(series, start, end), key=lambda e: e.datetime_evento)
+
+def events_for_user(user_id):
+    with _lock:
+        rows = _connect().execute(f"{_EVENT_SELECT} WHERE user_id = ? ORDER BY datetime_evento", (user_id,)).fetchall()
+    return [_row_to_event(r) for r in rows]
+
+# --- TODO ---
+
+_TODO_SELECT = "SELECT id, seq, user_id, text, created, done, done_at, priority, tags, extra FROM todos"
+
+def load_todo():
+    with _lock:
+        rows = _connect().execute(f"{_TODO_SELECT} ORDER BY seq").fetchall()
+    return [_row_to_todo(r) for r in rows]
+
+def iter_todo():
+    """Yields tasks in list order straight from the cursor."""
+    with _lock:
+        for row in _connect().execute(f"{_TODO_SELECT} ORDER BY seq"):
+            yield _row_to_todo(row)
+
+def save_todo(items):
+    """Replaces the stored tasks with `items`, writing only what changed."""
+    new_rows = {r[0]: r for r in (_todo_to_row(it, seq) for seq, it in enumerate(items))}
+    with _lock:
+        conn = _connect()
+        with conn:
+            old_rows = {r[0]: r for r in conn.execute(_TODO_SELECT)}
+            conn.executemany("DELETE FROM todos WHERE id = ?", [(i,) for i in old_rows if i not in new_rows])
+            conn.executemany(
+                "INSERT OR REPLACE INTO todos (id, seq, user_id, text, created, done, done_at, priority, tags, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r for i, r in new_rows.items() if old_rows.get(i) != r]
+            )
+
+def todos_for_user(user_id, done=None):
+    """Tasks of `user_id` in list order; `done` narrows to completed/pending."""
+    query = f"{_TODO_SELECT} WHERE user_id = ?"
+    params = [user_id]
+    if done is not None:
+        query += " AND done = ?"
+        params.append(1 if done else 0)
+    with _lock:
+        rows = _connect().execute(query + " ORDER BY seq", params).fetchall()
+    return [_row_to_todo(r) for r in rows]
+
+# --- MIGRATION ---
+
+def _read_json_list(path, kind):
+    if not os.path.exists(path):
+        return []
+    schema.upgrade(path, kind)
+    return schema.read_items(path)
+
+def migrate_from_json(agenda_path, todo_path, conn=None):
+    """One-shot import of agenda.json and todo.json into the database, in
+    one transaction that also sets its schema version. Both files are read
+    before anything is written. Returns (events, tasks) imported."""
+    import uuid
+    events = []
+    for data in _read_json_list(agenda_path, 'agenda'):
+        event = Event.from_dict(data)
+        if event.isoformat() is None:
+            logger.warning(f"Skipping event without date during migration: {data}")
+            continue
+        event.id = event.id or str(uuid.uuid4())
+        events.append(event)
+    items = []
+    for data in _read_json_list(todo_path, 'todo'):
+        item = Todo.from_dict(data)
+        # The id is the primary key; tasks saved without one still get in
+        item.id = item.id or str(uuid.uuid4())
+        items.append(item)
+    with _lock:
+        conn = conn or _connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(_EVENT_INSERT, [_event_to_row(e) for e in events])
+            conn.executemany("INSERT OR REPLACE INTO todos (id, seq, user_id, text, created, done, done_at, priority, tags, extra) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [_todo_to_row(it, seq) for seq, it in enumerate(items)])
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    logger.info(f"Migrated {len(events)} events and {len(items)} tasks into {config.SQLITE_FILE}")
+    return len(events), len(items)
+
+if __name__ == "__main__":
+    migrate_from_json(config.AGENDA_FILE, config.TODO_FILE)
@@ -1,97 +1,516 @@
 import json
 import os
-import datetime
-import shutil
-import io
-import csv
 import logging
+import functools
+import threading
 from utils import config
+from utils.journal import Journal, copy_item, file_signature
+from utils.agenda_index import AgendaIndex
+from utils.todo_search import TodoSearchIndex
+from utils.records import Event, Todo
+from utils import sqlite_store, backup_store, codec, shards, wal, schema, recurrence, archive
 
 logger = logging.getLogger("discordbot")
 
-def load_events():
+def _use_sqlite():
+    return config.STORAGE_BACKEND == 'sqlite'
+
+def _sharded():
+    return config.STORAGE_LAYOUT == 'sharded' and not _use_sqlite()
+
+# --- LAYOUT ---
+# In the sharded layout each user's agenda and tasks live in their own
+# files (see utils.shards); otherwise one file holds everyone's. Internal
+# helpers take the file to work on, and the public functions pick it from
+# the user a call is about.
+
+kind_of = shards.kind_of
+
+def data_file(kind, user_id):
+    """The 'agenda' or 'todo' file that holds `user_id`'s data."""
+    if _sharded():
+        return shards.shard_path(kind, user_id)
+    return config.AGENDA_FILE if kind == 'agenda' else config.TODO_FILE
+
+def data_files(kind):
+    """Every 'agenda' or 'todo' file, for operations that span all users."""
+    if _sharded():
+        return [shards.shard_path(kind, user) for user in shards.users(kind)]
+    return [data_file(kind, None)]
+
+def partition(user_id):
+    """Which list load_todo(user_id) returns and save_todo(items, user_id)
+    replaces: `user_id`'s own in the sharded layout, everyone's (None)
+    otherwise."""
+    return user_id if _sharded() else None
+
+def _partitions(kind, items, user_id, current):
+    """(file, items) pairs to write when `items` replace the partition of
+    `user_id`. In the sharded layout a full list is split by user and only
+    the shards whose contents differ from `current(file)` are written."""
+    if not _sharded():
+        return [(data_file(kind, None), items)]
+    if user_id is not None:
+        return [(data_file(kind, user_id), items)]
+    groups = shards.split(items)
+    for user in shards.users(kind):
+        groups.setdefault(str(user), [])
+    pairs = [(data_file(kind, user), group) for user, group in groups.items()]
+    return [(path, group) for path, group in pairs if group != current(path)]
+
+def _note(path, items):
+    if _sharded():
+        shards.note(path, items)
+
+# --- JOURNALS ---
+# With TODO_JOURNAL / AGENDA_JOURNAL a data file is written through a
+# Journal (utils.journal), which appends changes to `<file>.journal`
+# instead of rewriting the file.
+
+_journals = {}              # path -> Journal
+
+def _journaled(path):
+    return config.TODO_JOURNAL if kind_of(path) == 'todo' else config.AGENDA_JOURNAL
+
+def _get_journal(path):
+    journal = _journals.get(path)
+    if journal is None:
+        if kind_of(path) == 'todo':
+            writer, record_type = functools.partial(_write_todo_file, path), Todo
+        else:
+            writer, record_type = functools.partial(_write_events_file, path), Event
+        journal = _journals[path] = Journal(path, writer, record_type, max_bytes=config.JOURNAL_MAX_BYTES)
+    return journal
+
+def _signature(path):
+    if _journaled(path):
+        return (file_signature(path), file_signature(path + ".journal"))
+    return file_signature(path)
+
+def _load_file(path, read):
+    """The items of `path`, with its journal applied if it has one."""
+    if _journaled(path):
+        return _get_journal(path).load()
+    return read(path)
+
+def _store_file(path, items, write):
+    if _journaled(path):
+        _get_journal(path).save(items)
+    else:
+        write(path, items)
+
+def recover():
+    """Startup recovery: deletes temp files left by interrupted writes and
+    backup chunks no snapshot references, upgrades data files from older
+    schema versions (see utils.schema) and replays every journal now,
+    cutting off torn records. Raises schema.SchemaError for data written
+    by a newer version of the bot. Returns the number of files checked."""
+    if _sharded():
+        wal.remove_stale_temp(shards.CATALOG_FILE)
+    files = [(path, kind) for kind in ('agenda', 'todo') for path in data_files(kind)]
+    for path, _ in files:
+        for leftover in (path, path + ".journal"):
+            if wal.remove_stale_temp(leftover):
+                logger.warning(f"Removed unfinished write of {leftover}")
+        # Chunks of a backup interrupted before its manifest was written
+        backup_store.collect_garbage(path)
+    schema.run(files)
+    if _use_sqlite():
+        sqlite_store.check_schema()
+        return len(files)
+    for path, _ in files:
+        if _journaled(path):
+            count = _get_journal(path).recover()
+            logger.info(f"Recovered {count} items from {path} and its journal")
+    return len(files)
+
+def sync():
+    """Forces batched journal appends to disk (on shutdown)."""
+    for journal in list(_journals.values()):
+        journal.sync()
+
+# --- CACHE ---
+# Parsed lists are kept in memory per file and served as copies. An entry
+# is only trusted while the file's (mtime, size), and its journal's, are
+# unchanged, so restores and manual edits are picked up on the next load.
+
+_cache = {}                 # path -> (signature, items)
+_cache_lock = threading.Lock()
+_cache_hits = 0
+_cache_misses = 0
+
+def _cached_list(path, reader):
+    """Returns the shared cached list for `path`. Callers must not mutate it."""
+    global _cache_hits, _cache_misses
+    sig = _signature(path)
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == sig:
+            _cache_hits += 1
+            return entry[1]
+        _cache_misses += 1
+    items = reader()
+    with _cache_lock:
+        _cache[path] = (sig, items)
+    return items
+
+def _cache_store(path, items):
+    copies = [copy_item(it) for it in items]
+    with _cache_lock:
+        _cache[path] = (_signature(path), copies)
+
+def _cache_replace(path, items):
+    """Swaps in a list the cache already owns, after writing it to `path`."""
+    with _cache_lock:
+        _cache[path] = (_signature(path), items)
+
+def _cache_invalidate(path):
+    with _cache_lock:
+        _cache.pop(path, None)
+
+def cache_stats():
+    """Hit/miss counters of the in-memory file cache."""
+    with _cache_lock:
+        return {'hits': _cache_hits, 'misses': _cache_misses, 'entries': len(_cache)}
+
+def _cached_events(path):
+    """The cached agenda list of `path`. Each Event parses its timestamp on
+    first use, so reads that only count or export events never pay for it."""
+    return _cached_list(path, functools.partial(_load_file, path, _read_events_file))
+
+# Sorted per-user index over each cached agenda list. It is rebuilt when
+# the cache entry is replaced by a load or a full save, and patched in
+# place by add_event/delete_event/purge_events_before.
+_agenda_indexes = {}        # path -> (the cached list it describes, AgendaIndex)
+
+def _events_index(path, events):
+    entry = _agenda_indexes.get(path)
+    if entry is None or entry[0] is not events:
+        entry = _agenda_indexes[path] = (events, AgendaIndex(events))
+    return entry[1]
+
+def _commit_events(path, new_events, index):
+    """Caches `new_events` (already written) and keeps `index` attached to it."""
+    _cache_replace(path, new_events)
+    _agenda_indexes[path] = (new_events, index)
+    _note(path, new_events)
+    logger.info(f"Events saved to: {path}")
+
+def _cached_todo(path):
+    return _cached_list(path, functools.partial(_load_file, path, _read_todo_file))
+
+def _read_events_file(path):
+    if not os.path.exists(path):
+        return []
+    return [Event.from_dict(e) for e in schema.read_items(path)]
+
+def _write_events_file(path, events):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    wal.write_atomic(path, codec.dumps(schema.wrap([e.to_dict() for e in events])))
+
+def load_events(user_id=None):
+    """Every event, or only the partition of `user_id` (see partition())."""
     try:
-        if not os.path.exists(config.AGENDA_FILE):
-            return []
-        with open(config.AGENDA_FILE, 'r', encoding='utf-8') as f:
-            events_raw = json.load(f)
-            for event in events_raw:
-                if 'datetime_evento' in event:
-                    event['datetime_evento'] = datetime.datetime.fromisoformat(event['datetime_evento'])
-                elif 'data_evento' in event:  # Legacy compatibility
-                    event['datetime_evento'] = datetime.datetime.strptime(event['data_evento'], "%Y-%m-%d")
-            return events_raw
+        if _use_sqlite():
+            return sqlite_store.load_events()
+        paths = data_files('agenda') if user_id is None else [data_file('agenda', user_id)]
+        return [copy_item(e) for path in paths for e in _cached_events(path)]
     except Exception as e:
         logger.exception(f"Error loading events: {e}")
         return []
 
-def save_events(events):
+def save_events(events, user_id=None):
+    """Replaces every event, or only the partition of `user_id`."""
     try:
-        os.makedirs(os.path.dirname(config.AGENDA_FILE), exist_ok=True)
-        events_to_save = []
-        for event in events:
-            copy_event = event.copy()
-            copy_event['datetime_evento'] = copy_event['datetime_evento'].isoformat()
-            copy_event.pop('data_evento', None)
-            events_to_save.append(copy_event)
-        with open(config.AGENDA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(events_to_save, f, indent=2, ensure_ascii=False)
-        logger.info(f"Events saved to: {config.AGENDA_FILE}")
+        if _use_sqlite():
+            sqlite_store.save_events(events)
+            logger.info(f"Events saved to: {config.SQLITE_FILE}")
+        else:
+            for path, group in _partitions('agenda', events, user_id, _cached_events):
+                _store_file(path, group, _write_events_file)
+                _cache_store(path, group)
+                _note(path, group)
+                logger.info(f"Events saved to: {path}")
         return True
     except Exception as e:
         logger.exception(f"Error saving events: {e}")
         return False
 
-def load_todo():
+def add_event(event):
+    """Stores a single new event. Returns True on success."""
+    if _use_sqlite():
+        try:
+            sqlite_store.add_event(event)
+            return True
+        except Exception as e:
+            logger.exception(f"Error adding event: {e}")
+            return False
+    path = data_file('agenda', event.user_id)
     try:
-        if not os.path.exists(config.TODO_FILE):
-            return []
-        with open(config.TODO_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data
+        events = _cached_events(path)
+        index = _events_index(path, events)
+        stored = copy_item(event)
+        new_events = events + [stored]
+        _store_file(path, new_events, _write_events_file)
+    except Exception as e:
+        logger.exception(f"Error adding event: {e}")
+        return False
+    index.add(stored)
+    _commit_events(path, new_events, index)
+    return True
+
+def delete_event(event_id, user_id=None):
+    """Removes an event or series by ID, looking only in `user_id`'s data if
+    given; an occurrence ID removes only that occurrence from its series.
+    Returns False if it does not exist."""
+    if _use_sqlite():
+        return sqlite_store.delete_event(event_id)
+    series_id, when = recurrence.split_id(event_id)
+    paths = data_files('agenda') if user_id is None else [data_file('agenda', user_id)]
+    for path in paths:
+        events = _cached_events(path)
+        index = _events_index(path, events)
+        if series_id not in index:
+            continue
+        if when is None:
+            new_events = [e for e in events if e.id != event_id]
+            _store_file(path, new_events, _write_events_file)
+            index.remove(event_id)
+        else:
+            updated = recurrence.without_occurrence(index.get(series_id), when)
+            if updated is None:
+                return False
+            new_events = [updated if e.id == series_id else e for e in events]
+            _store_file(path, new_events, _write_events_file)
+            index.add(updated)
+        _commit_events(path, new_events, index)
+        return True
+    return False
+
+def get_event(event_id, user_id=None):
+    """The event, series or occurrence with this ID, or None."""
+    try:
+        series_id, when = recurrence.split_id(event_id)
+        if _use_sqlite():
+            event = sqlite_store.get_event(series_id)
+        else:
+            paths = data_files('agenda') if user_id is None else [data_file('agenda', user_id)]
+            event = next((e for e in (_events_index(p, _cached_events(p)).get(series_id) for p in paths) if e), None)
+        if event is None:
+            return None
+        if when is None:
+            return copy_item(event)
+        return recurrence.find_occurrence(event, when) if recurrence.is_recurring(event) else None
+    except Exception as e:
+        logger.exception(f"Error querying events: {e}")
+        return None
+
+def purge_events_before(threshold):
+    """Moves every event older than `threshold`, and every series whose
+    last occurrence is, to the archive (see utils.archive). The expired
+    events are found through the time index, so a file with nothing to
+    expire is not scanned or rewritten. Returns how many were moved."""
+    if _use_sqlite():
+        expired = sqlite_store.expired_events(threshold)
+        archive.append(archive.directory_for(config.SQLITE_FILE), expired)
+        return sqlite_store.delete_events([e.id for e in expired])
+    if _sharded():
+        paths = [data_file('agenda', user) for user in shards.users_with_events_before(threshold)]
+    else:
+        paths = data_files('agenda')
+    removed = 0
+    for path in paths:
+        events = _cached_events(path)
+        index = _events_index(path, events)
+        expired = index.expired(threshold)
+        if not expired:
+            continue
+        # Archived first: a crash in between archives them twice, not never
+        archive.append(archive.directory_for(path), expired)
+        gone = {e.id for e in expired}
+        valid_events = [e for e in events if e.id not in gone]
+        _store_file(path, valid_events, _write_events_file)
+        index.expire_before(threshold)
+        _commit_events(path, valid_events, index)
+        removed += len(expired)
+    return removed
+
+def archived_months(user_id):
+    """Months ("YYYY-MM") with archived events in `user_id`'s archive."""
+    path = config.SQLITE_FILE if _use_sqlite() else data_file('agenda', user_id)
+    return archive.months(archive.directory_for(path))
+
+def archived_events(user_id, month):
+    """Archived events of `user_id` in `month` ("YYYY-MM"), sorted by time."""
+    path = config.SQLITE_FILE if _use_sqlite() else data_file('agenda', user_id)
+    events = list(archive.read(archive.directory_for(path), month, user_id))
+    events.sort(key=lambda e: e.datetime_evento)
+    return events
+
+def count_events(after=None):
+    """Number of stored events, or of those at or after `after`."""
+    if _use_sqlite():
+        return sqlite_store.count_events(after)
+    if after is None:
+        if _sharded():
+            return shards.count('agenda')
+        return len(_cached_events(config.AGENDA_FILE))
+    return sum(_events_index(path, _cached_events(path)).count_after(after) for path in data_files('agenda'))
+
+def events_between(user_id, start, end):
+    """Events of `user_id` with start <= datetime_evento < end, sorted by time."""
+    try:
+        if _use_sqlite():
+            return sqlite_store.events_between(user_id, start, end)
+        path = data_file('agenda', user_id)
+        index = _events_index(path, _cached_events(path))
+        return [copy_item(e) for e in index.between(user_id, start, end)]
+    except Exception as e:
+        logger.exception(f"Error querying events: {e}")
+        return []
+
+def events_for_user(user_id):
+    """All events of `user_id`, sorted by time."""
+    try:
+        if _use_sqlite():
+            return sqlite_store.events_for_user(user_id)
+        path = data_file('agenda', user_id)
+        index = _events_index(path, _cached_events(path))
+        return [copy_item(e) for e in index.for_user(user_id)]
+    except Exception as e:
+        logger.exception(f"Error querying events: {e}")
+        return []
+
+def _read_todo_file(path):
+    if not os.path.exists(path):
+        return []
+    return [Todo.from_dict(it) for it in schema.read_items(path)]
+
+def _load_todo_file(path):
+    return [copy_item(i) for i in _cached_todo(path)]
+
+def load_todo(user_id=None):
+    """Every task, or only the partition of `user_id` (see partition())."""
+    try:
+        if _use_sqlite():
+            return sqlite_store.load_todo()
+        paths = data_files('todo') if user_id is None else [data_file('todo', user_id)]
+        return [i for path in paths for i in _load_todo_file(path)]
     except Exception as e:
         logger.exception(f"Error loading todo: {e}")
         return []
 
-def save_todo(items):
+def save_todo(items, user_id=None, changes=None):
+    """Replaces every task, or only the partition of `user_id`. `changes`,
+    {id: task or None if removed}, names the tasks that differ from the
+    stored list, so the search index only re-indexes those."""
     try:
-        os.makedirs(os.path.dirname(config.TODO_FILE), exist_ok=True)
-        # Backup previous file
-        if os.path.exists(config.TODO_FILE):
-            try:
-                # create backup with timestamp
-                bak_name = config.TODO_FILE + ".bak." + datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                os.replace(config.TODO_FILE, bak_name)
-                # cleanup: keep only last N backups
-                try:
-                    bak_dir = os.path.dirname(config.TODO_FILE)
-                    prefix = os.path.basename(config.TODO_FILE) + ".bak."
-                    bak_files = [f for f in os.listdir(bak_dir) if f.startswith(prefix)]
-                    # sort by name (timestamp) descending
-                    bak_files.sort(reverse=True)
-                    keep = 5
-                    for old in bak_files[keep:]:
-                        try:
-                            os.remove(os.path.join(bak_dir, old))
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
-            except Exception:
-                # non-fatal
-                pass
-
-        tmp_path = config.TODO_FILE + ".tmp"
-        with open(tmp_path, 'w', encoding='utf-8') as f:
-            json.dump(items, f, indent=2, ensure_ascii=False)
-        # atomic replace
-        os.replace(tmp_path, config.TODO_FILE)
-        logger.info(f"To-Do saved to: {config.TODO_FILE}")
+        if _use_sqlite():
+            changes = _search_changes(config.TODO_FILE, changes)
+            sqlite_store.save_todo(items)
+            _sync_todo_search(config.TODO_FILE, items, changes)
+            logger.info(f"To-Do saved to: {config.SQLITE_FILE}")
+            return True
+        if _sharded() and user_id is None:
+            changes = None          # may span several files
+        for path, group in _partitions('todo', items, user_id, _load_todo_file):
+            group_changes = _search_changes(path, changes)
+            _store_file(path, group, _write_todo_file)
+            _cache_store(path, group)
+            _note(path, group)
+            _sync_todo_search(path, group, group_changes)
+            logger.info(f"To-Do saved to: {path}")
         return True
     except Exception as e:
         logger.exception(f"Error saving todo: {e}")
         return False
 
+def todos_for_user(user_id, done=None):
+    """Tasks of `user_id` in list order; `done` narrows to completed/pending."""
+    try:
+        if _use_sqlite():
+            return sqlite_store.todos_for_user(user_id, done)
+        path = data_file('todo', user_id)
+        source = _cached_todo(path)
+        items = [i for i in source if i.user_id == user_id and (done is None or bool(i.done) == done)]
+        return [copy_item(i) for i in items]
+    except Exception as e:
+        logger.exception(f"Error querying todo: {e}")
+        return []
+
+# Full-text indexes for search_todo, one per todo file. Each is built on
+# the first search and then kept in step with every save; a marker made of
+# the store's file signatures tells when something else (a restore, a
+# manual edit) changed the data, in which case the next search re-syncs it.
+_todo_searches = {}         # path -> (TodoSearchIndex, marker)
+
+def _todo_marker(path):
+    if _use_sqlite():
+        # Commits land in the -wal file until SQLite checkpoints them
+        return (file_signature(config.SQLITE_FILE), file_signature(config.SQLITE_FILE + "-wal"))
+    return (file_signature(path), file_signature(path + ".journal"))
+
+def _search_changes(path, changes):
+    """`changes` if the search index of `path` is in step with the store
+    before a save, else None (the save then re-syncs the whole list)."""
+    entry = _todo_searches.get(path)
+    if changes is None or entry is None or entry[1] != _todo_marker(path):
+        return None
+    return changes
+
+def _sync_todo_search(path, items, changes=None):
+    entry = _todo_searches.get(path)
+    if entry is not None:
+        if changes is None:
+            entry[0].sync(items)
+        else:
+            entry[0].apply(changes)
+        _todo_searches[path] = (entry[0], _todo_marker(path))
+
+def search_todo(user_id, query, limit=None):
+    """Ranked tasks of `user_id` matching `query` (words, tag:x, prio:x).
+    Returns (tasks, total matches)."""
+    try:
+        path = data_file('todo', user_id)
+        marker = _todo_marker(path)
+        index, synced = _todo_searches.get(path, (None, None))
+        if index is None or marker != synced:
+            if index is None:
+                index = TodoSearchIndex()
+            source = load_todo(user_id) if _use_sqlite() else _cached_todo(path)
+            index.sync(source)
+            _todo_searches[path] = (index, marker)
+        matches, total = index.search(user_id, query, limit)
+        return [copy_item(i) for i in matches], total
+    except Exception as e:
+        logger.exception(f"Error searching todo: {e}")
+        return [], 0
+
+def checkpoint(file_path: str):
+    """Brings `file_path` up to date with its store (journal or database),
+    so it can be copied or exported as is."""
+    kind = kind_of(file_path)
+    if kind == 'todo' and _use_sqlite():
+        _write_todo_file(file_path, sqlite_store.load_todo())
+    elif kind == 'agenda' and _use_sqlite():
+        _write_events_file(file_path, sqlite_store.load_events())
+    elif _journaled(file_path):
+        _get_journal(file_path).compact()
+
+def _write_todo_file(path, items):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Backup previous file
+    if os.path.exists(path):
+        try:
+            # keep it with a timestamp (only the last 5); the file itself
+            # stays in place until the new one replaces it
+            backup_store.rotate_copy(path, keep=5)
+        except Exception:
+            # non-fatal
+            pass
+
+    wal.write_atomic(path, codec.dumps(schema.wrap([it.to_dict() for it in items])))
+
 def load_secret_2fa():
     if not os.path.exists(config.SECRET_2FA_FILE):
         return None
@@ -111,67 +530,80 @@ def save_secret_2fa(secret):
         return False
 
 def create_backup_file(file_path: str, keep: int = 10) -> str:
-    """Creates a timestamped backup of the file and returns the backup path.
-    Keeps at most `keep` recent backups.
+    """Creates a timestamped, compressed and deduplicated backup of the file
+    and returns the backup path. Older backups are thinned by the tiered
+    retention policy, which always keeps the `keep` most recent ones.
     """
     try:
+        checkpoint(file_path)
         if not os.path.exists(file_path):
             raise FileNotFoundError(file_path)
-        dirp = os.path.dirname(file_path)
-        base = os.path.basename(file_path)
-        bak_dir = os.path.join(dirp, f".{base}.backups")
-        os.makedirs(bak_dir, exist_ok=True)
-        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        bak_name = f"{base}.bak.{stamp}"
-        bak_path = os.path.join(bak_dir, bak_name)
-        shutil.copy2(file_path, bak_path)
-
-        # rotation
-        files = sorted([f for f in os.listdir(bak_dir) if f.startswith(base + '.bak.')], reverse=True)
-        for old in files[keep:]:
-            try:
-                os.remove(os.path.join(bak_dir, old))
-            except Exception:
-                pass
-
-        return bak_path
+        bak_name = backup_store.create_snapshot(file_path, keep)
+        return os.path.join(backup_store.backup_dir(file_path), bak_name)
     except Exception as e:
         logger.exception(f"Error create_backup_file: {e}")
         raise
 
-def list_backups(file_path: str):
-    dirp = os.path.dirname(file_path)
-    base = os.path.basename(file_path)
-    bak_dir = os.path.join(dirp, f".{base}.backups")
-    if not os.path.exists(bak_dir):
-        return []
-    items = sorted([f for f in os.listdir(bak_dir) if f.startswith(base + '.bak.')], reverse=True)
-    return items
+def list_backups(file_path: str, details: bool = False, limit: int = None):
+    """Backup names, newest first. With `details`, returns dicts with the
+    original size, compressed size on disk and bytes added per backup."""
+    names = backup_store.list_snapshots(file_path)[:limit]
+    if not details:
+        return names
+    return [backup_store.snapshot_info(file_path, name) for name in names]
 
 def restore_backup(file_path: str, backup_filename: str) -> bool:
-    dirp = os.path.dirname(file_path)
-    base = os.path.basename(file_path)
-    bak_dir = os.path.join(dirp, f".{base}.backups")
-    bak_path = os.path.join(bak_dir, backup_filename)
-    if not os.path.exists(bak_path):
-        raise FileNotFoundError(bak_path)
+    if os.path.basename(backup_filename) != backup_filename:
+        raise FileNotFoundError(backup_filename)
     tmp_restore = file_path + ".restore.tmp"
-    shutil.copy2(bak_path, tmp_restore)
+    backup_store.restore_snapshot(file_path, backup_filename, tmp_restore)
     os.replace(tmp_restore, file_path)
+    # Backups keep the schema version they were taken with
+    schema.upgrade(file_path, kind_of(file_path), backup=False)
+    _reload_store(file_path)
     return True
 
-def todo_to_csv(items):
-    """Returns CSV bytes for todo list."""
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['id', 'user_id', 'text', 'created', 'done', 'done_at'])
-    for it in items:
-        writer.writerow([
-            it.get('id', ''),
-            it.get('user_id', ''),
-            it.get('text', '').replace('\n', ' '),
-            it.get('created', ''),
-            str(bool(it.get('done', False))),
-            it.get('done_at', '')
-        ])
-    return output.getvalue().encode('utf-8')
+def remove_data_file(file_path: str):
+    """Deletes a data file together with its journal or database rows."""
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    _reload_store(file_path)
+
+def clear_data_file(file_path: str):
+    """Backs up `file_path` if there is anything to keep, then empties its store."""
+    checkpoint(file_path)
+    if os.path.exists(file_path):
+        create_backup_file(file_path)
+    remove_data_file(file_path)
+
+def _reload_store(file_path):
+    """Makes the store behind `file_path` match the file on disk again."""
+    _cache_invalidate(file_path)
+    kind = kind_of(file_path)
+    if kind == 'todo' and _use_sqlite():
+        sqlite_store.save_todo(_read_todo_file(file_path))
+    elif kind == 'agenda' and _use_sqlite():
+        sqlite_store.save_events(_read_events_file(file_path))
+    elif _journaled(file_path):
+        _get_journal(file_path).reset()
+    if _sharded():
+        reader = _read_todo_file if kind == 'todo' else _read_events_file
+        shards.note(file_path, reader(file_path))
+
+def iter_events():
+    """Yields every stored event without building a copy of the list
+    (for exports). The events must not be modified."""
+    if _use_sqlite():
+        yield from sqlite_store.iter_events()
+    else:
+        for path in data_files('agenda'):
+            yield from _cached_events(path)
+
+def iter_todo():
+    """Yields every stored task without building a copy of the list
+    (for exports). The tasks must not be modified."""
+    if _use_sqlite():
+        yield from sqlite_store.iter_todo()
+    else:
+        for path in data_files('todo'):
+            yield from _cached_todo(path)
@@ -0,0 +1,187 @@
+import bisect
+import heapq
+import re
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+PRIORITY_WEIGHT = {'urgent': 0.3, 'high': 0.2, 'normal': 0.1, 'low': 0.0}
+
+# Priorities by descending weight, as one sortable character; others rank as 'low'
+_PRIORITY_RANK = {p: str(n) for n, p in enumerate(sorted(PRIORITY_WEIGHT, key=PRIORITY_WEIGHT.get, reverse=True))}
+_EMPTY = frozenset()
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall((text or "").lower()))
+
+
+def parse_query(query):
+    """Splits a query into (terms, tags, priorities).
+
+    `tag:work` and `prio:urgent` (or `priority:urgent`) are filters; every
+    other word is a search term matched as a token prefix.
+    """
+    terms, tags, prios = [], set(), set()
+    for word in query.lower().split():
+        if word.startswith('tag:') and len(word) > 4:
+            tags.add(word[4:])
+        elif word.startswith(('prio:', 'priority:')):
+            prios.add(word.split(':', 1)[1])
+        else:
+            terms.extend(TOKEN_RE.findall(word))
+    return terms, tags, prios
+
+
+class TodoSearchIndex:
+    """Inverted index over task text, tags and priority.
+
+    Postings map each lower-cased token to the IDs of the tasks containing
+    it. A sorted vocabulary makes prefix lookups a binary search. Saves
+    pass the tasks an edit touched to `apply()`; `sync()` diffs a full task
+    list against the indexed copy, for the first build and for changes made
+    behind the index's back.
+    """
+
+    def __init__(self):
+        self._items = {}        # id -> indexed copy of the task
+        self._postings = {}     # token -> set of ids
+        self._vocab = []        # sorted tokens, for prefix search
+        self._tags = {}         # tag -> set of ids
+        self._prios = {}        # priority -> set of ids
+        self._users = {}        # user_id -> set of ids
+        self._ranks = {}        # id -> rank key without the term score (a str)
+
+    def __len__(self):
+        return len(self._items)
+
+    # --- MAINTENANCE ---
+
+    def sync(self, items):
+        seen = set()
+        indexed = self._items
+        for it in items:
+            key = it.id
+            if not key:
+                continue
+            seen.add(key)
+            if indexed.get(key) != it:
+                self.add(it)
+        if len(seen) < len(indexed):
+            for key in [k for k in indexed if k not in seen]:
+                self.remove(key)
+
+    def apply(self, changes):
+        """Applies {id: task, or None if it was removed}."""
+        for key, item in changes.items():
+            if item is None:
+                self.remove(key)
+            else:
+                self.add(item)
+
+    def add(self, item):
+        key = item.id
+        if key in self._items:
+            self.remove(key)
+        item = item.copy()
+        self._items[key] = item
+        for token in tokenize(item.text):
+            ids = self._postings.get(token)
+            if ids is None:
+                ids = self._postings[token] = set()
+                bisect.insort(self._vocab, token)
+            ids.add(key)
+        for tag in item.tags or ():
+            self._tags.setdefault(tag.lower(), set()).add(key)
+        self._prios.setdefault(item.priority or 'normal', set()).add(key)
+        self._users.setdefault(item.user_id, set()).add(key)
+        # Higher priority first, pending before done, then oldest first. One
+        # string compares much faster than a tuple when ranking many matches.
+        prio = _PRIORITY_RANK.get(item.priority or 'normal', _PRIORITY_RANK['low'])
+        self._ranks[key] = f"{prio}{int(bool(item.done))}{item.created or ''}\0{key}"
+
+    def remove(self, key):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        del self._ranks[key]
+        for token in tokenize(item.text):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(key)
+            if not ids:
+                del self._postings[token]
+                del self._vocab[bisect.bisect_left(self._vocab, token)]
+        for tag in item.tags or ():
+            self._discard(self._tags, tag.lower(), key)
+        self._discard(self._prios, item.priority or 'normal', key)
+        self._discard(self._users, item.user_id, key)
+
+    @staticmethod
+    def _discard(facet, value, key):
+        ids = facet.get(value)
+        if ids is not None:
+            ids.discard(key)
+            if not ids:
+                del facet[value]
+
+    # --- QUERIES ---
+
+    def _prefix_matches(self, term):
+        """Returns {id: score} for tasks with a token starting with `term`;
+        exact token matches score higher than prefix-only ones."""
+        scores = {}
+        lo = bisect.bisect_left(self._vocab, term)
+        for pos in range(lo, len(self._vocab)):
+            token = self._vocab[pos]
+            if not token.startswith(term):
+                break
+            if token != term:
+                scores.update(dict.fromkeys(self._postings[token], 1.0))
+        if term in self._postings:
+            scores.update(dict.fromkeys(self._postings[term], 2.0))
+        return scores
+
+    def search(self, user_id, query, limit=None):
+        """Tasks of `user_id` matching every term and filter, best first.
+
+        Returns (tasks, total): with `limit` only the best `limit` tasks
+        are ranked and returned, `total` still counts every match.
+        """
+        terms, tags, prios = parse_query(query)
+        filters = [self._tags.get(t, _EMPTY) for t in tags]
+        if prios:
+            ids = [self._prios.get(p, _EMPTY) for p in prios]
+            filters.append(ids[0] if len(ids) == 1 else set().union(*ids))
+        candidates = None
+        term_matches = []
+        for term in terms:
+            matches = self._prefix_matches(term)
+            term_matches.append(matches)
+            candidates = set(matches) if candidates is None else candidates & matches.keys()
+        if candidates is None and not filters:
+            return [], 0
+        own = self._users.get(user_id, _EMPTY)
+        if len(own) < len(self._items):
+            filters.append(own)
+        # Smallest set first; facet sets are only read, never copied
+        filters.sort(key=len)
+        if candidates is None:
+            candidates, filters = filters[0], filters[1:]
+        keys = candidates.intersection(*filters) if filters else candidates
+        scores = {key: sum(matches[key] for matches in term_matches) for key in keys} if terms else {}
+        items = self._items
+        ranks = self._ranks
+        if terms:
+            def rank(key):
+                # Scores are whole numbers and priority weights below 1, so
+                # this orders by score plus weight as the ranking intends
+                return (-scores[key], ranks[key])
+        else:
+            rank = ranks.__getitem__
+
+        if limit is None or limit >= len(keys):
+            best = sorted(keys, key=rank)
+        else:
+            best = heapq.nsmallest(limit, keys, key=rank)
+        return [items[key] for key in best], len(keys)
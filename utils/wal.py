@@ -0,0 +1,179 @@
+import os
+import zlib
+import threading
+import logging
+from utils import config, codec
+
+logger = logging.getLogger("discordbot")
+
+# Durability layer shared by the JSON stores.
+#
+# write_atomic() replaces a file through a temp file and os.replace, so a
+# crash leaves either the old or the new contents, never a truncated mix.
+# WriteAheadLog appends one record per line, each prefixed with the CRC-32
+# of its payload, and on recovery keeps the records up to the first torn or
+# corrupt one and cuts the rest off.
+#
+# FSYNC_MODE decides when data is forced to disk:
+#   always   every append and every replaced file (and its directory)
+#   batched  replaced files at once, appends at most FSYNC_BATCH_MS later
+#            (one fsync covers every append in between)
+#   never    left to the OS; a power cut can lose recent writes
+
+FSYNC_MODES = ('always', 'batched', 'never')
+
+def fsync_mode():
+    mode = config.FSYNC_MODE
+    if mode not in FSYNC_MODES:
+        logger.warning(f"Invalid FSYNC_MODE '{mode}'. Using 'batched'.")
+        return 'batched'
+    return mode
+
+def _fsync_dir(directory):
+    # Makes a rename durable. Directories cannot be opened on Windows,
+    # where the rename is already durable once MoveFileEx returns.
+    if os.name == 'nt':
+        return
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_atomic(path, data):
+    """Replaces `path` with `data` (bytes) so that a crash leaves either
+    the old or the new file."""
+    mode = fsync_mode()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if mode != 'never':
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if mode == 'always':
+        _fsync_dir(os.path.dirname(path))
+
+def remove_stale_temp(path):
+    """Deletes the temp file an interrupted write_atomic() left behind.
+    Returns True if there was one."""
+    try:
+        os.remove(path + ".tmp")
+        return True
+    except FileNotFoundError:
+        return False
+
+def encode_record(record):
+    """One log line for `record`: the CRC-32 of its JSON, then the JSON."""
+    payload = codec.dumps_line(record)
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+def _decode(line):
+    """The record stored in `line`, or None if it is damaged."""
+    crc, _, payload = line.partition(b" ")
+    if len(crc) != 8 or int(crc, 16) != zlib.crc32(payload):
+        return None
+    return codec.loads(payload)
+
+
+class WriteAheadLog:
+    """Append-only file of JSON records with checksums and fsync batching."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def append(self, records):
+        """Appends `records` (dicts) and makes them durable per FSYNC_MODE."""
+        mode = fsync_mode()
+        data = b"".join(encode_record(r) for r in records)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            if mode == 'always':
+                f.flush()
+                os.fsync(f.fileno())
+        if mode == 'batched':
+            self._sync_later()
+
+    def replay(self):
+        """Returns the records in the log. A torn or corrupt record ends the
+        log: it and everything after it are cut off, since later records may
+        depend on it."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        records = []
+        offset = 0
+        while offset < len(data):
+            end = data.find(b"\n", offset)
+            if end < 0:
+                logger.warning(f"Discarding torn last record in {self.path}")
+                break
+            try:
+                record = _decode(data[offset:end])
+            except ValueError:
+                record = None
+            if record is None:
+                logger.warning(f"Discarding corrupt record at byte {offset} of {self.path} and {len(data) - end - 1} bytes after it")
+                break
+            records.append(record)
+            offset = end + 1
+        if offset < len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+        return records
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def truncate(self, offset):
+        """Keeps only the records appended after `offset` (None drops all)."""
+        if not os.path.exists(self.path):
+            return
+        tail = b""
+        if offset is not None:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                tail = f.read()
+        if not tail:
+            os.remove(self.path)
+            return
+        write_atomic(self.path, tail)
+
+    def sync(self):
+        """Forces appended records to disk now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _sync_later(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(config.FSYNC_BATCH_MS / 1000, self._batch_sync)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _batch_sync(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.sync()
+        except Exception as e:
+            logger.exception(f"Error syncing {self.path}: {e}")